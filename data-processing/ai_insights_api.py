@@ -1,21 +1,144 @@
 import os
 import json
-from openai import OpenAI
+import time
+import copy
+import hashlib
+import inspect
+import itertools
+import functools
+import threading
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
-from supabase import create_client, Client
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
+from resilience import ResilientCaller, CircuitBreaker, CircuitOpenError, SingleFlight
+from rate_limiter import rate_limiter_from_env, estimate_tokens
+from quantile_sketch import TeamBaselines
+from instrumentation import REGISTRY
+
+LLM_SECONDS = REGISTRY.histogram('llm_call_seconds', 'Latency of LLM completions per provider')
+LLM_REQUESTS = REGISTRY.counter('llm_requests_total', 'LLM completions by outcome')
+LLM_TOKENS = REGISTRY.counter('llm_tokens_total', 'Tokens used by LLM completions')
+
+# openai and supabase take most of a second to import, so they are only
+# loaded when a client is first needed (see the lazy properties below)
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from supabase import Client
+
+def call_fingerprint(arguments: Dict[str, Any]) -> str:
+    """Stable digest of a generation's inputs (metrics, custom request, store flag)"""
+    encoded = json.dumps(arguments, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+def coalesced(generation_type: str):
+    """Share one in-flight generation among concurrent calls for the same user, type and inputs
+    
+    Joined callers get a copy of the leader's result, so neither the LLM call
+    nor the ai_questions / ai_insights insert is repeated.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+        
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            del arguments['self']
+            user_id = arguments.pop('user_id')
+            key = (user_id, generation_type, call_fingerprint(arguments))
+            result, shared = self.flights.do(key, method, self, *args, **kwargs)
+            return copy.deepcopy(result) if shared else result
+        return wrapper
+    return decorator
 
 class SlackAnalyticsAI:
+    # Follow-up priority of each question type (5 = most urgent)
+    PRIORITIES = {
+        'silent_quitting': 5,
+        'underperforming': 4,
+        'custom': 3,
+        'overperforming': 2,
+        'normal': 1
+    }
+    
+    # Keys every insights object must contain
+    INSIGHT_KEYS = ('assessment', 'strengths', 'concerns', 'factors', 'recommendations', 'risk_level', 'confidence_score')
+    
+    # Rough token costs used to size packed prompts
+    PACKED_OVERHEAD_TOKENS = 200
+    PACKED_INPUT_TOKENS = 45
+    PACKED_OUTPUT_TOKENS = 220
+    MAX_COMPLETION_TOKENS = 4096
+    
+    # Percentile cut-offs used when team baselines are available
+    LOW_PARTICIPATION_PERCENTILE = 0.2
+    LOW_VOLUME_PERCENTILE = 0.1
+    HIGH_PERCENTILE = 0.8
+    INACTIVE_PERCENTILE = 0.9
+    MIN_INACTIVE_DAYS = 3
+    
     def __init__(self):
-        # Initialize OpenAI client
-        self.openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        # Network clients are created on first use so short-lived agent
+        # runtimes can start working before paying for them
+        self._openai_client = None
+        self._supabase = None
+        self._client_lock = threading.Lock()
+        
+        # Per-team metric distributions; when set, insight types are percentile-relative
+        self.baselines: Optional[TeamBaselines] = None
         
-        # Initialize Supabase
-        supabase_url = "https://hnymxzaugffegrpqsppu.supabase.co"
-        supabase_key = os.getenv('SUPABASE_SERVICE_KEY')
-        self.supabase: Client = create_client(supabase_url, supabase_key)
+        # Deadline, circuit breaker and optional hedging around every LLM call
+        hedge_after = os.getenv('LLM_HEDGE_AFTER_SECONDS')
+        self.llm = ResilientCaller(
+            timeout=float(os.getenv('LLM_TIMEOUT_SECONDS', '20')),
+            hedge_after=float(hedge_after) if hedge_after else None,
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv('LLM_BREAKER_FAILURES', '5')),
+                reset_timeout=float(os.getenv('LLM_BREAKER_RESET_SECONDS', '30'))
+            )
+        )
+        
+        # Concurrent identical generate_* calls share one completion and one insert
+        self.flights = SingleFlight()
+        
+        # Host-wide request/token pacing under the OpenAI limits (OPENAI_RPM / OPENAI_TPM)
+        self.rate_limiter = rate_limiter_from_env()
+    
+    @property
+    def openai_client(self) -> 'OpenAI':
+        """OpenAI client, created on first use"""
+        if self._openai_client is None:
+            with self._client_lock:
+                if self._openai_client is None:
+                    from openai import OpenAI
+                    self._openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        return self._openai_client
+    
+    @openai_client.setter
+    def openai_client(self, client: 'OpenAI'):
+        self._openai_client = client
+    
+    @property
+    def supabase(self) -> 'Client':
+        """Supabase client (or the local repository named by PEPITO_STORAGE), created on first use"""
+        if self._supabase is None:
+            with self._client_lock:
+                if self._supabase is None:
+                    from repository import repository_from_env
+                    self._supabase = repository_from_env()
+                if self._supabase is None:
+                    from supabase import create_client
+                    supabase_url = "https://hnymxzaugffegrpqsppu.supabase.co"
+                    supabase_key = os.getenv('SUPABASE_SERVICE_KEY')
+                    self._supabase = create_client(supabase_url, supabase_key)
+        return self._supabase
     
-    def generate_questions_for_underperforming(self, user_id: str, user_metrics: Dict) -> List[str]:
+    @supabase.setter
+    def supabase(self, client: 'Client'):
+        self._supabase = client
+    
+    @coalesced('underperforming')
+    def generate_questions_for_underperforming(self, user_id: str, user_metrics: Dict, store: bool = True, fallback: bool = True) -> List[str]:
         """Generate questions for underperforming team members"""
         prompt = f"""
         You are an HR expert helping managers have constructive conversations with underperforming team members.
@@ -38,33 +161,24 @@ class SlackAnalyticsAI:
         """
         
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=800
-            )
-            
-            questions = json.loads(response.choices[0].message.content)
+            questions = json.loads(self._complete(prompt, max_tokens=800))
             
             # Store in database
-            for question in questions:
-                self.supabase.table('ai_questions').insert({
-                    'user_id': user_id,
-                    'question_type': 'underperforming',
-                    'question': question,
-                    'context': f"Low engagement: {user_metrics.get('participation_rate', 0):.1%} participation",
-                    'priority': 4,
-                    'metadata': user_metrics
-                }).execute()
+            if store:
+                self.supabase.table('ai_questions').insert(
+                    self.question_records(user_id, 'underperforming', questions, user_metrics)
+                ).execute()
             
             return questions
             
         except Exception as e:
             print(f"Error generating underperforming questions: {e}")
+            if not fallback:
+                raise
             return self._fallback_underperforming_questions()
     
-    def generate_questions_for_overperforming(self, user_id: str, user_metrics: Dict) -> List[str]:
+    @coalesced('overperforming')
+    def generate_questions_for_overperforming(self, user_id: str, user_metrics: Dict, store: bool = True, fallback: bool = True) -> List[str]:
         """Generate questions for high-performing team members"""
         prompt = f"""
         You are an HR expert helping managers engage with high-performing team members.
@@ -87,33 +201,24 @@ class SlackAnalyticsAI:
         """
         
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=800
-            )
-            
-            questions = json.loads(response.choices[0].message.content)
+            questions = json.loads(self._complete(prompt, max_tokens=800))
             
             # Store in database
-            for question in questions:
-                self.supabase.table('ai_questions').insert({
-                    'user_id': user_id,
-                    'question_type': 'overperforming',
-                    'question': question,
-                    'context': f"High performance: {user_metrics.get('participation_rate', 0):.1%} participation",
-                    'priority': 2,
-                    'metadata': user_metrics
-                }).execute()
+            if store:
+                self.supabase.table('ai_questions').insert(
+                    self.question_records(user_id, 'overperforming', questions, user_metrics)
+                ).execute()
             
             return questions
             
         except Exception as e:
             print(f"Error generating overperforming questions: {e}")
+            if not fallback:
+                raise
             return self._fallback_overperforming_questions()
     
-    def generate_questions_for_silent_quitting(self, user_id: str, user_metrics: Dict) -> List[str]:
+    @coalesced('silent_quitting')
+    def generate_questions_for_silent_quitting(self, user_id: str, user_metrics: Dict, store: bool = True, fallback: bool = True) -> List[str]:
         """Generate questions for potential silent quitting situations"""
         prompt = f"""
         You are an HR expert helping managers address potential disengagement.
@@ -136,33 +241,24 @@ class SlackAnalyticsAI:
         """
         
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=800
-            )
-            
-            questions = json.loads(response.choices[0].message.content)
+            questions = json.loads(self._complete(prompt, max_tokens=800))
             
             # Store in database
-            for question in questions:
-                self.supabase.table('ai_questions').insert({
-                    'user_id': user_id,
-                    'question_type': 'silent_quitting',
-                    'question': question,
-                    'context': f"Potential disengagement detected",
-                    'priority': 5,
-                    'metadata': user_metrics
-                }).execute()
+            if store:
+                self.supabase.table('ai_questions').insert(
+                    self.question_records(user_id, 'silent_quitting', questions, user_metrics)
+                ).execute()
             
             return questions
             
         except Exception as e:
             print(f"Error generating silent quitting questions: {e}")
+            if not fallback:
+                raise
             return self._fallback_silent_quitting_questions()
     
-    def generate_custom_questions(self, user_id: str, custom_request: str, user_metrics: Dict) -> List[str]:
+    @coalesced('custom')
+    def generate_custom_questions(self, user_id: str, custom_request: str, user_metrics: Dict, store: bool = True) -> List[str]:
         """Generate custom questions based on manager's specific request"""
         prompt = f"""
         You are an HR expert helping a manager with a specific situation.
@@ -181,25 +277,13 @@ class SlackAnalyticsAI:
         """
         
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=800
-            )
-            
-            questions = json.loads(response.choices[0].message.content)
+            questions = json.loads(self._complete(prompt, max_tokens=800))
             
             # Store in database
-            for question in questions:
-                self.supabase.table('ai_questions').insert({
-                    'user_id': user_id,
-                    'question_type': 'custom',
-                    'question': question,
-                    'context': custom_request,
-                    'priority': 3,
-                    'metadata': {**user_metrics, 'custom_request': custom_request}
-                }).execute()
+            if store:
+                self.supabase.table('ai_questions').insert(
+                    self.question_records(user_id, 'custom', questions, user_metrics, custom_request)
+                ).execute()
             
             return questions
             
@@ -207,7 +291,8 @@ class SlackAnalyticsAI:
             print(f"Error generating custom questions: {e}")
             return [f"Based on your request about '{custom_request}', what specific support or changes would be most helpful for this team member?"]
     
-    def generate_insights(self, user_id: str, user_metrics: Dict) -> Dict[str, Any]:
+    @coalesced('insights')
+    def generate_insights(self, user_id: str, user_metrics: Dict, store: bool = True, fallback: bool = True) -> Dict[str, Any]:
         """Generate AI-powered insights about a team member"""
         prompt = f"""
         You are an HR analytics expert providing insights about team member performance.
@@ -230,34 +315,231 @@ class SlackAnalyticsAI:
         """
         
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=1000
-            )
-            
-            insights = json.loads(response.choices[0].message.content)
+            insights = json.loads(self._complete(prompt, max_tokens=1000))
             
             # Store in database
-            self.supabase.table('ai_insights').insert({
-                'user_id': user_id,
-                'insight_type': self._determine_insight_type(user_metrics),
-                'title': insights.get('assessment', 'Performance Analysis'),
-                'description': json.dumps(insights),
-                'confidence_score': insights.get('confidence_score', 0.8),
-                'suggested_actions': insights.get('recommendations', []),
-                'metadata': user_metrics
-            }).execute()
+            if store:
+                self.supabase.table('ai_insights').insert(self.insight_record(user_id, user_metrics, insights)).execute()
             
             return insights
             
         except Exception as e:
             print(f"Error generating insights: {e}")
+            if not fallback:
+                raise
             return self._fallback_insights(user_metrics)
     
+    def generate_insights_packed(self, users_metrics: Dict[str, Dict], token_budget: int = 6000) -> Dict[str, Dict[str, Any]]:
+        """Generate insights for many users, packing several users into each completion
+        
+        Users whose entry is missing or invalid in a packed response are retried
+        individually through generate_insights.
+        """
+        user_ids = list(users_metrics)
+        batch_size = self._packed_batch_size(token_budget)
+        results = {}
+        retried = []
+        requests = 0
+        
+        for i in range(0, len(user_ids), batch_size):
+            batch = user_ids[i:i + batch_size]
+            blocks = "\n".join(self._metrics_block(user_id, users_metrics[user_id]) for user_id in batch)
+            prompt = f"""
+        You are an HR analytics expert providing insights about team member performance.
+        
+        Slack engagement data for {len(batch)} team members:
+{blocks}
+        
+        For each team member provide a comprehensive analysis including:
+        1. Overall performance assessment
+        2. Key strengths and areas of concern
+        3. Potential underlying factors
+        4. Recommended actions for the manager
+        5. Risk level (low/medium/high) for retention
+        
+        Return a single JSON object keyed by user_id. Each value must be a JSON object with keys:
+        {', '.join(self.INSIGHT_KEYS)}
+        """
+            
+            packed = {}
+            try:
+                requests += 1
+                packed = json.loads(self._complete(prompt, max_tokens=self.PACKED_OUTPUT_TOKENS * len(batch)))
+                if not isinstance(packed, dict):
+                    packed = {}
+            except Exception as e:
+                print(f"Error generating packed insights: {e}")
+            
+            records = []
+            for user_id in batch:
+                insights = packed.get(user_id)
+                if self._valid_insights(insights):
+                    results[user_id] = insights
+                    records.append(self.insight_record(user_id, users_metrics[user_id], insights))
+                else:
+                    retried.append(user_id)
+            
+            # Store the whole batch in one round trip
+            if records:
+                try:
+                    self.supabase.table('ai_insights').insert(records).execute()
+                except Exception as e:
+                    print(f"Error storing packed insights: {e}")
+        
+        for user_id in retried:
+            requests += 1
+            results[user_id] = self.generate_insights(user_id, users_metrics[user_id])
+        
+        print(f"✓ Generated insights for {len(user_ids)} users in {requests} requests "
+              f"({len(retried)} retried individually)")
+        return results
+    
+    def _metrics_block(self, user_id: str, user_metrics: Dict) -> str:
+        """Compact per-user metrics block used in packed prompts"""
+        return (
+            f"        - user_id {user_id}: "
+            f"messages_30d={user_metrics.get('messages_sent', 0)}, "
+            f"participation={user_metrics.get('participation_rate', 0):.1%}, "
+            f"response_time={user_metrics.get('avg_response_time', 0):.1f}h, "
+            f"collaboration={user_metrics.get('collaboration_score', 0):.1f}, "
+            f"trend={user_metrics.get('engagement_trend', 'stable')}"
+        )
+    
+    def _packed_batch_size(self, token_budget: int) -> int:
+        """Users per packed request that fit the token budget and the completion limit"""
+        per_user = self.PACKED_INPUT_TOKENS + self.PACKED_OUTPUT_TOKENS
+        by_budget = (token_budget - self.PACKED_OVERHEAD_TOKENS) // per_user
+        by_completion = self.MAX_COMPLETION_TOKENS // self.PACKED_OUTPUT_TOKENS
+        return max(1, min(by_budget, by_completion))
+    
+    def _valid_insights(self, insights: Any) -> bool:
+        """Check that an insights object has the schema generate_insights returns"""
+        if not isinstance(insights, dict) or any(key not in insights for key in self.INSIGHT_KEYS):
+            return False
+        if insights['risk_level'] not in ('low', 'medium', 'high'):
+            return False
+        if not all(isinstance(insights[key], list) for key in ('strengths', 'concerns', 'factors', 'recommendations')):
+            return False
+        score = insights['confidence_score']
+        return isinstance(score, (int, float)) and 0 <= score <= 1
+    
+    def question_records(self, user_id: str, question_type: str, questions: List[str], user_metrics: Dict,
+                         custom_request: str = None) -> List[Dict[str, Any]]:
+        """Rows stored in ai_questions for a set of generated questions"""
+        participation = user_metrics.get('participation_rate', 0)
+        metadata = user_metrics
+        if question_type == 'underperforming':
+            context = f"Low engagement: {participation:.1%} participation"
+        elif question_type == 'overperforming':
+            context = f"High performance: {participation:.1%} participation"
+        elif question_type == 'silent_quitting':
+            context = "Potential disengagement detected"
+        else:
+            context = custom_request
+            metadata = {**user_metrics, 'custom_request': custom_request}
+        
+        return [{
+            'user_id': user_id,
+            'question_type': question_type,
+            'question': question,
+            'context': context,
+            'priority': self.PRIORITIES[question_type],
+            'metadata': metadata
+        } for question in questions]
+    
+    def insight_record(self, user_id: str, user_metrics: Dict, insights: Dict[str, Any]) -> Dict[str, Any]:
+        """Row stored in ai_insights for a generated insight"""
+        return {
+            'user_id': user_id,
+            'insight_type': self._determine_insight_type(user_metrics),
+            'title': insights.get('assessment', 'Performance Analysis'),
+            'description': json.dumps(insights),
+            'confidence_score': insights.get('confidence_score', 0.8),
+            'suggested_actions': insights.get('recommendations', []),
+            'metadata': user_metrics
+        }
+    
+    def _complete(self, prompt: str, max_tokens: int) -> str:
+        """Run a single chat completion and return the message content
+        
+        Raises CircuitOpenError right away while the provider is unhealthy and
+        DeadlineExceeded when the call runs past its deadline, so callers fall
+        through to their _fallback_* answers without waiting. With a rate
+        limiter configured, the call first waits for its share of the
+        request and token budget, and every hedged duplicate is charged as
+        another request. Each attempt settles its own reservation when it
+        finishes, even after the call has returned or timed out: against the
+        reported usage on success, and in full when it fails.
+        """
+        if self.llm.breaker.reject_if_open():
+            raise CircuitOpenError("LLM provider circuit is open")
+        
+        limiter = self.rate_limiter
+        estimated_tokens = estimate_tokens(prompt, max_tokens)
+        if limiter is not None:
+            limiter.acquire(estimated_tokens)
+        
+        attempts = itertools.count()
+        
+        def attempt(**kwargs):
+            if limiter is None:
+                return self.openai_client.chat.completions.create(**kwargs)
+            # Hedges exist to cut latency, so they are charged without waiting
+            if next(attempts):
+                limiter.reserve(estimated_tokens)
+            try:
+                response = self.openai_client.chat.completions.create(**kwargs)
+            except Exception:
+                # The request went out but used no completion
+                limiter.refund(estimated_tokens)
+                raise
+            usage = getattr(response, 'usage', None)
+            if usage is not None:
+                # Negative when the estimate was short: the overage is charged
+                limiter.refund(estimated_tokens - usage.total_tokens)
+            return response
+        
+        started = time.perf_counter()
+        try:
+            response = self.llm.call(
+                attempt,
+                model="gpt-3.5-turbo",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=max_tokens,
+                timeout=self.llm.timeout
+            )
+        except Exception as e:
+            LLM_REQUESTS.inc(1, {'provider': 'openai', 'outcome': type(e).__name__})
+            if limiter is not None and isinstance(e, CircuitOpenError):
+                # Rejected by the breaker: no attempt went out to settle the reservation
+                limiter.refund(estimated_tokens, 1.0)
+            raise
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - started, {'provider': 'openai'})
+        
+        LLM_REQUESTS.inc(1, {'provider': 'openai', 'outcome': 'ok'})
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            LLM_TOKENS.inc(usage.prompt_tokens, {'provider': 'openai', 'kind': 'prompt'})
+            LLM_TOKENS.inc(usage.completion_tokens, {'provider': 'openai', 'kind': 'completion'})
+        return response.choices[0].message.content
+    
+    def resilience_metrics(self) -> Dict[str, Any]:
+        """Timeout, hedge, circuit breaker and coalescing counters for the LLM calls"""
+        return {**self.llm.metrics(), 'coalesced': self.flights.coalesced}
+    
     def _determine_insight_type(self, metrics: Dict) -> str:
-        """Determine the type of insight based on metrics"""
+        """Determine the type of insight based on metrics
+        
+        With team baselines loaded, users are judged by where they rank within
+        their team (metrics['team']); otherwise by absolute cut-offs.
+        """
+        if self.baselines is not None:
+            insight_type = self._relative_insight_type(metrics)
+            if insight_type is not None:
+                return insight_type
+        
         participation = metrics.get('participation_rate', 0)
         messages = metrics.get('messages_sent', 0)
         
@@ -270,6 +552,24 @@ class SlackAnalyticsAI:
         else:
             return 'normal'
     
+    def _relative_insight_type(self, metrics: Dict) -> Optional[str]:
+        """Percentile-relative insight type, or None if the baselines cannot rank this user"""
+        team = metrics.get('team')
+        participation = self.baselines.percentile(team, 'participation_rate', metrics.get('participation_rate', 0))
+        messages = self.baselines.percentile(team, 'messages_sent', metrics.get('messages_sent', 0))
+        inactive = self.baselines.percentile(team, 'days_since_active', metrics.get('days_since_active', 0))
+        if participation is None or messages is None or inactive is None:
+            return None
+        
+        if participation < self.LOW_PARTICIPATION_PERCENTILE or messages < self.LOW_VOLUME_PERCENTILE:
+            return 'underperforming'
+        elif participation > self.HIGH_PERCENTILE and messages > self.HIGH_PERCENTILE:
+            return 'overperforming'
+        elif inactive > self.INACTIVE_PERCENTILE and metrics.get('days_since_active', 0) >= self.MIN_INACTIVE_DAYS:
+            return 'silent_quitting'
+        else:
+            return 'normal'
+    
     # Fallback questions in case AI fails
     def _fallback_underperforming_questions(self) -> List[str]:
         return [
@@ -335,6 +635,10 @@ class SlackAnalyticsAI:
 
 # Example usage and testing
 if __name__ == '__main__':
+    from profiling import Profiler
+    
+    # Set PEPITO_PROFILE=1 to write CPU/allocation reports for each step
+    profiler = Profiler()
     ai = SlackAnalyticsAI()
     
     # Example metrics for testing
@@ -350,9 +654,11 @@ if __name__ == '__main__':
     print("Testing AI Question Generation...")
     
     # Test underperforming questions
-    questions = ai.generate_questions_for_underperforming('TEST_USER_1', test_metrics)
+    with profiler.stage('questions'):
+        questions = ai.generate_questions_for_underperforming('TEST_USER_1', test_metrics)
     print(f"Generated {len(questions)} underperforming questions")
     
     # Test insights
-    insights = ai.generate_insights('TEST_USER_1', test_metrics)
+    with profiler.stage('insights'):
+        insights = ai.generate_insights('TEST_USER_1', test_metrics)
     print(f"Generated insights: {insights.get('assessment', 'No assessment')}") 
\ No newline at end of file
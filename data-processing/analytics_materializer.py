@@ -0,0 +1,260 @@
+import os
+import json
+import argparse
+import numpy as np
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+from message_store import MessageStore, NO_TS, MICROS, SECONDS_PER_DAY
+from thread_index import ThreadIndex
+from instrumentation import REGISTRY
+
+# Period name -> (length in days, epoch day the buckets are aligned to).
+# Day 4 (1970-01-05) is a Monday, so weeks run Monday to Sunday.
+PERIODS = {
+    'daily': (1, 0),
+    'weekly': (7, 4),
+    '30d': (30, 0),
+}
+
+ANALYTICS_METRICS = (
+    'messages_sent',
+    'active_days',
+    'participation_rate',
+    'channels_used',
+    'threaded_messages',
+    'collaboration_score',
+    'reactions_received',
+    'replies_received',
+    'avg_response_time',
+)
+
+ANALYTICS_ROWS = REGISTRY.counter('analytics_rows_total', "Analytics rows materialized per period")
+ANALYTICS_PERIODS = REGISTRY.counter('analytics_periods_total', "Periods recomputed per period type")
+
+
+def period_starts(days: np.ndarray, period: str) -> np.ndarray:
+    """First day of the period each day falls in"""
+    length, anchor = PERIODS[period]
+    return days - (days - anchor) % length
+
+
+def distinct(values: np.ndarray) -> np.ndarray:
+    """Sorted distinct values (a plain sort beats np.unique's hash path on large int arrays)"""
+    values = np.sort(values)
+    return values[np.concatenate(([True], values[1:] != values[:-1]))] if len(values) else values
+
+
+def group_sums(first: np.ndarray, second: np.ndarray, *values: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """Sum each value array over the distinct (first, second) pairs
+
+    Returns the pairs' first and second keys, sorted, followed by one
+    int64 total per value array.
+    """
+    first, second = np.asarray(first, dtype=np.int64), np.asarray(second, dtype=np.int64)
+    if len(first) == 0:
+        return (first, second) + tuple(np.zeros(0, dtype=np.int64) for _ in values)
+    low = int(second.min())
+    span = int(second.max()) - low + 1
+    cells = first * span + (second - low)
+    keys = distinct(cells)
+    slot = np.searchsorted(keys, cells)
+    totals = tuple(np.bincount(slot, weights=v, minlength=len(keys)).astype(np.int64) for v in values)
+    return (keys // span, keys % span + low) + totals
+
+
+def iso_day(day: int, end: bool = False) -> str:
+    seconds = int(day) * SECONDS_PER_DAY + (SECONDS_PER_DAY - 1 if end else 0)
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class AnalyticsMaterializer:
+    """Precomputes the analytics table: every metric for every user and period
+
+    Each period type is computed in one vectorized pass over the message
+    store. A signature per period (message count, timestamps, reactions and
+    replies) is kept in a JSON state file, so later runs only recompute the
+    periods new or re-exported data actually touched. Rows are upserted on
+    (user_id, metric_type, period_start, period_end); users with no messages
+    in a period get no rows for it (see UPSERT_TABLES in batch_writer).
+    """
+
+    def __init__(self, state_path: str = 'analytics_state.json', metrics: Optional[List[str]] = None,
+                 periods: Optional[List[str]] = None):
+        self.state_path = state_path
+        self.metrics = list(metrics or ANALYTICS_METRICS)
+        self.periods = list(periods or PERIODS)
+        self.state: Dict[str, Any] = {}
+        self._pending: Dict[str, Dict[str, List[int]]] = {}
+
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state = json.load(f)
+        # A different metric set invalidates every stored period
+        if self.state.get('metrics') != self.metrics:
+            self.state = {'metrics': self.metrics, 'signatures': {}}
+
+    def save(self):
+        """Record the periods produced by rows() as done; call once those rows are written"""
+        for period, signatures in self._pending.items():
+            self.state['signatures'].setdefault(period, {}).update(signatures)
+        self._pending = {}
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _signatures(self, store: MessageStore, starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Distinct period starts and a content signature for each"""
+        keys, inverse = np.unique(starts, return_inverse=True)
+        n = len(keys)
+        signature = np.stack([
+            np.bincount(inverse, minlength=n),
+            np.bincount(inverse, weights=store.columns['ts'] % (1 << 31), minlength=n),
+            np.bincount(inverse, weights=store.columns['reaction_count'], minlength=n),
+            np.bincount(inverse, weights=store.columns['reply_count'], minlength=n),
+        ], axis=1).astype(np.int64)
+        return keys, signature
+
+    def dirty_periods(self, store: MessageStore, period: str, full: bool = False) -> np.ndarray:
+        """Start days of the periods whose messages changed since the last save()
+
+        The first and last period can stick out of the days the store covers
+        (an export starting or ending mid-week). Such a period is only
+        recomputed when it was never stored or the store now holds at least
+        as many of its messages, so a narrower export never overwrites rows
+        computed from more complete data.
+        """
+        days = store.day_index().astype(np.int64)
+        keys, signature = self._signatures(store, period_starts(days, period))
+        length, _ = PERIODS[period]
+        partial = (keys < days.min()) | (keys + length - 1 > days.max())
+        stored = self.state['signatures'].get(period, {})
+        dirty = []
+        for i, key in enumerate(keys.tolist()):
+            previous = stored.get(str(key))
+            if not full and previous == signature[i].tolist():
+                continue
+            if partial[i] and previous is not None and previous[0] > signature[i][0]:
+                continue
+            dirty.append(i)
+        self._pending[period] = {str(keys[i]): signature[i].tolist() for i in dirty}
+        return keys[dirty]
+
+    def compute(self, store: MessageStore, threads: ThreadIndex, period: str,
+                starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """Metrics for every (user, period) with activity in the given periods
+
+        Returns (user codes, period start days, metric name -> values), one
+        entry per active (user, period) pair.
+        """
+        length, _ = PERIODS[period]
+        days = store.day_index().astype(np.int64)
+        message_starts = period_starts(days, period)
+        rows = np.flatnonzero(np.isin(message_starts, starts))
+
+        n_periods = max(len(starts), 1)
+        users = store.columns['user'][rows].astype(np.int64)
+        slots = np.searchsorted(starts, message_starts[rows])
+        pair_keys, pair = np.unique(users * n_periods + slots, return_inverse=True)
+        n = len(pair_keys)
+
+        messages_sent = np.bincount(pair, minlength=n)
+        active_days = np.bincount(distinct(pair * length + (days[rows] - message_starts[rows])) // length, minlength=n)
+        n_channels = max(len(store.channels), 1)
+        channels = store.columns['channel'][rows].astype(np.int64)
+        channels_used = np.bincount(distinct(pair * n_channels + channels) // n_channels, minlength=n)
+        threaded = np.bincount(pair, weights=store.columns['thread_ts'][rows] != NO_TS, minlength=n)
+
+        values = {
+            'messages_sent': messages_sent,
+            'active_days': active_days,
+            'participation_rate': active_days / length,
+            'channels_used': channels_used,
+            'threaded_messages': threaded,
+            # Same formula as compute_user_metrics and the CSV upload route
+            'collaboration_score': np.minimum(5.0, channels_used * 0.5 + threaded * 0.1),
+            'reactions_received': np.bincount(pair, weights=store.columns['reaction_count'][rows], minlength=n),
+            'replies_received': np.bincount(pair, weights=store.columns['reply_count'][rows], minlength=n),
+        }
+
+        # Response time is attributed to the period of the answer; NaN where the user answered nobody
+        answer_rows, root_rows = threads.answer_rows(store)
+        answered = np.isin(message_starts[answer_rows], starts)
+        answer_rows, root_rows = answer_rows[answered], root_rows[answered]
+        answer_keys = (store.columns['user'][answer_rows].astype(np.int64) * n_periods
+                       + np.searchsorted(starts, message_starts[answer_rows]))
+        answer_pair = np.searchsorted(pair_keys, answer_keys)
+        hours = (store.columns['ts'][answer_rows] - store.columns['ts'][root_rows]) / MICROS / 3600.0
+        totals = np.bincount(answer_pair, weights=hours, minlength=n)
+        counts = np.bincount(answer_pair, minlength=n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values['avg_response_time'] = np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+
+        return pair_keys // n_periods, starts[pair_keys % n_periods], {m: values[m] for m in self.metrics}
+
+    def rows(self, store: MessageStore, threads: ThreadIndex, full: bool = False,
+             batch_size: int = 5000) -> Iterator[List[Dict[str, Any]]]:
+        """Analytics rows for the dirty periods, in batches ready for bulk upsert"""
+        if len(store) == 0:
+            return
+        for period in self.periods:
+            starts = self.dirty_periods(store, period, full)
+            if len(starts) == 0:
+                continue
+            ANALYTICS_PERIODS.inc(len(starts), {'period': period})
+            user_codes, pair_starts, values = self.compute(store, threads, period, starts)
+
+            length, _ = PERIODS[period]
+            bounds = {int(s): (iso_day(s), iso_day(s + length - 1, end=True)) for s in starts.tolist()}
+            user_ids = [store.users[code] for code in user_codes.tolist()]
+            period_bounds = [bounds[s] for s in pair_starts.tolist()]
+
+            batch = []
+            for metric, metric_values in values.items():
+                for user_id, (start, end), value in zip(user_ids, period_bounds, metric_values.tolist()):
+                    if value != value:  # NaN: metric undefined for this user and period
+                        continue
+                    batch.append({'user_id': user_id, 'metric_type': metric, 'metric_value': float(value),
+                                  'period_start': start, 'period_end': end})
+                    if len(batch) >= batch_size:
+                        ANALYTICS_ROWS.inc(len(batch), {'period': period})
+                        yield batch
+                        batch = []
+            if batch:
+                ANALYTICS_ROWS.inc(len(batch), {'period': period})
+                yield batch
+
+    def materialize(self, store: MessageStore, threads: ThreadIndex, writer, full: bool = False) -> int:
+        """Upsert the dirty periods through a BatchWriter and save the state; returns rows written"""
+        written = 0
+        for batch in self.rows(store, threads, full, batch_size=writer.batch_size):
+            writer.add_many('analytics', batch)
+            written += writer.flush('analytics')
+        self.save()
+        return written
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from batch_writer import BatchWriter
+    from profiling import Profiler
+
+    parser = argparse.ArgumentParser(description="Materialize the analytics table from a saved message store")
+    parser.add_argument('store_dir', help="Directory holding the message store and thread index")
+    parser.add_argument('--state', default='analytics_state.json', help="Materializer state file")
+    parser.add_argument('--full', action='store_true', help="Recompute every period, not just the changed ones")
+    parser.add_argument('--batch-size', type=int, default=500, help="Rows per database write")
+    parser.add_argument('--profile', action='store_true', default=None, help="Write CPU/allocation profiles")
+    args = parser.parse_args()
+
+    load_dotenv('../.env')  # Load from parent directory
+
+    from ai_insights_api import SlackAnalyticsAI
+    client = SlackAnalyticsAI().supabase
+
+    store = MessageStore.load(args.store_dir)
+    threads = ThreadIndex.load(args.store_dir)
+    with Profiler(enabled=args.profile).stage('analytics'):
+        written = AnalyticsMaterializer(args.state).materialize(store, threads, BatchWriter(client, args.batch_size), args.full)
+    print(f"✓ Upserted {written} analytics rows")
@@ -0,0 +1,79 @@
+import time
+import threading
+from typing import List, Dict, Any, Optional
+
+from instrumentation import REGISTRY
+
+# Tables are flushed in foreign-key order so referenced rows always land first
+TABLE_ORDER = ('channels', 'users', 'messages', 'analytics', 'ai_questions', 'ai_insights')
+
+# Upserted tables and their conflict targets: dimension tables are re-sent
+# on every import, message IDs are derived from (channel, ts) so re-imports
+# overwrite, and re-materialized analytics periods replace their rows
+UPSERT_TABLES = {
+    'channels': 'id',
+    'users': 'id',
+    'messages': 'id',
+    'analytics': 'user_id,metric_type,period_start,period_end',
+}
+
+ROWS_WRITTEN = REGISTRY.counter('db_rows_written_total', 'Rows written per table')
+ROUND_TRIPS = REGISTRY.counter('db_round_trips_total', 'Write requests per table')
+WRITE_SECONDS = REGISTRY.histogram('db_write_seconds', 'Latency of one batched write')
+
+
+class BatchWriter:
+    """Buffers rows per table and writes them with one request per batch"""
+
+    def __init__(self, client, batch_size: int = 500):
+        self.client = client
+        self.batch_size = batch_size
+        self.buffers: Dict[str, List[Dict[str, Any]]] = {}
+        self.rows_written = 0
+        self.round_trips = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add(self, table: str, row: Dict[str, Any]) -> bool:
+        """Buffer one row; returns True when a batch is ready to flush"""
+        with self._lock:
+            buffer = self.buffers.setdefault(table, [])
+            buffer.append(row)
+            return len(buffer) >= self.batch_size
+
+    def add_many(self, table: str, rows: List[Dict[str, Any]]) -> bool:
+        with self._lock:
+            buffer = self.buffers.setdefault(table, [])
+            buffer.extend(rows)
+            return len(buffer) >= self.batch_size
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(rows) for rows in self.buffers.values())
+
+    def flush(self, table: Optional[str] = None) -> int:
+        """Write buffered rows (all tables, in dependency order, unless one is given)"""
+        tables = [table] if table else sorted(self.buffers, key=lambda t: TABLE_ORDER.index(t) if t in TABLE_ORDER else len(TABLE_ORDER))
+        written = 0
+        # Concurrent flushes would let a later table overtake the rows it references
+        with self._flush_lock:
+            for name in tables:
+                with self._lock:
+                    rows = self.buffers.pop(name, [])
+                for i in range(0, len(rows), self.batch_size):
+                    batch = rows[i:i + self.batch_size]
+                    started = time.perf_counter()
+                    query = self.client.table(name)
+                    if name in UPSERT_TABLES:
+                        query = query.upsert(batch, on_conflict=UPSERT_TABLES[name])
+                    else:
+                        query = query.insert(batch)
+                    query.execute()
+                    WRITE_SECONDS.observe(time.perf_counter() - started, {'table': name})
+                    ROUND_TRIPS.inc(1, {'table': name})
+                    ROWS_WRITTEN.inc(len(batch), {'table': name})
+                    written += len(batch)
+                    with self._lock:
+                        self.round_trips += 1
+                        self.rows_written += len(batch)
+        return written
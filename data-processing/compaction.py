@@ -0,0 +1,388 @@
+import os
+import time
+import shutil
+import argparse
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from message_store import MessageStore, Dictionary, NO_TS, MICROS, SECONDS_PER_DAY, HISTORY_FILE, format_ts
+from thread_index import ThreadIndex, group_threads
+from engagement_metrics import compute_user_metrics
+from analytics_materializer import group_sums, distinct, iso_day
+from snapshot import snapshot_arrays
+from slack_export import message_id
+from instrumentation import REGISTRY
+
+HISTORY_VERSION = 2
+
+# Raw messages newer than this are always kept, so every metrics window stays fully covered
+DEFAULT_KEEP_DAYS = 90
+
+ROLLUP_FIELDS = ('key', 'day', 'messages', 'reactions', 'replies')
+
+COMPACTED = REGISTRY.counter('compaction_messages_total', 'Raw messages folded into rollups and archived')
+
+
+def _encode_values(values: List[str]) -> np.ndarray:
+    # NUL-terminated, as in snapshot dictionaries, so empty ids survive
+    return np.frombuffer(''.join(f"{value}\0" for value in values).encode('utf-8'), dtype=np.uint8)
+
+
+def _decode_values(data: np.ndarray) -> List[str]:
+    return data.tobytes().decode('utf-8').split('\0')[:-1]
+
+
+def _padded(values: np.ndarray, n: int, fill) -> np.ndarray:
+    out = np.full(n, fill, dtype=values.dtype)
+    out[:len(values)] = values
+    return out
+
+
+def take_rows(store: MessageStore, rows: np.ndarray) -> MessageStore:
+    """Store holding only the given rows (in time order), sharing the dictionaries"""
+    columns = {name: np.asarray(values)[rows] for name, values in store.columns.items()}
+    starts, ends = store.text_offsets[:-1][rows], store.text_offsets[1:][rows]
+    view = memoryview(store.text_data)
+    text_data = b''.join([view[s:e] for s, e in zip(starts.tolist(), ends.tolist())])
+    text_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(ends - starts, out=text_offsets[1:])
+    return MessageStore(columns, text_offsets, text_data, store.users, store.channels, store.teams)
+
+
+def partner_pairs(store: MessageStore, threads: ThreadIndex) -> Tuple[np.ndarray, np.ndarray]:
+    """Distinct (user, partner) code pairs of users who shared a thread, both directions"""
+    n_users = max(len(store.users), 1)
+    sizes = np.diff(threads.participant_offsets)
+    pairs = []
+    for slot in np.flatnonzero(sizes > 1):
+        members = threads.participants[threads.participant_offsets[slot]:threads.participant_offsets[slot + 1]]
+        grid = members.astype(np.int64)[:, None] * n_users + members
+        pairs.append(grid[members[:, None] != members])
+    codes = distinct(np.concatenate(pairs)) if pairs else np.zeros(0, dtype=np.int64)
+    return codes // n_users, codes % n_users
+
+
+class FoldedHistory:
+    """Aggregates of the raw messages a compaction removed from a message store
+
+    Holds everything the metrics, rollups and thread graph need from those
+    messages: per-(user, day) and per-(channel, day) rollups, first-answer
+    latency totals, who-answers-whom counts, thread partner pairs, team
+    counts and each user's last message. Codes refer to the store's
+    dictionaries, which are only ever appended to. Saved as history.npz
+    next to the store and embedded in snapshots written from it.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.arrays = arrays
+
+    def __len__(self):
+        return int(self.arrays['messages'][0])
+
+    @property
+    def horizon(self) -> int:
+        """Every folded message is older than this timestamp (microseconds)"""
+        return int(self.arrays['horizon'][0])
+
+    @property
+    def users(self) -> List[str]:
+        return _decode_values(self.arrays['users'])
+
+    def dense(self, name: str, n: int, fill=0) -> np.ndarray:
+        """Per-user array padded to n users (users added after the compaction get `fill`)"""
+        return _padded(self.arrays[name], n, fill)
+
+    def team_counts(self, n_users: int, n_teams: int) -> np.ndarray:
+        """Folded messages per (user, team) as a flat users x teams array"""
+        counts = np.zeros(n_users * n_teams, dtype=np.int64)
+        counts[self.arrays['team_user'] * n_teams + self.arrays['team_team']] = self.arrays['team_count']
+        return counts
+
+    def rollup(self, kind: str) -> Tuple[np.ndarray, ...]:
+        """(key, day, messages, reactions, replies) of the 'user_day' or 'channel_day' rollup"""
+        return tuple(self.arrays[f"{kind}_{field}"] for field in ROLLUP_FIELDS)
+
+    def answers(self, store: MessageStore) -> Dict[Tuple[str, str], int]:
+        """Folded who_answers_whom counts keyed by (responder, author) ids"""
+        return {(store.users[int(r)], store.users[int(a)]): int(c) for r, a, c in
+                zip(self.arrays['answer_responder'], self.arrays['answer_author'], self.arrays['answer_pairs'])}
+
+    def check(self, store: MessageStore):
+        """Fail unless this history belongs to the store and none of its messages are back in it
+
+        The store's dictionaries must extend the ones the codes were folded
+        against, and it must hold exactly the raw messages older than the
+        horizon the compaction kept (those of threads still active after
+        it); any more means the store was rebuilt from the full export.
+        """
+        for kind, dictionary in (('users', store.users), ('channels', store.channels), ('teams', store.teams)):
+            folded = _decode_values(self.arrays[kind])
+            if dictionary.values[:len(folded)] != folded:
+                raise ValueError(f"Folded history does not match this store's {kind}; it belongs to another store")
+        before = int(np.count_nonzero(store.columns['ts'] < self.horizon))
+        if before != int(self.arrays['retained'][0]):
+            raise ValueError(f"Store holds {before} messages older than the folded history's horizon, "
+                             f"expected {int(self.arrays['retained'][0])}; its folded messages would count twice")
+
+    @classmethod
+    def fold(cls, store: MessageStore, horizon: int) -> 'FoldedHistory':
+        """Aggregate a store of messages that are all being compacted (complete threads only)"""
+        threads = ThreadIndex.build(store)
+        n_users = len(store.users)
+        users = store.columns['user'].astype(np.int64)
+        days = store.day_index()
+        ones = np.ones(len(store), dtype=np.int64)
+
+        last_ts = np.full(n_users, NO_TS, dtype=np.int64)
+        np.maximum.at(last_ts, users, store.columns['ts'])
+        answer_micros, answer_counts = threads.response_totals(store)
+        responders, authors, _ = threads.answers(store)
+        answer_responder, answer_author, answer_pairs = group_sums(responders, authors, np.ones(len(responders)))
+        team_user, team_team, team_count = group_sums(users, store.columns['team'], ones)
+        partner_a, partner_b = partner_pairs(store, threads)
+
+        arrays = {
+            'horizon': np.array([horizon], dtype=np.int64),
+            'messages': np.array([len(store)], dtype=np.int64),
+            'users': _encode_values(store.users.values),
+            'channels': _encode_values(store.channels.values),
+            'teams': _encode_values(store.teams.values),
+            'last_ts': last_ts,
+            'answer_micros': answer_micros.astype(np.float64),
+            'answer_counts': answer_counts.astype(np.int64),
+            'answer_responder': answer_responder, 'answer_author': answer_author, 'answer_pairs': answer_pairs,
+            'team_user': team_user, 'team_team': team_team, 'team_count': team_count,
+            'partner_a': partner_a, 'partner_b': partner_b,
+        }
+        for kind, column in (('user_day', 'user'), ('channel_day', 'channel')):
+            rollup = group_sums(store.columns[column], days, ones, store.columns['reaction_count'], store.columns['reply_count'])
+            arrays.update({f"{kind}_{field}": values for field, values in zip(ROLLUP_FIELDS, rollup)})
+        return cls(arrays)
+
+    def merge(self, other: Optional['FoldedHistory']) -> 'FoldedHistory':
+        """History covering both this and an earlier (or later) compaction of the same store"""
+        if other is None:
+            return self
+        a, b = self.arrays, other.arrays
+        newer = a if len(a['users']) >= len(b['users']) else b
+        n = len(newer['last_ts'])
+        arrays = {
+            'horizon': np.maximum(a['horizon'], b['horizon']),
+            'messages': a['messages'] + b['messages'],
+            'users': newer['users'], 'channels': newer['channels'], 'teams': newer['teams'],
+            'last_ts': np.maximum(_padded(a['last_ts'], n, NO_TS), _padded(b['last_ts'], n, NO_TS)),
+            'answer_micros': _padded(a['answer_micros'], n, 0) + _padded(b['answer_micros'], n, 0),
+            'answer_counts': _padded(a['answer_counts'], n, 0) + _padded(b['answer_counts'], n, 0),
+        }
+        for keys, total in ((('answer_responder', 'answer_author'), 'answer_pairs'),
+                            (('team_user', 'team_team'), 'team_count')):
+            merged = group_sums(*(np.concatenate([a[name], b[name]]) for name in keys + (total,)))
+            arrays.update(dict(zip(keys + (total,), merged)))
+        pairs = distinct(np.concatenate([a['partner_a'] * n + a['partner_b'], b['partner_a'] * n + b['partner_b']]))
+        arrays['partner_a'], arrays['partner_b'] = pairs // n, pairs % n
+        for kind in ('user_day', 'channel_day'):
+            merged = group_sums(*(np.concatenate([a[f"{kind}_{field}"], b[f"{kind}_{field}"]]) for field in ROLLUP_FIELDS))
+            arrays.update({f"{kind}_{field}": values for field, values in zip(ROLLUP_FIELDS, merged)})
+        return FoldedHistory(arrays)
+
+    def save(self, directory: str):
+        tmp_path = os.path.join(directory, f"{HISTORY_FILE}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=np.array([HISTORY_VERSION]), **self.arrays)
+        os.replace(tmp_path, os.path.join(directory, HISTORY_FILE))
+
+    @classmethod
+    def load(cls, directory: str) -> Optional['FoldedHistory']:
+        """History saved next to a compacted store, or None if the store was never compacted"""
+        path = os.path.join(directory, HISTORY_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        if int(arrays.pop('version')[0]) != HISTORY_VERSION:
+            raise ValueError(f"Unsupported folded history version in {path}")
+        return cls(arrays)
+
+
+def archive_messages(store: MessageStore, directory: str) -> str:
+    """Write compacted raw messages (columns, text and dictionaries) to a compressed cold file"""
+    os.makedirs(directory, exist_ok=True)
+    days = store.day_index()
+    name = f"messages-{iso_day(int(days[0]))[:10]}-{iso_day(int(days[-1]))[:10]}"
+    path = os.path.join(directory, f"{name}.npz")
+    # Late thread replies can make a later run cover the same days; never overwrite an archive
+    suffix = 1
+    while os.path.exists(path):
+        suffix += 1
+        path = os.path.join(directory, f"{name}-{suffix}.npz")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, text_offsets=store.text_offsets, text=np.frombuffer(store.text_data, dtype=np.uint8),
+                            users=_encode_values(store.users.values), channels=_encode_values(store.channels.values),
+                            teams=_encode_values(store.teams.values), **store.columns)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_archive(path: str) -> MessageStore:
+    """Read a cold file back as a MessageStore"""
+    with np.load(path) as data:
+        columns = {name: data[name] for name in data.files
+                   if name not in ('text_offsets', 'text', 'users', 'channels', 'teams')}
+        return MessageStore(columns, data['text_offsets'], data['text'].tobytes(), Dictionary(_decode_values(data['users'])),
+                            Dictionary(_decode_values(data['channels'])), Dictionary(_decode_values(data['teams'])))
+
+
+def fold_rows(store: MessageStore, horizon: int) -> np.ndarray:
+    """Rows older than the horizon, except those of threads still active after it"""
+    old = store.columns['ts'] < horizon
+    threaded = np.flatnonzero(store.columns['thread_ts'] != NO_TS)
+    _, keys, thread = group_threads(store.columns['channel'][threaded], store.columns['thread_ts'][threaded])
+    # A thread with any message past the horizon stays whole, root and early replies included
+    live = np.zeros(len(keys), dtype=bool)
+    live[thread[~old[threaded]]] = True
+    old[threaded[live[thread]]] = False
+    return np.flatnonzero(old)
+
+
+def compact(store: MessageStore, history: Optional[FoldedHistory], horizon: int
+            ) -> Tuple[MessageStore, ThreadIndex, FoldedHistory, MessageStore]:
+    """Split a store at the horizon: (live store, its threads, merged history, compacted rows)"""
+    folded_rows = fold_rows(store, horizon)
+    keep = np.ones(len(store), dtype=bool)
+    keep[folded_rows] = False
+    folded = take_rows(store, folded_rows)
+    live = take_rows(store, np.flatnonzero(keep))
+    merged = FoldedHistory.fold(folded, horizon).merge(history)
+    merged.arrays['retained'] = np.array([np.count_nonzero(live.columns['ts'] < merged.horizon)], dtype=np.int64)
+    return live, ThreadIndex.build(live), merged, folded
+
+
+def _graph(store: MessageStore, threads: ThreadIndex, history: Optional[FoldedHistory]):
+    """who_answers_whom counts and partner pairs, including the folded part"""
+    answers = threads.who_answers_whom(store)
+    a, b = partner_pairs(store, threads)
+    n = len(store.users)
+    pairs = a * n + b
+    if history is not None:
+        for key, count in history.answers(store).items():
+            answers[key] = answers.get(key, 0) + count
+        pairs = np.concatenate([pairs, history.arrays['partner_a'] * n + history.arrays['partner_b']])
+    return answers, distinct(pairs)
+
+
+def verify_compaction(store: MessageStore, threads: ThreadIndex, history: Optional[FoldedHistory],
+                      live: MessageStore, live_threads: ThreadIndex, merged: FoldedHistory,
+                      window_days: int) -> List[str]:
+    """Differences between the metrics of the store before and after compaction (empty when identical)"""
+    problems = []
+    before = compute_user_metrics(store, threads, window_days, history=history)
+    after = compute_user_metrics(live, live_threads, window_days, history=merged)
+    changed = [user_id for user_id in before if before[user_id] != after.get(user_id)]
+    if changed or set(after) != set(before):
+        problems.append(f"user metrics differ for {len(changed) or len(set(after) ^ set(before))} users, e.g. {changed[:3]}")
+
+    arrays_before = snapshot_arrays(store, threads, history)
+    arrays_after = snapshot_arrays(live, live_threads, merged)
+    for name in arrays_before:
+        if name.startswith('rollup.') and not np.array_equal(arrays_before[name], arrays_after[name]):
+            problems.append(f"{name} differs")
+
+    answers_before, pairs_before = _graph(store, threads, history)
+    answers_after, pairs_after = _graph(live, live_threads, merged)
+    if answers_before != answers_after:
+        problems.append("who-answers-whom counts differ")
+    if not np.array_equal(pairs_before, pairs_after):
+        problems.append("thread partners differ")
+    return problems
+
+
+def prune_messages(client, folded: MessageStore, batch_size: int = 500) -> int:
+    """Delete compacted rows from the messages table by their (channel, ts) IDs"""
+    ids = [message_id(folded.channels[int(c)], format_ts(int(t)))
+           for c, t in zip(folded.columns['channel'], folded.columns['ts'])]
+    for i in range(0, len(ids), batch_size):
+        client.table('messages').delete().in_('id', ids[i:i + batch_size]).execute()
+    return len(ids)
+
+
+def replace_store(directory: str, live: MessageStore, threads: ThreadIndex, history: FoldedHistory):
+    """Swap in the compacted store directory; other entries in it (e.g. the cold archive) are moved over"""
+    staging, previous = f"{directory}.compacting", f"{directory}.previous"
+    shutil.rmtree(staging, ignore_errors=True)
+    live.save(staging)
+    threads.save(staging)
+    history.save(staging)
+    for name in os.listdir(directory):
+        if not os.path.exists(os.path.join(staging, name)):
+            os.rename(os.path.join(directory, name), os.path.join(staging, name))
+    shutil.rmtree(previous, ignore_errors=True)
+    os.rename(directory, previous)
+    os.rename(staging, directory)
+    shutil.rmtree(previous)
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from profiling import Profiler
+
+    parser = argparse.ArgumentParser(description="Fold old raw messages of a message store into rollups and archive them")
+    parser.add_argument('store_dir', help="Message store directory written by the pipeline (--store-dir)")
+    parser.add_argument('--keep-days', type=int, default=DEFAULT_KEEP_DAYS, help="Days of raw messages to keep")
+    parser.add_argument('--window-days', type=int, default=30, help="Metrics window that must stay fully raw")
+    parser.add_argument('--cold-dir', help="Archive compacted messages here (default: <store_dir>/cold)")
+    parser.add_argument('--drop-text', action='store_true', help="Discard compacted messages instead of archiving them")
+    parser.add_argument('--prune-table', action='store_true', help="Also delete compacted rows from the messages table")
+    parser.add_argument('--snapshot', help="Rewrite this workspace snapshot from the compacted store")
+    parser.add_argument('--dry-run', action='store_true', help="Fold and verify, but change nothing")
+    parser.add_argument('--profile', action='store_true', default=None, help="Write CPU/allocation profiles")
+    args = parser.parse_args()
+
+    if args.keep_days < args.window_days:
+        parser.error("--keep-days must cover the metrics window (--window-days)")
+
+    load_dotenv('../.env')  # Load from parent directory
+
+    started = time.perf_counter()
+    with Profiler(enabled=args.profile).stage('compaction'):
+        store = MessageStore.load(args.store_dir, mmap=False)
+        threads = ThreadIndex.load(args.store_dir)
+        history = FoldedHistory.load(args.store_dir)
+        if history is not None:
+            history.check(store)
+        if len(store) == 0:
+            print("✓ Store is empty, nothing to compact")
+            raise SystemExit(0)
+
+        # Horizon on a UTC day boundary, so whole days move into the rollups; the window
+        # ends mid-day, so its start falls on the day keep_days back, which stays raw
+        day_micros = SECONDS_PER_DAY * MICROS
+        horizon = (int(store.columns['ts'][-1]) // day_micros - args.keep_days) * day_micros
+        live, live_threads, merged, folded = compact(store, history, horizon)
+        if len(folded) == 0:
+            print(f"✓ No messages before {iso_day(horizon // day_micros)[:10]} to compact")
+            raise SystemExit(0)
+
+        problems = verify_compaction(store, threads, history, live, live_threads, merged, args.window_days)
+        if problems:
+            for problem in problems:
+                print(f"✗ {problem}")
+            raise SystemExit("✗ Metrics changed under compaction; store left untouched")
+        print(f"✓ Verified identical metrics, rollups and thread graph for {len(store.users)} users")
+
+        if not args.dry_run:
+            if not args.drop_text:
+                path = archive_messages(folded, args.cold_dir or os.path.join(args.store_dir, 'cold'))
+                print(f"✓ Archived {len(folded)} raw messages to {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+            replace_store(args.store_dir, live, live_threads, merged)
+            COMPACTED.inc(len(folded))
+            if args.snapshot:
+                from snapshot import write_snapshot
+                write_snapshot(args.snapshot, live, live_threads, {'source': args.store_dir}, merged)
+                print(f"✓ Rewrote snapshot {args.snapshot}")
+            if args.prune_table:
+                from ai_insights_api import SlackAnalyticsAI
+                print(f"✓ Deleted {prune_messages(SlackAnalyticsAI().supabase, folded)} rows from the messages table")
+
+    print(f"✓ Folded {len(folded)} of {len(store)} messages before {iso_day(horizon // day_micros)[:10]}: "
+          f"{len(live)} raw messages kept, {len(merged)} folded in total ({time.perf_counter() - started:.1f}s)")
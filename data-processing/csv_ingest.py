@@ -0,0 +1,423 @@
+import io
+import os
+import csv
+import json
+import mmap
+import time
+import shutil
+import argparse
+import itertools
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator, BinaryIO, Callable
+
+import numpy as np
+
+from message_store import MessageStore, Dictionary, COLUMNS, parse_ts, write_manifest, NO_TS
+from slack_export import message_record
+from batch_writer import BatchWriter
+from instrumentation import REGISTRY
+
+# Columns of an uploaded Slack CSV (matched by header name, in any order; all but user and ts optional)
+CSV_COLUMNS = ('user', 'text', 'ts', 'channel', 'thread_ts', 'reply_count', 'reactions')
+
+# Channel of rows without one, as in the upload route
+DEFAULT_CHANNEL = 'general'
+
+# Store columns parsed from the CSV (team and latest_reply are filled in)
+PARSED_COLUMNS = ('ts', 'user', 'channel', 'thread_ts', 'reply_count', 'reaction_count')
+
+CHUNK_SIZE = 64 * 1024 * 1024
+BLOCK_SIZE = 16 * 1024 * 1024
+# Rows copied at a time while assembling the store's files
+ASSEMBLE_ROWS = 1 << 20
+
+CSV_BYTES = REGISTRY.counter('csv_bytes_ingested_total', 'Bytes of uploaded CSV parsed')
+CSV_ROWS = REGISTRY.counter('csv_rows_total', 'Uploaded CSV rows by outcome')
+CSV_INVALID_UTF8 = REGISTRY.counter('csv_invalid_utf8_rows_total', 'Ingested CSV rows whose invalid UTF-8 bytes were replaced')
+
+
+def read_header(path: str) -> Tuple[List[str], int]:
+    """Column names of the header row and the offset of the first data row"""
+    with open(path, 'rb') as f:
+        line = f.readline()
+        start = f.tell()
+    header = next(csv.reader([line.decode('utf-8-sig', errors='replace')]), [])
+    return [name.strip().lower() for name in header], start
+
+
+def row_boundaries(path: str, start: int, chunk_size: int = CHUNK_SIZE, block_size: int = BLOCK_SIZE) -> List[int]:
+    """Offsets cutting [start, EOF) into chunks of about chunk_size bytes, each starting on a row
+
+    A newline only ends a row outside quotes, and whether a position is
+    inside quotes is the parity of the quote characters before it (an
+    escaped "" adds two). One sequential pass counts quotes block by block,
+    and each cut is placed on the first newline past its target where the
+    running parity is even, so quoted multi-line texts are never split.
+    """
+    size = os.path.getsize(path)
+    bounds = [start]
+    target = start + chunk_size
+    quoted = False
+    pos = start
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while target < size:
+            block = f.read(block_size)
+            if not block:
+                break
+            end = pos + len(block)
+            cursor = 0  # the parity is known up to block[cursor]
+            while target < end:
+                i = max(target - pos, cursor)
+                quoted ^= block.count(b'"', cursor, i) & 1
+                while True:
+                    newline = block.find(b'\n', i)
+                    if newline < 0:
+                        break
+                    quoted ^= block.count(b'"', i, newline) & 1
+                    i = newline + 1
+                    if not quoted:
+                        break
+                cursor = i
+                if newline < 0:
+                    break
+                bounds.append(pos + i)
+                target = pos + i + chunk_size
+            quoted ^= block.count(b'"', cursor) & 1
+            pos = end
+    bounds.append(size)
+    return [b for i, b in enumerate(bounds) if i == 0 or b > bounds[i - 1]]
+
+
+def _reactions(value: str) -> Tuple[int, Optional[List[Any]]]:
+    """Reaction count and the raw reaction list from a CSV cell holding a count or a JSON array"""
+    value = value.strip()
+    if not value:
+        return 0, None
+    if value.isdigit():
+        return int(value), None
+    try:
+        reactions = json.loads(value)
+    except ValueError:
+        return 0, None
+    if not isinstance(reactions, list):
+        return 0, None
+    return sum(r.get('count', 1) for r in reactions if isinstance(r, dict)), reactions
+
+
+def _optional(parse: Callable[[str], Any], value: str, default: Any) -> Any:
+    """Parse an optional cell, falling back to `default` when it is empty or malformed"""
+    if not value:
+        return default
+    try:
+        return parse(value)
+    except ValueError:
+        return default
+
+
+def parse_chunk(path: str, start: int, end: int, header: List[str], spill: str, records: bool) -> Dict[str, Any]:
+    """Worker: parse one byte range into typed columns with chunk-local user and channel codes
+
+    The chunk's message text is written to `<spill>.text` and, when
+    `records` is set, its message rows for the writer to `<spill>.jsonl`
+    (one JSON object per line), so neither travels back through the pool.
+    Invalid UTF-8 bytes become U+FFFD; the rows holding them are kept and
+    counted in `replaced`.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    width = len(header)
+    # Missing columns read the empty cell appended past the row's end
+    user_i, text_i, ts_i, channel_i, thread_i, replies_i, reactions_i = (
+        header.index(name) if name in header else width for name in CSV_COLUMNS)
+    padding = [''] * (width + 1)
+    users, channels = Dictionary(), Dictionary()
+    ts, user, channel, thread_ts, reply_count, reaction_count = [], [], [], [], [], []
+    texts, skipped, replaced = [], 0, 0
+    record_file = open(f"{spill}.jsonl", 'w') if records else None
+
+    try:
+        text = data.decode('utf-8')
+        invalid = False
+    except UnicodeDecodeError:
+        text = data.decode('utf-8', errors='replace')
+        invalid = True
+
+    try:
+        for row in csv.reader(io.StringIO(text, newline='')):
+            if len(row) <= width:
+                row.extend(padding[len(row):])
+            user_id, message_ts = row[user_i], row[ts_i]
+            parsed_ts = _optional(parse_ts, message_ts, NO_TS)
+            if not user_id or parsed_ts == NO_TS:
+                skipped += 1
+                continue
+            # A malformed optional cell loses only its own value, not the row
+            parsed_thread = _optional(parse_ts, row[thread_i], NO_TS)
+            replies = _optional(int, row[replies_i], 0)
+            if invalid and any('\ufffd' in cell for cell in row):
+                replaced += 1
+
+            channel_id = row[channel_i] or DEFAULT_CHANNEL
+            count, reactions = _reactions(row[reactions_i])
+            ts.append(parsed_ts)
+            user.append(users.code(user_id))
+            channel.append(channels.code(channel_id))
+            thread_ts.append(parsed_thread)
+            reply_count.append(replies)
+            reaction_count.append(count)
+            texts.append(row[text_i].encode('utf-8'))
+            if record_file:
+                record = message_record({'user': user_id, 'text': row[text_i], 'ts': message_ts,
+                                         'thread_ts': row[thread_i] if parsed_thread != NO_TS else None,
+                                         'reactions': reactions}, channel_id)
+                record_file.write(json.dumps(record) + '\n')
+    finally:
+        if record_file:
+            record_file.close()
+
+    with open(f"{spill}.text", 'wb') as f:
+        f.writelines(texts)
+    return {
+        'columns': {
+            'ts': np.asarray(ts, dtype=np.int64),
+            'user': np.asarray(user, dtype=np.int32),
+            'channel': np.asarray(channel, dtype=np.int32),
+            'thread_ts': np.asarray(thread_ts, dtype=np.int64),
+            'reply_count': np.asarray(reply_count, dtype=np.int32),
+            'reaction_count': np.asarray(reaction_count, dtype=np.int32),
+        },
+        'users': users.values,
+        'channels': channels.values,
+        'text_lengths': np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts)),
+        'spill': spill,
+        'bytes': end - start,
+        'skipped': skipped,
+        'replaced': replaced,
+    }
+
+
+def _mapped(path: str, dtype, n: int) -> np.ndarray:
+    """Read-only view of a raw spill file (mmap cannot map an empty one)"""
+    return np.memmap(path, dtype=dtype, mode='r', shape=(n,)) if n else np.zeros(0, dtype=dtype)
+
+
+def _write_npy(path: str, dtype, n: int, blocks: Iterable[np.ndarray]):
+    """Write an n-element .npy file block by block, never holding the whole array"""
+    header = np.lib.format.header_data_from_array_1_0(np.zeros(0, dtype=dtype))
+    header['shape'] = (n,)
+    with open(path, 'wb') as f:
+        np.lib.format.write_array_header_1_0(f, header)
+        for block in blocks:
+            np.ascontiguousarray(block, dtype=dtype).tofile(f)
+
+
+class CSVIngester:
+    """Parses a large Slack CSV in parallel into a message store directory
+
+    The file is cut into byte ranges on row boundaries and each range is
+    parsed in a worker process into typed columns; text and writer rows go
+    to per-chunk spill files. The parent remaps the chunk-local user and
+    channel codes onto shared dictionaries, appends the columns and text to
+    raw spill files and streams the chunk's rows to the writer in batches.
+    The store's files are then assembled from the spill files block by
+    block (reordered by timestamp when the file is not in time order), so
+    memory stays proportional to a chunk, plus an 8-byte sort index per
+    row for out-of-order files. Message IDs derive from (channel, ts) and
+    are upserted, so re-uploading a file overwrites its rows instead of
+    duplicating them.
+    """
+
+    def __init__(self, path: str, store_dir: str, writer: Optional[BatchWriter] = None,
+                 workers: int = os.cpu_count() or 1, chunk_size: int = CHUNK_SIZE):
+        self.path = path
+        self.store_dir = store_dir
+        self.writer = writer
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.users = Dictionary()
+        self.channels = Dictionary()
+        self.stats: Dict[str, Any] = {'chunks': 0, 'bytes': 0, 'messages': 0, 'skipped': 0, 'replaced': 0, 'users': 0, 'channels': 0}
+        self._ordered = True
+        self._last_ts = NO_TS
+
+    def run(self) -> MessageStore:
+        """Ingest the file, write the store to store_dir and return it loaded from there"""
+        header, start = read_header(self.path)
+        missing = {'user', 'ts'} - set(header)
+        if missing:
+            raise ValueError(f"CSV is missing required columns: {', '.join(sorted(missing))}")
+        bounds = row_boundaries(self.path, start, self.chunk_size)
+        ranges = list(zip(bounds, bounds[1:]))
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        spill_dir = tempfile.mkdtemp(prefix='.csv-ingest-', dir=self.store_dir)
+        spill = {}
+        try:
+            for name in PARSED_COLUMNS + ('text_lengths', 'text'):
+                spill[name] = open(os.path.join(spill_dir, f"{name}.bin"), 'wb')
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                pending = deque()
+                for i, (chunk_start, chunk_end) in enumerate(ranges):
+                    pending.append(pool.submit(parse_chunk, self.path, chunk_start, chunk_end, header,
+                                               os.path.join(spill_dir, f"chunk-{i:06d}"), self.writer is not None))
+                    if len(pending) >= 2 * self.workers:
+                        self._merge(pending.popleft().result(), spill)
+                while pending:
+                    self._merge(pending.popleft().result(), spill)
+            for f in spill.values():
+                f.close()
+            if self.writer:
+                self.writer.flush()
+
+            self.stats['users'], self.stats['channels'] = len(self.users), len(self.channels)
+            self._assemble(spill_dir)
+        finally:
+            for f in spill.values():
+                f.close()
+            shutil.rmtree(spill_dir, ignore_errors=True)
+        return MessageStore.load(self.store_dir)
+
+    def _merge(self, chunk: Dict[str, Any], spill: Dict[str, BinaryIO]):
+        """Append one parsed chunk (in file order) to the spill files and stream its rows to the writer"""
+        columns = chunk['columns']
+        new_channels = [c for c in chunk['channels'] if self.channels.get(c) < 0]
+        new_users = [u for u in chunk['users'] if self.users.get(u) < 0]
+        user_codes = np.array([self.users.code(u) for u in chunk['users']], dtype=np.int32)
+        channel_codes = np.array([self.channels.code(c) for c in chunk['channels']], dtype=np.int32)
+        columns['user'] = user_codes[columns['user']] if len(user_codes) else columns['user']
+        columns['channel'] = channel_codes[columns['channel']] if len(channel_codes) else columns['channel']
+        for name, values in columns.items():
+            values.tofile(spill[name])
+        chunk['text_lengths'].tofile(spill['text_lengths'])
+        with open(f"{chunk['spill']}.text", 'rb') as f:
+            shutil.copyfileobj(f, spill['text'])
+        os.remove(f"{chunk['spill']}.text")
+
+        ts = columns['ts']
+        if len(ts) and self._ordered:
+            self._ordered = bool(ts[0] >= self._last_ts and np.all(ts[1:] >= ts[:-1]))
+            self._last_ts = int(ts[-1])
+
+        if self.writer:
+            self.writer.add_many('channels', [{"id": c, "name": c, "is_channel": True} for c in new_channels])
+            self.writer.add_many('users', [{"id": u, "name": u} for u in new_users])
+            with open(f"{chunk['spill']}.jsonl") as f:
+                while True:
+                    batch = [json.loads(line) for line in itertools.islice(f, self.writer.batch_size)]
+                    if not batch:
+                        break
+                    if self.writer.add_many('messages', batch):
+                        self.writer.flush()
+            os.remove(f"{chunk['spill']}.jsonl")
+
+        rows = len(ts)
+        self.stats['chunks'] += 1
+        self.stats['bytes'] += chunk['bytes']
+        self.stats['messages'] += rows
+        self.stats['skipped'] += chunk['skipped']
+        self.stats['replaced'] += chunk['replaced']
+        CSV_BYTES.inc(chunk['bytes'])
+        CSV_ROWS.inc(rows, {'outcome': 'ingested'})
+        CSV_ROWS.inc(chunk['skipped'], {'outcome': 'skipped'})
+        CSV_INVALID_UTF8.inc(chunk['replaced'])
+
+    def _assemble(self, spill_dir: str):
+        """Write the store's files from the spill files, sorted by timestamp as MessageStoreBuilder.build does"""
+        n = self.stats['messages']
+        raw = {name: _mapped(os.path.join(spill_dir, f"{name}.bin"), COLUMNS[name], n) for name in PARSED_COLUMNS}
+        lengths = _mapped(os.path.join(spill_dir, 'text_lengths.bin'), np.int64, n)
+        blocks = range(0, n, ASSEMBLE_ROWS)
+        # Exports are usually already in time order; only reorder when they are not
+        order = None if self._ordered else np.argsort(raw['ts'], kind='stable')
+
+        def column(values: np.ndarray) -> Iterator[np.ndarray]:
+            for i in blocks:
+                yield values[i:i + ASSEMBLE_ROWS] if order is None else values[order[i:i + ASSEMBLE_ROWS]]
+
+        for name, dtype in COLUMNS.items():
+            if name in raw:
+                values = column(raw[name])
+            else:
+                fill = NO_TS if name == 'latest_reply' else 0
+                values = (np.full(min(ASSEMBLE_ROWS, n - i), fill, dtype=dtype) for i in blocks)
+            _write_npy(os.path.join(self.store_dir, f"{name}.npy"), dtype, n, values)
+
+        # Chunk text is already in file order; out-of-order files gather it row by row into time order
+        text_path = os.path.join(self.store_dir, 'text.bin')
+        if order is None:
+            os.replace(os.path.join(spill_dir, 'text.bin'), text_path)
+        else:
+            source = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(lengths, out=source[1:])
+            with open(os.path.join(spill_dir, 'text.bin'), 'rb') as f, open(text_path, 'wb') as out:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if source[-1] else b''
+                for i in blocks:
+                    rows = order[i:i + ASSEMBLE_ROWS]
+                    out.write(b''.join([data[s:e] for s, e in zip(source[rows].tolist(), source[rows + 1].tolist())]))
+
+        def text_offsets() -> Iterator[np.ndarray]:
+            base = 0
+            yield np.zeros(1, dtype=np.int64)
+            for block in column(lengths):
+                ends = np.cumsum(block) + base
+                base = int(ends[-1]) if len(ends) else base
+                yield ends
+
+        _write_npy(os.path.join(self.store_dir, 'text_offsets.npy'), np.int64, n + 1, text_offsets())
+        write_manifest(self.store_dir, n, self.users, self.channels, Dictionary(['']))
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from profiling import Profiler
+    from thread_index import ThreadIndex
+
+    parser = argparse.ArgumentParser(description="Ingest a large Slack CSV upload in parallel chunks")
+    parser.add_argument('csv_path', help="CSV with user, text, ts, channel, thread_ts, reply_count, reactions columns")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Processes parsing chunks")
+    parser.add_argument('--chunk-mb', type=float, default=CHUNK_SIZE / 1024 / 1024, help="Target chunk size")
+    parser.add_argument('--batch-size', type=int, default=500, help="Rows per database write")
+    parser.add_argument('--store-dir', help="Write the message store and thread index here (default: a temporary directory)")
+    parser.add_argument('--snapshot', help="Write a memory-mapped workspace snapshot here")
+    parser.add_argument('--no-write', action='store_true', help="Only build the local store; write no database rows")
+    parser.add_argument('--profile', action='store_true', default=None, help="Write CPU/allocation profiles")
+    args = parser.parse_args()
+
+    load_dotenv('../.env')  # Load from parent directory
+
+    writer = None
+    if not args.no_write:
+        from ai_insights_api import SlackAnalyticsAI
+        writer = BatchWriter(SlackAnalyticsAI().supabase, args.batch_size)
+
+    # Without --store-dir the store is only needed for the snapshot
+    store_dir = args.store_dir or tempfile.mkdtemp(prefix='csv-store-')
+    ingester = CSVIngester(args.csv_path, store_dir, writer, args.workers, int(args.chunk_mb * 1024 * 1024))
+    started = time.perf_counter()
+    with Profiler(enabled=args.profile).stage('csv_ingest'):
+        store = ingester.run()
+    elapsed = time.perf_counter() - started
+    stats = ingester.stats
+    print(f"✓ Parsed {stats['messages']} messages from {stats['chunks']} chunks "
+          f"({stats['bytes'] / 1e6:.0f} MB in {elapsed:.1f}s, {stats['bytes'] / 1e6 / elapsed:.0f} MB/s)")
+    print(f"✓ {stats['users']} users, {stats['channels']} channels, skipped {stats['skipped']} rows without user or ts, "
+          f"replaced invalid UTF-8 in {stats['replaced']} rows")
+
+    if args.store_dir or args.snapshot:
+        threads = ThreadIndex.build(store)
+        if args.store_dir:
+            threads.save(args.store_dir)
+            print(f"✓ Saved message store to {args.store_dir}")
+        if args.snapshot:
+            from snapshot import write_snapshot
+            size = write_snapshot(args.snapshot, store, threads, {'csv': args.csv_path})
+            print(f"✓ Wrote snapshot {args.snapshot} ({size / 1e6:.1f} MB)")
+    if not args.store_dir:
+        shutil.rmtree(store_dir)
+    if writer:
+        print(f"✓ Wrote {writer.rows_written} rows in {writer.round_trips} round trips")
@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import zlib
+import hashlib
+import argparse
+import numpy as np
+from typing import Dict, Any, Optional, Tuple
+
+from message_store import NO_TS, MICROS, SECONDS_PER_DAY
+from snapshot import WorkspaceSnapshot
+from trend_engine import estimate_trends
+from forecasting import forecast_totals, HISTORY_DAYS
+from engagement_metrics import mean_response_hours
+from instrumentation import REGISTRY
+
+DASHBOARD_VERSION = 3
+
+# Messages per day that count as fully productive in the roster metrics
+PRODUCTIVE_MESSAGES_PER_DAY = 2.0
+
+# Days without a message after which a roster entry is shown as inactive
+INACTIVE_DAYS = 14
+
+# Days without a message after which the sentiment score drops (see sentiment_score)
+QUIET_DAYS = 7
+
+# Optional shared cache for the DashboardDataAgent runtime
+REDIS_ENV = 'PEPITO_REDIS_URL'
+DASHBOARD_CACHE_KEY = 'pepito:dashboard'
+
+DASHBOARD_RECOMPUTED = REGISTRY.counter('dashboard_users_recomputed_total', "Dashboard entries rebuilt because their inputs changed")
+
+
+def engagement_score(metrics: Dict[str, Any]) -> float:
+    """0-100 blend of participation, collaboration and responsiveness"""
+    responsiveness = 1 - min(metrics['avg_response_time'], 24.0) / 24.0
+    score = 0.5 * metrics['participation_rate'] + 0.3 * metrics['collaboration_score'] / 5 + 0.2 * responsiveness
+    return round(100 * score, 1)
+
+
+def sentiment_score(metrics: Dict[str, Any]) -> float:
+    """Same heuristic as calculateSentimentScore in the insights API route"""
+    score = 50
+    if metrics['engagement_trend'] == 'increasing':
+        score += 20
+    if metrics['participation_rate'] > 0.3:
+        score += 15
+    if metrics['collaboration_score'] > 3:
+        score += 10
+    if metrics['avg_response_time'] < 4:
+        score += 10
+    if metrics['engagement_trend'] == 'decreasing':
+        score -= 25
+    if metrics['participation_rate'] < 0.1:
+        score -= 20
+    if metrics['days_since_active'] > QUIET_DAYS:
+        score -= 15
+    if metrics['avg_response_time'] > 12:
+        score -= 10
+    return max(0, min(100, score))
+
+
+def load_profiles(export_path: str) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    """User profiles by id and channel names by id from an export's users.json and channels.json"""
+    from slack_export import SlackExportReader
+    with SlackExportReader(export_path) as reader:
+        profiles = {u['id']: u for u in reader.read_metadata('users.json') if 'id' in u}
+        channel_names = {c['id']: c['name'] for c in reader.read_metadata('channels.json') if 'id' in c and 'name' in c}
+    return profiles, channel_names
+
+
+def cached_dashboard(cache_path: str = 'dashboard.json') -> Optional[Tuple[bytes, str]]:
+    """The last materialized payload and its ETag, or None before the first run"""
+    try:
+        with open(cache_path, 'rb') as f:
+            blob = f.read()
+        with open(f"{cache_path}.etag") as f:
+            return blob, f.read().strip()
+    except OSError:
+        return None
+
+
+class DashboardMaterializer:
+    """Builds the DashboardDataAgent /api/dashboard payload from a workspace snapshot
+
+    Every user's inputs (their daily rollup over the forecast history,
+    aligned to the window's end, the inactivity thresholds they are past,
+    response time and profile) are reduced to a signature kept in a JSON
+    state file together with the entries built from them, so a run only
+    rebuilds the roster, score and forecast entries of users whose signature
+    changed. A new day therefore only touches users with activity inside the
+    history or whose idle days cross a threshold.
+    The payload is serialized once into a cache file with an ETag sidecar,
+    and mirrored into Redis when PEPITO_REDIS_URL is set.
+    """
+
+    def __init__(self, state_path: str = 'dashboard_state.json', cache_path: str = 'dashboard.json',
+                 window_days: int = 30):
+        self.state_path = state_path
+        self.cache_path = cache_path
+        self.window_days = window_days
+        self.state: Dict[str, Any] = {}
+
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state = json.load(f)
+        if self.state.get('version') != DASHBOARD_VERSION or self.state.get('window_days') != window_days:
+            self.state = {'version': DASHBOARD_VERSION, 'window_days': window_days, 'as_of_day': None,
+                          'signatures': {}, 'entries': {}}
+
+    def save(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _history(self, snapshot: WorkspaceSnapshot, as_of_day: int, days: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Users x days message matrix ending at as_of_day from the daily rollup, and each user's last active day"""
+        n_users = len(snapshot.users)
+        offsets = snapshot.arrays['rollup.user_day.offsets']
+        rollup_days = snapshot.arrays['rollup.user_day.day'].astype(np.int64)
+        messages = snapshot.arrays['rollup.user_day.messages']
+        owners = np.repeat(np.arange(n_users, dtype=np.int64), np.diff(offsets))
+
+        column = rollup_days - (as_of_day - days + 1)
+        inside = (column >= 0) & (column < days)
+        matrix = np.zeros((n_users, days), dtype=np.float64)
+        matrix[owners[inside], column[inside]] = messages[inside]
+
+        # Rollup days are sorted within each user, so the last entry is the latest active day
+        has_days = np.diff(offsets) > 0
+        last_day = np.full(n_users, -1, dtype=np.int64)
+        last_day[has_days] = rollup_days[offsets[1:][has_days] - 1]
+        return matrix, last_day
+
+    def signatures(self, snapshot: WorkspaceSnapshot, history: np.ndarray, last_day: np.ndarray, as_of_day: int,
+                   response_hours: np.ndarray, profiles: Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+        """Checksum of everything a user's entries are built from
+
+        Idle days only matter through the sentiment and inactive thresholds
+        (the window covers the rest), so only those enter the checksum. A
+        user with no messages in the history gets the same entries however
+        long it is, so their empty row does not either.
+        """
+        idle = np.where(last_day >= 0, as_of_day - last_day, self.window_days)
+        thresholds = np.stack([idle > QUIET_DAYS, idle > INACTIVE_DAYS], axis=1)
+        active = history.any(axis=1)
+        signatures = {}
+        for code, user_id in enumerate(snapshot.users.values):
+            profile = json.dumps(profiles.get(user_id), sort_keys=True).encode('utf-8')
+            checksum = zlib.crc32(history[code].tobytes() if active[code] else b'')
+            checksum = zlib.crc32(thresholds[code].tobytes(), checksum)
+            checksum = zlib.crc32(response_hours[code:code + 1].tobytes(), checksum)
+            signatures[user_id] = zlib.crc32(profile, checksum)
+        return signatures
+
+    def _channels(self, snapshot: WorkspaceSnapshot, user_id: str, as_of_day: int) -> Tuple[Optional[int], int, int]:
+        """Most used channel code, channels used and threaded messages inside the window"""
+        store = snapshot.store
+        rows = snapshot.user_rows(user_id)
+        day_micros = SECONDS_PER_DAY * MICROS
+        rows = rows[store.columns['ts'][rows] >= (as_of_day - self.window_days + 1) * day_micros]
+        if len(rows) == 0:
+            return None, 0, 0
+        counts = np.bincount(store.columns['channel'][rows])
+        threaded = int(np.count_nonzero(store.columns['thread_ts'][rows] != NO_TS))
+        return int(counts.argmax()), int(np.count_nonzero(counts)), threaded
+
+    def build_entries(self, snapshot: WorkspaceSnapshot, codes: np.ndarray, history: np.ndarray, last_day: np.ndarray,
+                      as_of_day: int, response_hours: np.ndarray, profiles: Dict[str, Dict[str, Any]],
+                      channel_names: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """Roster, score and forecast entries for the given user codes"""
+        if len(codes) == 0:
+            return {}
+        rows = history[codes, -self.window_days:]
+        trends = estimate_trends(rows)
+        forecasts = forecast_totals(history[codes], self.window_days)
+        totals = rows.sum(axis=1)
+        teams = snapshot.store.columns['team']
+
+        entries = {}
+        for i, code in enumerate(codes.tolist()):
+            user_id = snapshot.users[code]
+            top_channel, channels_used, threaded = self._channels(snapshot, user_id, as_of_day)
+            user_rows = snapshot.user_rows(user_id)
+            metrics = {
+                'messages_sent': int(totals[i]),
+                'participation_rate': float(np.count_nonzero(rows[i])) / self.window_days,
+                'avg_response_time': float(response_hours[code]),
+                'collaboration_score': min(5.0, channels_used * 0.5 + threaded * 0.1),
+                'engagement_trend': str(trends['engagement_trend'][i]),
+                'days_since_active': int(as_of_day - last_day[code]) if last_day[code] >= 0 else self.window_days,
+            }
+            profile = profiles.get(user_id, {})
+            details = profile.get('profile', {})
+            top_channel_id = snapshot.channels[top_channel] if top_channel is not None else ''
+            score = engagement_score(metrics)
+
+            entries[user_id] = {
+                'employee': {
+                    'id': user_id,
+                    'fullName': profile.get('real_name') or details.get('real_name') or profile.get('name') or user_id,
+                    'location': profile.get('tz') or '',
+                    'jobTitle': details.get('title') or '',
+                    'department': details.get('department') or '',
+                    'team': snapshot.teams[int(np.bincount(teams[user_rows]).argmax())] if len(user_rows) else '',
+                    'status': 'inactive' if profile.get('deleted') or metrics['days_since_active'] > INACTIVE_DAYS else 'active',
+                    'metrics': {
+                        'productivity': round(100 * min(1.0, metrics['messages_sent'] / (PRODUCTIVE_MESSAGES_PER_DAY * self.window_days)), 1),
+                        'engagement': score,
+                        'sentiment': sentiment_score(metrics),
+                    },
+                },
+                'score': {'score': score, 'trend': metrics['engagement_trend'],
+                          'topChannel': channel_names.get(top_channel_id, top_channel_id)},
+                'forecast': {'nextMonth': round(float(forecasts['point'][i]), 1),
+                             'low': round(float(forecasts['lower'][i]), 1),
+                             'high': round(float(forecasts['upper'][i]), 1)},
+            }
+        return entries
+
+    def materialize(self, snapshot: WorkspaceSnapshot, profiles: Optional[Dict[str, Dict[str, Any]]] = None,
+                    channel_names: Optional[Dict[str, str]] = None, full: bool = False) -> Dict[str, Any]:
+        """Refresh the changed entries, write the cached payload and return a summary"""
+        profiles = profiles or {}
+        channel_names = channel_names or {}
+        ts = snapshot.arrays['messages.ts']
+        as_of_day = int(ts[-1] // (SECONDS_PER_DAY * MICROS)) if len(ts) else 0
+
+        # Forecasts are fitted on up to HISTORY_DAYS, but never on days before the workspace's first message
+        rollup_days = snapshot.arrays['rollup.user_day.day']
+        span = as_of_day - int(rollup_days.min()) + 1 if len(rollup_days) else 0
+        history, last_day = self._history(snapshot, as_of_day, max(min(HISTORY_DAYS, span), self.window_days))
+        response_hours = mean_response_hours(snapshot.store, snapshot.threads, snapshot.history)
+        signatures = self.signatures(snapshot, history, last_day, as_of_day, response_hours, profiles)
+
+        if full:
+            self.state['signatures'], self.state['entries'] = {}, {}
+        stored = self.state['signatures']
+        dirty = np.array([code for code, user_id in enumerate(snapshot.users.values)
+                          if stored.get(user_id) != signatures[user_id]], dtype=np.int64)
+        DASHBOARD_RECOMPUTED.inc(len(dirty))
+        entries = self.state['entries']
+        entries.update(self.build_entries(snapshot, dirty, history, last_day, as_of_day, response_hours,
+                                          profiles, channel_names))
+        for user_id in set(entries) - set(signatures):
+            del entries[user_id]
+
+        blob, etag = self.serialize(entries, as_of_day)
+        if dirty.size or not os.path.exists(self.cache_path):
+            self._write_cache(blob, etag)
+        self.state.update({'as_of_day': as_of_day, 'signatures': signatures, 'etag': etag})
+        self.save()
+        return {'users': len(entries), 'recomputed': int(dirty.size), 'bytes': len(blob), 'etag': etag}
+
+    def serialize(self, entries: Dict[str, Dict[str, Any]], as_of_day: int) -> Tuple[bytes, str]:
+        """Payload bytes and a strong ETag over them"""
+        users = sorted(entries)
+        payload = {
+            'roster': [entries[user_id]['employee'] for user_id in users],
+            'scores': {user_id: entries[user_id]['score'] for user_id in users},
+            'forecasts': {user_id: entries[user_id]['forecast'] for user_id in users},
+            'asOf': as_of_day * SECONDS_PER_DAY,
+        }
+        blob = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        return blob, f'"{hashlib.blake2b(blob, digest_size=16).hexdigest()}"'
+
+    def _write_cache(self, blob: bytes, etag: str):
+        for path, data in ((self.cache_path, blob), (f"{self.cache_path}.etag", etag.encode('ascii'))):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        url = os.getenv(REDIS_ENV)
+        if url:
+            import redis
+            client = redis.Redis.from_url(url)
+            client.mset({DASHBOARD_CACHE_KEY: blob, f"{DASHBOARD_CACHE_KEY}:etag": etag})
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from profiling import Profiler
+
+    parser = argparse.ArgumentParser(description="Materialize the /api/dashboard payload from a workspace snapshot")
+    parser.add_argument('snapshot', help="Workspace snapshot written by the pipeline (--snapshot)")
+    parser.add_argument('--export', help="Slack export to read user profiles and channel names from")
+    parser.add_argument('--state', default='dashboard_state.json', help="Materializer state file")
+    parser.add_argument('--out', default='dashboard.json', help="Cached payload (ETag in <out>.etag)")
+    parser.add_argument('--window-days', type=int, default=30, help="Scoring and forecast window")
+    parser.add_argument('--full', action='store_true', help="Rebuild every user's entries")
+    parser.add_argument('--profile', action='store_true', default=None, help="Write CPU/allocation profiles")
+    args = parser.parse_args()
+
+    load_dotenv('../.env')  # Load from parent directory
+
+    profiles, channel_names = load_profiles(args.export) if args.export else ({}, {})
+    started = time.perf_counter()
+    with Profiler(enabled=args.profile).stage('dashboard'), WorkspaceSnapshot(args.snapshot) as snapshot:
+        summary = DashboardMaterializer(args.state, args.out, args.window_days).materialize(
+            snapshot, profiles, channel_names, args.full)
+    print(f"✓ Dashboard for {summary['users']} users: rebuilt {summary['recomputed']} entries, "
+          f"{summary['bytes'] / 1024:.1f} KB, ETag {summary['etag']} ({time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,142 @@
+import os
+import math
+import struct
+import sqlite3
+import hashlib
+from typing import Dict, Any, Optional, Iterable
+
+from instrumentation import REGISTRY
+
+BLOOM_MAGIC = b'PBLM'
+BLOOM_VERSION = 1
+BLOOM_HEADER = struct.Struct('<4sIQIQQ')  # magic, version, bits, hashes, count, capacity
+
+DUPLICATES = REGISTRY.counter('ingest_duplicates_total', "Messages skipped because an earlier import already had them")
+BLOOM_HITS = REGISTRY.counter('dedup_bloom_hits_total', "Keys the Bloom filter reported as possibly seen")
+BLOOM_FALSE_POSITIVES = REGISTRY.counter('dedup_false_positives_total', "Bloom filter hits the exact check rejected")
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys
+
+    Positions come from double hashing one 128-bit blake2b digest, so each
+    lookup is a single hash plus `hashes` bit tests.
+    """
+
+    def __init__(self, capacity: int = 10_000_000, error_rate: float = 0.01,
+                 bits: Optional[int] = None, hashes: Optional[int] = None, count: int = 0,
+                 data: Optional[bytearray] = None):
+        self.capacity = capacity
+        self.bits = bits or max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = hashes or max(1, round(self.bits / capacity * math.log(2)))
+        self.count = count
+        self.data = data if data is not None else bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        data = self.data
+        return all(data[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: str):
+        data = self.data
+        for p in self._positions(key):
+            data[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def save(self, path: str):
+        """Write the filter atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, BLOOM_VERSION, self.bits, self.hashes, self.count, self.capacity))
+            f.write(self.data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['BloomFilter']:
+        """Read a saved filter, or None if it is missing or from another version"""
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(BLOOM_HEADER.size)
+                magic, version, bits, hashes, count, capacity = BLOOM_HEADER.unpack(header)
+                data = bytearray(f.read())
+        except (OSError, struct.error):
+            return None
+        if magic != BLOOM_MAGIC or version != BLOOM_VERSION or len(data) != (bits + 7) // 8:
+            return None
+        return cls(capacity, bits=bits, hashes=hashes, count=count, data=data)
+
+
+def message_keys(channel_id: str, msg: Dict[str, Any]) -> Iterable[str]:
+    """Identity keys of a message: (channel, ts), plus client_msg_id when Slack set one"""
+    yield f"ts:{channel_id}:{msg['ts']}"
+    if msg.get('client_msg_id'):
+        yield f"client:{msg['client_msg_id']}"
+
+
+class MessageDeduplicator:
+    """Remembers every imported message across runs so re-delivered exports are skipped
+
+    A Bloom filter answers most lookups from memory; only its hits (real
+    duplicates plus ~1% false positives) consult the exact key set, kept in
+    a small SQLite file next to it. State lives in `{path}.bloom` and
+    `{path}.keys`; call save() once the imported rows are written.
+    """
+
+    def __init__(self, path: str = 'message_dedup', capacity: int = 1_000_000, error_rate: float = 0.01):
+        self.path = path
+        self.error_rate = error_rate
+        self.bloom = BloomFilter.load(f"{path}.bloom") or BloomFilter(capacity, error_rate)
+        self.duplicates = 0
+
+        self._keys = sqlite3.connect(f"{path}.keys", check_same_thread=False)
+        self._keys.execute('pragma journal_mode=wal')
+        self._keys.execute('create table if not exists seen_keys (key text primary key) without rowid')
+
+        # Rebuild a lost or stale filter from the exact keys
+        stored = self._keys.execute('select count(*) from seen_keys').fetchone()[0]
+        if stored != self.bloom.count:
+            self._rebuild(max(capacity, stored * 2))
+
+    def _rebuild(self, capacity: int):
+        self.bloom = BloomFilter(capacity, self.error_rate)
+        for (key,) in self._keys.execute('select key from seen_keys'):
+            self.bloom.add(key)
+
+    def _known(self, key: str) -> bool:
+        if key not in self.bloom:
+            return False
+        BLOOM_HITS.inc()
+        if self._keys.execute('select 1 from seen_keys where key = ?', (key,)).fetchone():
+            return True
+        BLOOM_FALSE_POSITIVES.inc()
+        return False
+
+    def seen(self, channel_id: str, msg: Dict[str, Any]) -> bool:
+        """True if the message was imported before; otherwise remember it and return False"""
+        keys = list(message_keys(channel_id, msg))
+        if any(self._known(key) for key in keys):
+            self.duplicates += 1
+            DUPLICATES.inc()
+            return True
+
+        self._keys.executemany('insert or ignore into seen_keys (key) values (?)', [(key,) for key in keys])
+        for key in keys:
+            self.bloom.add(key)
+        # Past capacity the false-positive rate climbs, so double the filter
+        if self.bloom.count > self.bloom.capacity:
+            self._rebuild(self.bloom.capacity * 2)
+        return False
+
+    def save(self):
+        """Commit the new keys and write the filter"""
+        self._keys.commit()
+        self.bloom.save(f"{self.path}.bloom")
+
+    def close(self):
+        self.save()
+        self._keys.close()
@@ -0,0 +1,92 @@
+import numpy as np
+from typing import Dict, Any, Optional
+
+from message_store import MessageStore, NO_TS, MICROS, SECONDS_PER_DAY
+from thread_index import ThreadIndex
+from trend_engine import activity_matrix, estimate_trends
+
+# Matches the default used by the CSV upload route when a user never replied
+DEFAULT_RESPONSE_HOURS = 12.0
+
+
+def mean_response_hours(store: MessageStore, threads: ThreadIndex, history: Optional['FoldedHistory'] = None) -> np.ndarray:
+    """Mean hours each user takes to first answer a thread, including threads folded by compaction"""
+    totals, counts = threads.response_totals(store)
+    if history is not None:
+        totals = totals + history.dense('answer_micros', len(store.users))
+        counts = counts + history.dense('answer_counts', len(store.users))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hours = totals / np.maximum(counts, 1) / MICROS / 3600.0
+    return np.where(counts > 0, hours, DEFAULT_RESPONSE_HOURS)
+
+
+def compute_user_metrics(store: MessageStore, threads: ThreadIndex, window_days: int = 30,
+                         as_of: Optional[int] = None, history: Optional['FoldedHistory'] = None) -> Dict[str, Dict[str, Any]]:
+    """Compute the per-user metrics SlackAnalyticsAI expects, for every user in the store
+
+    The window ends at `as_of` (microseconds; defaults to the newest message)
+    and covers the previous `window_days` days. For a compacted store, pass
+    the FoldedHistory of its compacted messages so the all-time metrics
+    (response time, team, last activity) still cover them.
+    """
+    n_users = len(store.users)
+    if len(store) == 0:
+        return {}
+
+    ts = store.columns['ts']
+    users = store.columns['user']
+    as_of = int(ts[-1]) if as_of is None else as_of
+    day_micros = SECONDS_PER_DAY * MICROS
+    window_start = as_of - window_days * day_micros
+
+    in_window = (ts > window_start) & (ts <= as_of)
+    w_users = users[in_window]
+    w_days = ((ts[in_window] - window_start - 1) // day_micros).astype(np.int64)
+
+    messages_sent = np.bincount(w_users, minlength=n_users)
+
+    # Participation: share of days in the window on which the user posted
+    active_days = np.bincount(np.unique(w_users.astype(np.int64) * window_days + w_days) // window_days,
+                              minlength=n_users)
+    participation_rate = active_days / window_days
+
+    # Trend: least-squares slope of daily activity, plus second-half vs first-half drop
+    trends = estimate_trends(activity_matrix(store, window_days, as_of))
+
+    # Collaboration mirrors the upload route: channels * 0.5 + threaded messages * 0.1, capped at 5
+    w_channels = store.columns['channel'][in_window].astype(np.int64)
+    n_channels = max(len(store.channels), 1)
+    channels_used = np.bincount(np.unique(w_users.astype(np.int64) * n_channels + w_channels) // n_channels,
+                                minlength=n_users)
+    threaded = np.bincount(w_users[store.columns['thread_ts'][in_window] != NO_TS], minlength=n_users)
+    collaboration_score = np.minimum(5.0, channels_used * 0.5 + threaded * 0.1)
+
+    response_hours = mean_response_hours(store, threads, history)
+
+    # Team: the workspace a user posts from most often (user_team / team fields)
+    n_teams = max(len(store.teams), 1)
+    team_counts = np.bincount(users.astype(np.int64) * n_teams + store.columns['team'], minlength=n_users * n_teams)
+    if history is not None:
+        team_counts += history.team_counts(n_users, n_teams)
+    team = team_counts.reshape(n_users, n_teams).argmax(axis=1)
+
+    last_seen = np.full(n_users, -1, dtype=np.int64)
+    np.maximum.at(last_seen, users, ts)
+    if history is not None:
+        last_seen = np.maximum(last_seen, history.dense('last_ts', n_users, fill=-1))
+    days_since_active = np.maximum((as_of - last_seen) // day_micros, 0)
+
+    metrics = {}
+    for code in range(n_users):
+        metrics[store.users[code]] = {
+            'messages_sent': int(messages_sent[code]),
+            'participation_rate': float(participation_rate[code]),
+            'avg_response_time': float(response_hours[code]),
+            'collaboration_score': float(collaboration_score[code]),
+            'engagement_trend': str(trends['engagement_trend'][code]),
+            'trend_confidence': float(trends['trend_confidence'][code]),
+            'participation_drop': float(trends['participation_drop'][code]),
+            'days_since_active': int(days_since_active[code]),
+            'team': store.teams[int(team[code])] if len(store.teams) else '',
+        }
+    return metrics
@@ -0,0 +1,278 @@
+import json
+import time
+import argparse
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+from ai_insights_api import SlackAnalyticsAI
+from quantile_sketch import TeamBaselines
+from instrumentation import REGISTRY
+
+RULE_OUTCOMES = REGISTRY.counter('insight_rules_total', 'Users resolved locally or escalated to the LLM by the rule engine')
+LLM_CALLS_AVOIDED = REGISTRY.counter('llm_calls_avoided_total', 'Insight completions replaced by rule-engine answers')
+
+# Absolute cut-offs, the same as SlackAnalyticsAI._determine_insight_type (percentile
+# cut-offs are read from SlackAnalyticsAI itself)
+LOW_PARTICIPATION = 0.3
+HIGH_PARTICIPATION = 0.8
+LOW_MESSAGES = 10
+HIGH_MESSAGES = 50
+INACTIVE_DAYS = 7
+
+# Signal thresholds shared with the insights API route's communication patterns
+FAST_RESPONSE_HOURS = 2.0
+SLOW_RESPONSE_HOURS = 8.0
+STRONG_COLLABORATION = 3.5
+LIMITED_COLLABORATION = 2.0
+SHARP_DROP = 0.5
+CONFIDENT_TREND = 0.6
+
+# How far past a cut-off a user must be before the call is considered clear:
+# participation in absolute rate, messages as a share of the cut-off, days,
+# and team percentile
+PARTICIPATION_BAND = 0.05
+MESSAGES_BAND = 0.2
+INACTIVE_BAND = 2.0
+PERCENTILE_BAND = 0.05
+
+# Users below this confidence are left to the LLM
+ESCALATE_BELOW = 0.65
+
+CATEGORIES = ('underperforming', 'overperforming', 'silent_quitting', 'normal')
+
+# Metric name, default when missing
+RULE_METRICS = {
+    'participation_rate': 0.0,
+    'messages_sent': 0.0,
+    'avg_response_time': 0.0,
+    'collaboration_score': 0.0,
+    'days_since_active': 0.0,
+    'participation_drop': 0.0,
+    'trend_confidence': 0.0,
+}
+
+# Signal -> phrase; every true signal adds its phrase to the matching list
+STRENGTHS = {
+    'high_participation': "Consistent presence in team conversations",
+    'high_volume': "Active communicator",
+    'fast_response': "Highly responsive to teammates",
+    'strong_collaboration': "Strong cross-channel collaboration",
+    'rising': "Growing engagement over time",
+}
+CONCERNS = {
+    'low_participation': "Low participation in team communications",
+    'low_volume': "Low message volume in the last 30 days",
+    'slow_response': "Delayed responses to teammates",
+    'limited_collaboration': "Limited collaborative engagement",
+    'falling': "Declining engagement over time",
+    'sharp_drop': "Activity dropped sharply in recent weeks",
+    'inactive': "No activity for over a week",
+    'burnout': "Potential burnout risk",
+}
+
+TEMPLATES = {
+    'underperforming': {
+        'assessment': "Low engagement detected",
+        'factors': ["Workload", "Communication preferences", "Role clarity"],
+        'recommendations': ["Schedule 1:1 meeting", "Assess workload", "Clarify expectations"],
+    },
+    'overperforming': {
+        'assessment': "High performer with strong engagement",
+        'factors': ["High motivation", "Strong team connection"],
+        'recommendations': ["Recognize contributions", "Explore growth opportunities"],
+    },
+    'silent_quitting': {
+        'assessment': "Possible disengagement after a period of silence",
+        'factors': ["Role satisfaction", "Personal circumstances", "Team connection"],
+        'recommendations': ["Check in personally", "Ask about satisfaction and blockers", "Revisit goals together"],
+    },
+    'normal': {
+        'assessment': "Stable performance with room for growth",
+        'factors': ["Role satisfaction", "Team dynamics"],
+        'recommendations': ["Regular check-ins", "Encourage more participation"],
+    },
+}
+
+RISK_LEVELS = np.array(['low', 'medium', 'high'])
+
+
+class InsightRules:
+    """Local, vectorized insight generation for clear-cut users
+
+    Every user's metrics become signed distances past the low-engagement,
+    high-performer and inactivity cut-offs (in band units) and a set of
+    boolean signals, all computed as arrays over the whole organization.
+    The category follows SlackAnalyticsAI._determine_insight_type, using
+    team percentiles when baselines are given; confidence grows with the
+    distance from the deciding cut-off and drops when the engagement trend
+    contradicts the category. Confident users get a complete insight in the
+    generate_insights schema; the rest are returned for escalation.
+    """
+
+    def __init__(self, baselines: Optional[TeamBaselines] = None, escalate_below: float = ESCALATE_BELOW):
+        self.baselines = baselines
+        self.escalate_below = escalate_below
+        self.resolved = 0
+        self.escalated = 0
+
+    def _arrays(self, metrics: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        arrays = {name: np.fromiter((float(m.get(name) or default) for m in metrics), dtype=np.float64, count=len(metrics))
+                  for name, default in RULE_METRICS.items()}
+        trends = [m.get('engagement_trend') for m in metrics]
+        arrays['rising'] = np.array([t == 'increasing' for t in trends], dtype=bool)
+        arrays['falling'] = np.array([t == 'decreasing' for t in trends], dtype=bool)
+        return arrays
+
+    def _percentiles(self, metrics: List[Dict[str, Any]], metric: str) -> np.ndarray:
+        """Rank of every user within their team (NaN where the baselines cannot rank)"""
+        values = np.fromiter((float(m.get(metric, 0) or 0) for m in metrics), dtype=np.float64, count=len(metrics))
+        teams, team_of = np.unique([m.get('team') or '' for m in metrics], return_inverse=True)
+        ranks = np.full(len(metrics), np.nan)
+        for code, team in enumerate(teams.tolist()):
+            rows = np.flatnonzero(team_of == code)
+            team_ranks = self.baselines.percentiles(team, metric, values[rows])
+            if team_ranks is not None:
+                ranks[rows] = team_ranks
+        return ranks
+
+    def _scores(self, metrics: List[Dict[str, Any]], a: Dict[str, np.ndarray]):
+        """Signed distances past the low, high and quiet cut-offs in band units (positive: condition holds)"""
+        p, m, d = a['participation_rate'], a['messages_sent'], a['days_since_active']
+        low = np.maximum((LOW_PARTICIPATION - p) / PARTICIPATION_BAND, (LOW_MESSAGES - m) / (LOW_MESSAGES * MESSAGES_BAND))
+        high = np.minimum((p - HIGH_PARTICIPATION) / PARTICIPATION_BAND, (m - HIGH_MESSAGES) / (HIGH_MESSAGES * MESSAGES_BAND))
+        quiet = (d - INACTIVE_DAYS) / INACTIVE_BAND
+        if self.baselines is None:
+            a['participation_rank'] = a['messages_rank'] = np.full(len(metrics), np.nan)
+            return low, high, quiet
+
+        rp = a['participation_rank'] = self._percentiles(metrics, 'participation_rate')
+        rm = a['messages_rank'] = self._percentiles(metrics, 'messages_sent')
+        ri = self._percentiles(metrics, 'days_since_active')
+        ranked = ~(np.isnan(rp) | np.isnan(rm) | np.isnan(ri))
+        with np.errstate(invalid='ignore'):
+            rel_low = np.maximum(SlackAnalyticsAI.LOW_PARTICIPATION_PERCENTILE - rp,
+                                 SlackAnalyticsAI.LOW_VOLUME_PERCENTILE - rm) / PERCENTILE_BAND
+            rel_high = np.minimum(rp, rm) - SlackAnalyticsAI.HIGH_PERCENTILE
+            rel_quiet = np.minimum((ri - SlackAnalyticsAI.INACTIVE_PERCENTILE) / PERCENTILE_BAND,
+                                   (d - SlackAnalyticsAI.MIN_INACTIVE_DAYS + 0.5) / INACTIVE_BAND)
+        return (np.where(ranked, rel_low, low), np.where(ranked, rel_high / PERCENTILE_BAND, high),
+                np.where(ranked, rel_quiet, quiet))
+
+    def evaluate(self, users_metrics: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Resolve confident users locally; returns {'insights': {user_id: insight}, 'escalate': [user_ids], ...}"""
+        user_ids = list(users_metrics)
+        metrics = [users_metrics[user_id] for user_id in user_ids]
+        if not user_ids:
+            return {'insights': {}, 'escalate': [], 'types': {}, 'llm_calls_avoided': 0}
+        a = self._arrays(metrics)
+        low, high, quiet = self._scores(metrics, a)
+        category = np.select([low > 0, high > 0, quiet > 0], [0, 1, 2], default=3)
+        clarity = np.select(
+            [category == 0, category == 1, category == 2],
+            [low, high, np.minimum(quiet, np.minimum(-low, -high))],
+            default=np.minimum(np.minimum(-low, -high), -quiet))
+
+        # Absolute levels, or the team percentiles that put the user in their category
+        with np.errstate(invalid='ignore'):
+            rank_low_p = a['participation_rank'] < SlackAnalyticsAI.LOW_PARTICIPATION_PERCENTILE
+            rank_low_m = a['messages_rank'] < SlackAnalyticsAI.LOW_VOLUME_PERCENTILE
+            rank_high_p = a['participation_rank'] > SlackAnalyticsAI.HIGH_PERCENTILE
+            rank_high_m = a['messages_rank'] > SlackAnalyticsAI.HIGH_PERCENTILE
+        signals = {
+            'high_participation': (a['participation_rate'] > HIGH_PARTICIPATION) | rank_high_p,
+            'high_volume': (a['messages_sent'] > HIGH_MESSAGES) | rank_high_m,
+            'fast_response': (a['avg_response_time'] > 0) & (a['avg_response_time'] < FAST_RESPONSE_HOURS),
+            'strong_collaboration': a['collaboration_score'] > STRONG_COLLABORATION,
+            'rising': a['rising'],
+            'low_participation': (a['participation_rate'] < LOW_PARTICIPATION) | rank_low_p,
+            'low_volume': (a['messages_sent'] < LOW_MESSAGES) | rank_low_m,
+            'slow_response': a['avg_response_time'] > SLOW_RESPONSE_HOURS,
+            'limited_collaboration': a['collaboration_score'] < LIMITED_COLLABORATION,
+            'falling': a['falling'],
+            'sharp_drop': a['participation_drop'] > SHARP_DROP,
+            'inactive': a['days_since_active'] > INACTIVE_DAYS,
+            'burnout': (category == 1) & (a['participation_rate'] > 0.9),
+        }
+
+        # Trend against the category (e.g. a confidently rising "underperformer") needs judgement
+        confident_trend = a['trend_confidence'] >= CONFIDENT_TREND
+        conflict = (((category == 0) & a['rising']) | ((category == 1) & (a['falling'] | signals['sharp_drop']))) & confident_trend
+        confidence = (0.5 + 0.4 * np.clip(clarity, 0, 1)) * np.where(conflict, 0.7, 1.0)
+        # Long silences are unambiguous whatever the other metrics say
+        confidence = np.where(a['days_since_active'] > 2 * INACTIVE_DAYS, np.maximum(confidence, 0.85), confidence)
+
+        risk = np.select(
+            [category == 2, (category == 0) & (a['falling'] | signals['sharp_drop']), category == 0,
+             (category == 3) & (a['falling'] | signals['sharp_drop'])],
+            [2, 2, 1, 1], default=0)
+        resolved = confidence >= self.escalate_below
+
+        strength_masks = np.stack([signals[name] for name in STRENGTHS], axis=1)
+        concern_masks = np.stack([signals[name] for name in CONCERNS], axis=1)
+        strength_phrases = list(STRENGTHS.values())
+        concern_phrases = list(CONCERNS.values())
+
+        insights, escalate = {}, []
+        for i, user_id in enumerate(user_ids):
+            if not resolved[i]:
+                escalate.append(user_id)
+                continue
+            template = TEMPLATES[CATEGORIES[category[i]]]
+            insights[user_id] = {
+                'assessment': template['assessment'],
+                'strengths': [strength_phrases[j] for j in np.flatnonzero(strength_masks[i])] or ["Potential for improvement"],
+                'concerns': [concern_phrases[j] for j in np.flatnonzero(concern_masks[i])] or ["No significant concerns"],
+                'factors': list(template['factors']),
+                'recommendations': list(template['recommendations']),
+                'risk_level': str(RISK_LEVELS[risk[i]]),
+                'confidence_score': round(float(confidence[i]), 2),
+            }
+
+        self.resolved += len(insights)
+        self.escalated += len(escalate)
+        RULE_OUTCOMES.inc(len(insights), {'outcome': 'resolved'})
+        RULE_OUTCOMES.inc(len(escalate), {'outcome': 'escalated'})
+        LLM_CALLS_AVOIDED.inc(len(insights))
+        return {
+            'insights': insights,
+            'escalate': escalate,
+            'types': {user_id: CATEGORIES[c] for user_id, c in zip(user_ids, category.tolist())},
+            'llm_calls_avoided': len(insights),
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Answer clear-cut users locally and list the ones that need the LLM")
+    parser.add_argument('metrics_path', nargs='?', help="JSON file mapping user_id -> metrics (omit to benchmark)")
+    parser.add_argument('--baselines', help="Per-team metric sketches (from pipeline.py --baselines) for relative categories")
+    parser.add_argument('--users', type=int, default=100_000, help="Synthetic users for the benchmark")
+    parser.add_argument('--out', help="Write the resolved insights and escalation list here")
+    args = parser.parse_args()
+
+    if args.metrics_path:
+        with open(args.metrics_path) as f:
+            all_metrics = json.load(f)
+    else:
+        rng = np.random.default_rng(0)
+        trend_labels = np.array(['increasing', 'stable', 'decreasing'])
+        all_metrics = {f"U{i:06d}": {
+            'messages_sent': int(m), 'participation_rate': float(p), 'avg_response_time': float(r),
+            'collaboration_score': float(c), 'days_since_active': int(d), 'participation_drop': float(drop),
+            'engagement_trend': str(t), 'trend_confidence': float(conf),
+        } for i, (m, p, r, c, d, drop, t, conf) in enumerate(zip(
+            rng.poisson(40, args.users), rng.beta(2, 2, args.users), rng.gamma(2, 3, args.users),
+            rng.uniform(0, 5, args.users), rng.geometric(0.3, args.users) - 1, rng.beta(1, 4, args.users),
+            trend_labels[rng.integers(0, 3, args.users)], rng.uniform(0, 1, args.users)))}
+
+    rules = InsightRules(TeamBaselines.load(args.baselines) if args.baselines else None)
+    started = time.perf_counter()
+    result = rules.evaluate(all_metrics)
+    elapsed = time.perf_counter() - started
+
+    total = len(all_metrics)
+    print(f"✓ Resolved {result['llm_calls_avoided']} of {total} users locally in {elapsed * 1000:.0f}ms "
+          f"({elapsed / max(total, 1) * 1e6:.1f}µs per user); {len(result['escalate'])} escalate to the LLM")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"✓ Saved results to {args.out}")
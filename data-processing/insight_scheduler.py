@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from typing import List, Dict, Any, Optional
+
+# Numeric metrics that feed the prompts, with the smallest change that is
+# considered meaningful on its own (guards the relative test near zero)
+TRACKED_METRICS = {
+    'messages_sent': 5.0,
+    'participation_rate': 0.05,
+    'avg_response_time': 1.0,
+    'collaboration_score': 0.1,
+    'days_since_active': 3.0,
+    'participation_drop': 0.05,
+}
+
+# Categorical metrics: any change makes the user dirty
+TRACKED_LABELS = ('engagement_trend',)
+
+# Question generator to call for each insight type
+QUESTION_GENERATORS = {
+    'underperforming': 'generate_questions_for_underperforming',
+    'overperforming': 'generate_questions_for_overperforming',
+    'silent_quitting': 'generate_questions_for_silent_quitting',
+}
+
+
+def metrics_fingerprint(metrics: Dict[str, Any]) -> str:
+    """Stable hash of the metrics that influence generated questions and insights"""
+    tracked = {key: round(float(metrics.get(key, 0) or 0), 4) for key in TRACKED_METRICS}
+    tracked.update({key: metrics.get(key) for key in TRACKED_LABELS})
+    return hashlib.sha1(json.dumps(tracked, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class InsightScheduler:
+    """Regenerates questions/insights only for users whose metrics actually moved
+
+    Per-user state (fingerprint, metrics and insight type at the last
+    generation, dirty flag) is kept in a JSON file between runs. Dirty users
+    are served by priority, then by how long their insights have been stale,
+    until the run's LLM call budget is spent.
+    """
+
+    def __init__(self, ai, state_path: str = 'insight_schedule.json', threshold: float = 0.15):
+        self.ai = ai
+        self.state_path = state_path
+        self.threshold = threshold
+        self.state: Dict[str, Dict[str, Any]] = {}
+
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state = json.load(f)
+
+    def save(self):
+        """Write the schedule state atomically"""
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _changed(self, previous: Dict[str, Any], current: Dict[str, Any]) -> bool:
+        """True if any tracked metric moved by more than the relative threshold"""
+        for key, floor in TRACKED_METRICS.items():
+            before = float(previous.get(key, 0) or 0)
+            after = float(current.get(key, 0) or 0)
+            if abs(after - before) > self.threshold * max(abs(before), floor):
+                return True
+        return any(previous.get(key) != current.get(key) for key in TRACKED_LABELS)
+
+    def observe(self, user_id: str, metrics: Dict[str, Any], now: Optional[float] = None) -> bool:
+        """Record a user's latest metrics; returns True if the user is (still) dirty"""
+        now = time.time() if now is None else now
+        insight_type = self.ai._determine_insight_type(metrics)
+        fingerprint = metrics_fingerprint(metrics)
+        entry = self.state.get(user_id)
+
+        if entry is None:
+            entry = self.state[user_id] = {'generated_at': None, 'generated_metrics': None,
+                                           'generated_type': None, 'dirty_since': now}
+        entry.update({'fingerprint': fingerprint, 'metrics': metrics, 'insight_type': insight_type})
+
+        if entry['generated_metrics'] is None:
+            dirty = True
+        elif fingerprint == metrics_fingerprint(entry['generated_metrics']):
+            dirty = False
+        else:
+            dirty = insight_type != entry['generated_type'] or self._changed(entry['generated_metrics'], metrics)
+
+        if dirty and entry.get('dirty_since') is None:
+            entry['dirty_since'] = now
+        elif not dirty:
+            entry['dirty_since'] = None
+        return dirty
+
+    def queue(self, now: Optional[float] = None) -> List[str]:
+        """Dirty users, most urgent first: priority, then staleness"""
+        now = time.time() if now is None else now
+        priorities = self.ai.PRIORITIES
+
+        def sort_key(user_id):
+            entry = self.state[user_id]
+            generated_at = entry.get('generated_at')
+            staleness = float('inf') if generated_at is None else now - generated_at
+            return (-priorities.get(entry['insight_type'], 0), -staleness, user_id)
+
+        dirty = [user_id for user_id, entry in self.state.items() if entry.get('dirty_since') is not None]
+        return sorted(dirty, key=sort_key)
+
+    def calls_for(self, user_id: str) -> int:
+        """LLM calls needed to refresh a user (insights, plus questions for flagged types)"""
+        return 2 if self.state[user_id]['insight_type'] in QUESTION_GENERATORS else 1
+
+    def run(self, budget: int = 100, now: Optional[float] = None) -> Dict[str, Any]:
+        """Regenerate dirty users in queue order without exceeding `budget` LLM calls
+
+        Every attempted completion counts against the budget, failed or not.
+        Questions and insights are only stored once both generated, so users
+        whose generation fails stay dirty for the next run with nothing
+        written for them.
+        """
+        now = time.time() if now is None else now
+        queue = self.queue(now)
+        served = []
+        failed = []
+        calls = 0
+
+        for user_id in queue:
+            cost = self.calls_for(user_id)
+            if calls + cost > budget:
+                break
+
+            entry = self.state[user_id]
+            metrics = entry['metrics']
+            insight_type = entry['insight_type']
+            generator = QUESTION_GENERATORS.get(insight_type)
+            questions = None
+            try:
+                if generator:
+                    calls += 1
+                    questions = getattr(self.ai, generator)(user_id, metrics, store=False, fallback=False)
+                calls += 1
+                insights = self.ai.generate_insights(user_id, metrics, store=False, fallback=False)
+
+                self.ai.supabase.table('ai_insights').insert(self.ai.insight_record(user_id, metrics, insights)).execute()
+                if questions:
+                    self.ai.supabase.table('ai_questions').insert(
+                        self.ai.question_records(user_id, insight_type, questions, metrics)).execute()
+            except Exception as e:
+                print(f"Error regenerating {user_id}: {e}")
+                failed.append(user_id)
+                continue
+
+            entry.update({'generated_at': now, 'generated_metrics': metrics,
+                          'generated_type': insight_type, 'dirty_since': None})
+            served.append(user_id)
+
+        self.save()
+        return {
+            'served': served,
+            'llm_calls': calls,
+            'failed': failed,
+            'deferred': len(queue) - len(served) - len(failed),
+            'clean': len(self.state) - len(queue),
+        }
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from ai_insights_api import SlackAnalyticsAI
+    from profiling import Profiler
+
+    parser = argparse.ArgumentParser(description="Regenerate insights for users whose metrics changed")
+    parser.add_argument('metrics_path', help="JSON file mapping user_id -> metrics")
+    parser.add_argument('--state', default='insight_schedule.json', help="Scheduler state file")
+    parser.add_argument('--budget', type=int, default=100, help="Maximum LLM calls for this run")
+    parser.add_argument('--threshold', type=float, default=0.15, help="Relative change that marks a user dirty")
+    parser.add_argument('--baselines', help="Per-team metric sketches (from pipeline.py --baselines) for relative thresholds")
+    parser.add_argument('--profile', action='store_true', default=None, help="Write CPU/allocation profiles")
+    args = parser.parse_args()
+
+    load_dotenv('../.env')  # Load from parent directory
+
+    with open(args.metrics_path) as f:
+        all_metrics = json.load(f)
+
+    ai = SlackAnalyticsAI()
+    if args.baselines:
+        from quantile_sketch import TeamBaselines
+        ai.baselines = TeamBaselines.load(args.baselines)
+    scheduler = InsightScheduler(ai, args.state, threshold=args.threshold)
+    for user_id, metrics in all_metrics.items():
+        scheduler.observe(user_id, metrics)
+
+    with Profiler(enabled=args.profile).stage('insights'):
+        result = scheduler.run(budget=args.budget)
+    print(f"✓ Regenerated {len(result['served'])} users with {result['llm_calls']} LLM calls")
+    if result['failed']:
+        print(f"✗ Generation failed for {len(result['failed'])} users; they stay queued for the next run")
+    print(f"  {result['deferred']} dirty users deferred, {result['clean']} unchanged")
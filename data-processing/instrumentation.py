@@ -0,0 +1,160 @@
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Tuple, Optional, Sequence
+
+# Seconds; suits both DB round trips and LLM calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, Any]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items())) if labels else ()
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    """Monotonic count, optionally split by labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str = ''):
+        self.name = name
+        self.help = help
+        self.values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, labels: Optional[Dict[str, Any]] = None):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return {_format_labels(key) or '': value for key, value in self.values.items()}
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, optionally split by labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str = '', buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Optional[Dict[str, Any]] = None):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), then count and sum
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, count, total) in self.series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    samples.append((f'{self.name}_bucket', key + (('le', le),), cumulative))
+                samples.append((f'{self.name}_count', key, count))
+                samples.append((f'{self.name}_sum', key, total))
+        return samples
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                _format_labels(key) or '': {
+                    'count': count,
+                    'sum': total,
+                    'buckets': dict(zip([repr(b) for b in self.buckets] + ['+Inf'], counts)),
+                }
+                for key, (counts, count, total) in self.series.items()
+            }
+
+
+class MetricsRegistry:
+    """Holds the counters and histograms of one process and exports them"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self.metrics.get(name)
+                if metric is None:
+                    metric = self.metrics[name] = cls(name, help, **kwargs)
+        return metric
+
+    def counter(self, name: str, help: str = '') -> Counter:
+        return self._get(Counter, name, help)
+
+    def histogram(self, name: str, help: str = '', buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Time a pipeline stage into stage_seconds{stage=...}"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram('stage_seconds', 'Wall time spent per stage').observe(
+                time.perf_counter() - started, {'stage': stage})
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            if metric.help:
+                lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for sample_name, key, value in metric.samples():
+                lines.append(f'{sample_name}{_format_labels(key)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serializable view of every metric"""
+        return {
+            'timestamp': time.time(),
+            'metrics': {name: {'type': metric.kind, 'values': metric.snapshot()}
+                        for name, metric in sorted(self.metrics.items())},
+        }
+
+    def write(self, path: str):
+        """Write a .prom text file or, for any other extension, a JSON snapshot"""
+        with open(path, 'w') as f:
+            if path.endswith('.prom'):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), f, indent=2)
+
+
+# Process-wide registry used by the ingest, writer and LLM code paths
+REGISTRY = MetricsRegistry()
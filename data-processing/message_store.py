@@ -0,0 +1,203 @@
+import os
+import json
+import numpy as np
+from typing import List, Dict, Any, Optional, Iterable
+
+STORE_VERSION = 1
+
+# Folded history written next to a compacted store (see compaction.FoldedHistory)
+HISTORY_FILE = 'history.npz'
+
+# Column name -> dtype for the per-message arrays; timestamps are kept as
+# integer microseconds so Slack's "1751044120.240469" strings round-trip exactly
+COLUMNS = {
+    'ts': np.int64,
+    'user': np.int32,
+    'channel': np.int32,
+    'team': np.int32,
+    'thread_ts': np.int64,
+    'reply_count': np.int32,
+    'latest_reply': np.int64,
+    'reaction_count': np.int32,
+}
+
+NO_TS = -1
+MICROS = 1_000_000
+SECONDS_PER_DAY = 86400
+
+
+def parse_ts(value) -> int:
+    """Convert a Slack timestamp ("1751044120.240469") to integer microseconds"""
+    if value is None or value == '':
+        return NO_TS
+    seconds, _, fraction = str(value).partition('.')
+    return int(seconds) * MICROS + int((fraction + '000000')[:6])
+
+
+def format_ts(micros: int) -> str:
+    """Convert integer microseconds back to Slack's timestamp string"""
+    return f"{micros // MICROS}.{micros % MICROS:06d}"
+
+
+class Dictionary:
+    """Interns strings (user, channel and team ids) as dense integer codes"""
+
+    def __init__(self, values: Optional[Iterable[str]] = None):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+        for value in values or []:
+            self.code(value)
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def get(self, value: str, default: int = -1) -> int:
+        return self.codes.get(value, default)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, code: int) -> str:
+        return self.values[code]
+
+
+def write_manifest(directory: str, messages: int, users: Dictionary, channels: Dictionary, teams: Dictionary):
+    """Write store.json for the column files already in a directory (see MessageStore.save)"""
+    history_path = os.path.join(directory, HISTORY_FILE)
+    if os.path.exists(history_path):
+        os.remove(history_path)
+    with open(os.path.join(directory, 'store.json'), 'w') as f:
+        json.dump({
+            'version': STORE_VERSION,
+            'messages': messages,
+            'users': users.values,
+            'channels': channels.values,
+            'teams': teams.values,
+        }, f)
+
+
+class MessageStore:
+    """Columnar, time-ordered store of Slack messages"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], text_offsets: np.ndarray, text_data: bytes,
+                 users: Dictionary, channels: Dictionary, teams: Dictionary):
+        self.columns = columns
+        self.text_offsets = text_offsets
+        self.text_data = text_data
+        self.users = users
+        self.channels = channels
+        self.teams = teams
+
+    def __len__(self):
+        return len(self.columns['ts'])
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        columns = self.__dict__.get('columns', {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def text(self, row: int) -> str:
+        start, end = self.text_offsets[row], self.text_offsets[row + 1]
+        return bytes(self.text_data[start:end]).decode('utf-8')
+
+    def day_index(self) -> np.ndarray:
+        """Day number (days since the epoch, UTC) of every message"""
+        return (self.columns['ts'] // (SECONDS_PER_DAY * MICROS)).astype(np.int32)
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Rebuild the row-oriented view of one message"""
+        thread_ts = int(self.columns['thread_ts'][row])
+        return {
+            'ts': format_ts(int(self.columns['ts'][row])),
+            'user': self.users[int(self.columns['user'][row])],
+            'channel': self.channels[int(self.columns['channel'][row])],
+            'team': self.teams[int(self.columns['team'][row])],
+            'thread_ts': format_ts(thread_ts) if thread_ts != NO_TS else None,
+            'reply_count': int(self.columns['reply_count'][row]),
+            'text': self.text(row),
+        }
+
+    def save(self, directory: str):
+        """Persist the store as one .npy file per column plus a JSON manifest
+
+        Any folded history in the directory is removed: it describes messages
+        a compaction took out of the previous store, which a freshly saved
+        store may hold again. Compaction saves its history after the store.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, values in self.columns.items():
+            np.save(os.path.join(directory, f"{name}.npy"), values)
+        np.save(os.path.join(directory, 'text_offsets.npy'), self.text_offsets)
+        with open(os.path.join(directory, 'text.bin'), 'wb') as f:
+            f.write(self.text_data)
+        write_manifest(directory, len(self), self.users, self.channels, self.teams)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'MessageStore':
+        """Load a saved store; columns are memory-mapped unless mmap=False"""
+        with open(os.path.join(directory, 'store.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported message store version: {manifest.get('version')}")
+
+        mode = 'r' if mmap else None
+        columns = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode) for name in COLUMNS}
+        text_offsets = np.load(os.path.join(directory, 'text_offsets.npy'), mmap_mode=mode)
+        with open(os.path.join(directory, 'text.bin'), 'rb') as f:
+            text_data = f.read()
+        return cls(columns, text_offsets, text_data, Dictionary(manifest['users']),
+                   Dictionary(manifest['channels']), Dictionary(manifest['teams']))
+
+
+class MessageStoreBuilder:
+    """Accumulates parsed export messages and freezes them into a MessageStore"""
+
+    def __init__(self):
+        self.users = Dictionary()
+        self.channels = Dictionary()
+        self.teams = Dictionary()
+        self._rows: Dict[str, List[int]] = {name: [] for name in COLUMNS}
+        self._texts: List[bytes] = []
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, channel: str, msg: Dict[str, Any]) -> bool:
+        """Append one export message; returns False for entries without a user"""
+        user = msg.get('user')
+        if not user:
+            return False
+
+        rows = self._rows
+        rows['ts'].append(parse_ts(msg.get('ts')))
+        rows['user'].append(self.users.code(user))
+        rows['channel'].append(self.channels.code(channel))
+        rows['team'].append(self.teams.code(msg.get('user_team') or msg.get('team') or ''))
+        rows['thread_ts'].append(parse_ts(msg.get('thread_ts')))
+        rows['reply_count'].append(msg.get('reply_count') or 0)
+        rows['latest_reply'].append(parse_ts(msg.get('latest_reply')))
+        rows['reaction_count'].append(sum(r.get('count', 1) for r in msg.get('reactions') or [] if isinstance(r, dict)))
+        self._texts.append((msg.get('text') or '').encode('utf-8'))
+        return True
+
+    def add_many(self, channel: str, messages: Iterable[Dict[str, Any]]) -> int:
+        return sum(1 for msg in messages if self.add(channel, msg))
+
+    def build(self) -> MessageStore:
+        """Sort everything by timestamp and return the columnar store"""
+        columns = {name: np.asarray(values, dtype=dtype) for name, dtype in COLUMNS.items()
+                   for values in [self._rows[name]]}
+        order = np.argsort(columns['ts'], kind='stable')
+        columns = {name: values[order] for name, values in columns.items()}
+
+        texts = [self._texts[i] for i in order]
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+        text_offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=text_offsets[1:])
+
+        return MessageStore(columns, text_offsets, b''.join(texts), self.users, self.channels, self.teams)
@@ -0,0 +1,23 @@
+-- Unique key the analytics materializer upserts on
+-- (on_conflict=user_id,metric_type,period_start,period_end).
+--
+-- New projects get it from the CREATE TABLE printed by tests/setup_supabase.py;
+-- run this once in the Supabase SQL editor for an analytics table created
+-- before the key existed. Safe to re-run.
+
+begin;
+
+-- Keep only the newest row of any (user, metric, period) duplicates, which
+-- the index below would otherwise reject
+delete from public.analytics a
+using public.analytics b
+where a.user_id is not distinct from b.user_id
+  and a.metric_type = b.metric_type
+  and a.period_start = b.period_start
+  and a.period_end = b.period_end
+  and (a.created_at, a.id) < (b.created_at, b.id);
+
+create unique index if not exists analytics_period
+    on public.analytics (user_id, metric_type, period_start, period_end);
+
+commit;
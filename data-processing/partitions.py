@@ -0,0 +1,368 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+from slack_export import SlackExportReader, parse_members, balanced_groups
+from message_store import MessageStore, MessageStoreBuilder, parse_ts, NO_TS, MICROS, SECONDS_PER_DAY
+from thread_index import ThreadIndex
+from engagement_metrics import DEFAULT_RESPONSE_HOURS
+from trend_engine import estimate_trends
+from quantile_sketch import TeamBaselines
+from instrumentation import REGISTRY
+
+PARTITION_MESSAGES = REGISTRY.counter('partition_messages_total', "Messages routed to each team partition")
+
+
+def partition_key(msg: Dict[str, Any]) -> str:
+    """Workspace a message belongs to: its author's team (shared channels mix several)"""
+    return msg.get('user_team') or msg.get('team') or msg.get('source_team') or ''
+
+
+def split_members(path: str, names: List[str], channel_ids: Dict[str, str], spill: str) -> Dict[str, Any]:
+    """Worker entry point: parse day-files and spill their messages by team
+
+    Each team's (channel_id, message) pairs go to `<spill>-<n>.jsonl` and
+    the group's thread roots also to `<spill>-roots.jsonl`, so the parent
+    only sees counts and thread keys, never the messages themselves.
+    """
+    files: Dict[str, Any] = {}
+    counts: Counter = Counter()
+    roots: List[Tuple[str, str, str]] = []
+    replied: Dict[str, set] = defaultdict(set)
+    as_of = NO_TS
+    with open(f"{spill}-roots.jsonl", 'w') as root_file:
+        for name, messages in zip(names, parse_members(path, names)):
+            channel = name.split('/')[-2] if '/' in name else ''
+            channel_id = channel_ids.get(channel, channel)
+            for msg in messages:
+                if not msg.get('user'):
+                    continue
+                team = partition_key(msg)
+                if team not in files:
+                    files[team] = open(f"{spill}-{len(files)}.jsonl", 'w')
+                line = json.dumps([channel_id, msg]) + '\n'
+                files[team].write(line)
+                counts[team] += 1
+                as_of = max(as_of, parse_ts(msg.get('ts')))
+                if msg.get('thread_ts'):
+                    if msg['thread_ts'] == msg.get('ts'):
+                        roots.append((channel_id, msg['ts'], team))
+                        root_file.write(line)
+                    else:
+                        replied[team].add((channel_id, msg['thread_ts']))
+    for f in files.values():
+        f.close()
+    return {
+        'files': {team: f.name for team, f in files.items()},
+        'counts': dict(counts),
+        'roots': roots,
+        'roots_file': f"{spill}-roots.jsonl",
+        'replied': {team: list(keys) for team, keys in replied.items()},
+        'as_of': as_of,
+    }
+
+
+def _read_spill(path: str):
+    with open(path) as f:
+        for line in f:
+            channel_id, msg = json.loads(line)
+            yield channel_id, msg
+
+
+def _context_rows(store: MessageStore, context: List[Tuple[str, Dict[str, Any]]]) -> np.ndarray:
+    """Mask of the store rows that came from `context` rather than the team's own messages"""
+    mask = np.zeros(len(store), dtype=bool)
+    if context:
+        keys = {(store.channels.get(channel_id), parse_ts(msg.get('ts'))) for channel_id, msg in context}
+        ts, channels = store.columns['ts'], store.columns['channel']
+        for row in np.flatnonzero(np.isin(ts, [t for _, t in keys])).tolist():
+            mask[row] = (int(channels[row]), int(ts[row])) in keys
+    return mask
+
+
+def user_totals(store: MessageStore, threads: ThreadIndex, own: np.ndarray, window_days: int,
+                as_of: int) -> Dict[str, Dict[str, Any]]:
+    """Additive per-user activity for the rows in `own`, which merge_partitions sums across teams
+
+    These are the inputs of compute_user_metrics rather than its outputs:
+    daily message counts, channels, threaded messages, first-answer totals,
+    team counts and the last message, for every user with an own row.
+    """
+    n_users = len(store.users)
+    ts = store.columns['ts']
+    users = store.columns['user']
+    day_micros = SECONDS_PER_DAY * MICROS
+    window_start = as_of - window_days * day_micros
+
+    in_window = own & (ts > window_start) & (ts <= as_of)
+    w_users = users[in_window].astype(np.int64)
+    w_days = (ts[in_window] - window_start - 1) // day_micros
+    daily = np.bincount(w_users * window_days + w_days, minlength=n_users * window_days).reshape(n_users, window_days)
+    threaded = np.bincount(w_users[store.columns['thread_ts'][in_window] != NO_TS], minlength=n_users)
+    channels: Dict[int, set] = defaultdict(set)
+    for user, channel in set(zip(w_users.tolist(), store.columns['channel'][in_window].tolist())):
+        channels[user].add(store.channels[channel])
+
+    answer_micros, answer_counts = threads.response_totals(store)
+    n_teams = max(len(store.teams), 1)
+    team_counts = np.bincount(users[own].astype(np.int64) * n_teams + store.columns['team'][own],
+                              minlength=n_users * n_teams).reshape(n_users, n_teams)
+    last_seen = np.full(n_users, NO_TS, dtype=np.int64)
+    np.maximum.at(last_seen, users[own], ts[own])
+
+    totals = {}
+    for code in np.unique(users[own]).tolist():
+        totals[store.users[code]] = {
+            'daily': daily[code].tolist(),
+            'channels': sorted(channels[code]),
+            'threaded': int(threaded[code]),
+            'answer_micros': float(answer_micros[code]),
+            'answer_counts': int(answer_counts[code]),
+            'teams': {store.teams[t]: int(n) for t, n in enumerate(team_counts[code].tolist()) if n},
+            'last_seen': int(last_seen[code]),
+        }
+    return totals
+
+
+def aggregate_partition(team: str, files: List[str], roots_files: List[str], context_keys: List[Tuple[str, str]],
+                        window_days: int, as_of: int, store_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Worker entry point: ingest, index and aggregate one team's messages
+
+    The worker reads the team's own spill files. `context_keys` names the
+    thread roots from other teams that this team replied to; they are read
+    from the roots files and make response times and cross-team answers
+    computable but are not counted as the team's own activity.
+    """
+    builder = MessageStoreBuilder()
+    channel_counts: Counter = Counter()
+    for path in files:
+        for channel_id, msg in _read_spill(path):
+            builder.add(channel_id, msg)
+            channel_counts[channel_id] += 1
+    messages = len(builder)
+
+    context = []
+    wanted = {tuple(key) for key in context_keys}
+    for path in roots_files if wanted else []:
+        context.extend((channel_id, msg) for channel_id, msg in _read_spill(path) if (channel_id, msg['ts']) in wanted)
+    for channel_id, msg in context:
+        builder.add(channel_id, msg)
+    store = builder.build()
+    threads = ThreadIndex.build(store)
+    if store_dir:
+        store.save(store_dir)
+        threads.save(store_dir)
+
+    own = ~_context_rows(store, context)
+    totals = user_totals(store, threads, own, window_days, as_of)
+
+    # Answers this team's users gave to threads started in other teams
+    responders, authors, _ = threads.answers(store)
+    own_users = {store.users.get(user_id) for user_id in totals}
+    context_team = {store.users.get(msg['user']): partition_key(msg) for _, msg in context}
+    cross_answers = Counter()
+    for responder, author in zip(responders.tolist(), authors.tolist()):
+        if responder in own_users and author in context_team:
+            cross_answers[context_team[author]] += 1
+
+    return {
+        'team': team,
+        'messages': messages,
+        'users': totals,
+        'channels': dict(channel_counts),
+        'threads': len(threads),
+        'cross_team_answers': dict(cross_answers),
+    }
+
+
+def metrics_from_totals(totals: Dict[str, Dict[str, Any]], window_days: int, as_of: int) -> Dict[str, Dict[str, Any]]:
+    """compute_user_metrics' per-user metrics from summed user_totals"""
+    if not totals:
+        return {}
+    user_ids = list(totals)
+    daily = np.array([totals[u]['daily'] for u in user_ids], dtype=np.float64).reshape(len(user_ids), window_days)
+    trends = estimate_trends(daily)
+    day_micros = SECONDS_PER_DAY * MICROS
+
+    metrics = {}
+    for i, user_id in enumerate(user_ids):
+        t = totals[user_id]
+        if t['answer_counts']:
+            response_hours = t['answer_micros'] / t['answer_counts'] / MICROS / 3600.0
+        else:
+            response_hours = DEFAULT_RESPONSE_HOURS
+        metrics[user_id] = {
+            'messages_sent': int(daily[i].sum()),
+            'participation_rate': float(np.count_nonzero(daily[i]) / window_days),
+            'avg_response_time': float(response_hours),
+            'collaboration_score': float(min(5.0, len(t['channels']) * 0.5 + t['threaded'] * 0.1)),
+            'engagement_trend': str(trends['engagement_trend'][i]),
+            'trend_confidence': float(trends['trend_confidence'][i]),
+            'participation_drop': float(trends['participation_drop'][i]),
+            'days_since_active': int(max((as_of - t['last_seen']) // day_micros, 0)),
+            'team': max(t['teams'].items(), key=lambda item: item[1])[0] if t['teams'] else '',
+        }
+    return metrics
+
+
+def merge_partitions(aggregates: List[Dict[str, Any]], window_days: int = 30, as_of: int = NO_TS) -> Dict[str, Any]:
+    """Combine per-team aggregates into organization-wide and cross-team results
+
+    A user who posts from several teams has totals in each partition; they
+    are summed before the metrics and team baselines are computed.
+    """
+    teams = {}
+    totals: Dict[str, Dict[str, Any]] = {}
+    channel_teams: Dict[str, Dict[str, int]] = defaultdict(dict)
+    cross_answers = {}
+
+    for aggregate in aggregates:
+        team = aggregate['team']
+        teams[team] = {'messages': aggregate['messages'], 'users': len(aggregate['users']),
+                       'channels': len(aggregate['channels']), 'threads': aggregate['threads']}
+        for user_id, part in aggregate['users'].items():
+            total = totals.get(user_id)
+            if total is None:
+                totals[user_id] = dict(part, channels=set(part['channels']), teams=Counter(part['teams']))
+                continue
+            total['daily'] = [a + b for a, b in zip(total['daily'], part['daily'])]
+            total['channels'].update(part['channels'])
+            total['teams'].update(part['teams'])
+            total['last_seen'] = max(total['last_seen'], part['last_seen'])
+            for key in ('threaded', 'answer_micros', 'answer_counts'):
+                total[key] += part[key]
+        for channel_id, count in aggregate['channels'].items():
+            channel_teams[channel_id][team] = count
+        for other, count in aggregate['cross_team_answers'].items():
+            cross_answers[f"{team}->{other}"] = count
+
+    metrics = metrics_from_totals(totals, window_days, as_of)
+    baselines = TeamBaselines()
+    for user_metrics in metrics.values():
+        baselines.update(user_metrics['team'], user_metrics)
+
+    shared = [{'channel': channel_id, 'teams': counts} for channel_id, counts in sorted(channel_teams.items())
+              if len(counts) > 1]
+    return {
+        'teams': teams,
+        'org': {'messages': sum(t['messages'] for t in teams.values()), 'users': len(metrics),
+                'teams': len(teams), 'channels': len(channel_teams)},
+        'shared_channels': shared,
+        'cross_team_answers': cross_answers,
+        'metrics': metrics,
+        'baselines': baselines,
+    }
+
+
+class PartitionedProcessor:
+    """Processes a multi-workspace export as independent per-team partitions
+
+    Day-files are parsed in a process pool and each worker spills its
+    messages to per-team files (map). Every team's worker then reads only
+    its own team's files into a message store, indexes and aggregates it
+    (reduce), and merge_partitions() sums the per-user totals and derives
+    the cross-team results. The parent only handles counts and thread keys,
+    so a new workspace adds one more parallel reduce task rather than
+    serial time.
+    """
+
+    def __init__(self, export_path: str, workers: int = 4, window_days: int = 30, store_root: Optional[str] = None):
+        self.export_path = export_path
+        self.workers = max(1, workers)
+        self.window_days = window_days
+        self.store_root = store_root
+
+    def _split(self, pool: ProcessPoolExecutor, spill_dir: str) -> List[Dict[str, Any]]:
+        with SlackExportReader(self.export_path) as reader:
+            members = reader.members()
+            channel_ids = {c['name']: c['id'] for c in reader.read_metadata('channels.json') if 'name' in c and 'id' in c}
+        futures = [pool.submit(split_members, self.export_path, [m.name for m in group], channel_ids,
+                               os.path.join(spill_dir, f"group-{i:04d}"))
+                   for i, group in enumerate(balanced_groups(members, self.workers * 4))]
+        splits = [future.result() for future in futures]
+        for split in splits:
+            for team, count in split['counts'].items():
+                PARTITION_MESSAGES.inc(count, {'team': team})
+        return splits
+
+    @staticmethod
+    def _context(splits: List[Dict[str, Any]]) -> Dict[str, List[Tuple[str, str]]]:
+        """Keys of the foreign thread roots each team replied to"""
+        owners = {(channel_id, ts): team for split in splits for channel_id, ts, team in split['roots']}
+        context: Dict[str, set] = defaultdict(set)
+        for split in splits:
+            for team, keys in split['replied'].items():
+                for channel_id, thread_ts in keys:
+                    owner = owners.get((channel_id, thread_ts))
+                    if owner is not None and owner != team:
+                        context[team].add((channel_id, thread_ts))
+        return {team: sorted(keys) for team, keys in context.items()}
+
+    def run(self) -> Dict[str, Any]:
+        started = time.monotonic()
+        aggregates = []
+        as_of = NO_TS
+        if self.store_root:
+            os.makedirs(self.store_root, exist_ok=True)
+        spill_dir = tempfile.mkdtemp(prefix='.partitions-', dir=self.store_root)
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                with REGISTRY.timer('partition_route'):
+                    splits = self._split(pool, spill_dir)
+                files: Dict[str, List[str]] = defaultdict(list)
+                for split in splits:
+                    for team, path in split['files'].items():
+                        files[team].append(path)
+                if files:
+                    # One window end for every team so their metrics line up
+                    as_of = max(split['as_of'] for split in splits)
+                    context = self._context(splits)
+                    roots_files = [split['roots_file'] for split in splits]
+
+                    with REGISTRY.timer('partition_aggregate'):
+                        futures = [pool.submit(aggregate_partition, team, paths, roots_files, context.get(team, []),
+                                               self.window_days, as_of,
+                                               os.path.join(self.store_root, team or 'unknown') if self.store_root else None)
+                                   for team, paths in files.items()]
+                        aggregates = [future.result() for future in futures]
+        finally:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+        result = merge_partitions(aggregates, self.window_days, as_of)
+        result['elapsed'] = time.monotonic() - started
+        return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Process a multi-workspace export as per-team partitions")
+    parser.add_argument('export_path', help="Slack export .zip archive or extracted directory")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--window-days', type=int, default=30, help="Metrics window")
+    parser.add_argument('--store-root', help="Write each team's message store and thread index under this directory")
+    parser.add_argument('--out', help="Write the merged results (teams, org totals, shared channels, metrics) as JSON")
+    parser.add_argument('--baselines', help="Save the merged per-team metric sketches here")
+    args = parser.parse_args()
+
+    result = PartitionedProcessor(args.export_path, args.workers, args.window_days, args.store_root).run()
+    print(f"✓ Processed {result['org']['messages']} messages from {result['org']['users']} users "
+          f"in {result['org']['teams']} teams ({result['elapsed']:.1f}s)")
+    for team, summary in sorted(result['teams'].items()):
+        print(f"  {team or '(no team)'}: {summary['messages']} messages, {summary['users']} users, {summary['threads']} threads")
+    for shared in result['shared_channels']:
+        print(f"  shared channel {shared['channel']}: " + ", ".join(f"{t} {n}" for t, n in shared['teams'].items()))
+    for pair, count in sorted(result['cross_team_answers'].items()):
+        print(f"  {pair}: {count} thread answers")
+
+    if args.baselines:
+        result['baselines'].save(args.baselines)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({key: value for key, value in result.items() if key != 'baselines'}, f, indent=2)
+        print(f"✓ Saved results to {args.out}")
@@ -0,0 +1,308 @@
+import os
+import time
+import asyncio
+import argparse
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from slack_export import SlackExportReader, parse_members, message_record, balanced_groups, record_day_file, resolve_channel_id
+from message_store import MessageStore, MessageStoreBuilder
+from thread_index import ThreadIndex
+from engagement_metrics import compute_user_metrics
+from insight_scheduler import QUESTION_GENERATORS
+from batch_writer import BatchWriter
+from instrumentation import REGISTRY
+from profiling import Profiler, profile_call, untrace
+from warm_state import WarmState
+from dedup import MessageDeduplicator
+from analytics_materializer import AnalyticsMaterializer
+from quantile_sketch import TeamBaselines
+from snapshot import write_snapshot
+from insight_rules import InsightRules
+
+# Marks the end of a stage's input
+DONE = None
+
+
+class Pipeline:
+    """Export -> metrics -> classification -> insights -> database, as overlapping stages
+
+    Each stage is a group of asyncio workers connected to the next by a
+    bounded queue, so a slow stage applies backpressure upstream instead of
+    letting parsed data pile up in memory. Message rows are written while
+    later day-files are still being parsed, and insights are persisted as
+    soon as each user's completion returns.
+    """
+
+    def __init__(self, export_path: str, ai, writer: BatchWriter, store_dir: Optional[str] = None,
+                 ingest_workers: int = 4, insight_workers: int = 8, queue_size: int = 64,
+                 window_days: int = 30, generate_insights: bool = True, profiler: Optional[Profiler] = None,
+                 warm_state_path: Optional[str] = None, dedup: Optional[MessageDeduplicator] = None,
+                 analytics: Optional[AnalyticsMaterializer] = None, baselines_path: Optional[str] = None,
+                 snapshot_path: Optional[str] = None, rules: Optional[InsightRules] = None):
+        self.export_path = export_path
+        self.ai = ai
+        self.writer = writer
+        self.store_dir = store_dir
+        self.ingest_workers = max(1, ingest_workers)
+        self.insight_workers = max(1, insight_workers)
+        self.queue_size = queue_size
+        self.window_days = window_days
+        self.generate_insights = generate_insights
+        self.profiler = profiler or Profiler()
+        self.warm_state_path = warm_state_path
+        self.dedup = dedup
+        self.analytics = analytics
+        self.baselines_path = baselines_path
+        self.snapshot_path = snapshot_path
+        self.rules = rules
+        self._rule_insights: Dict[str, Dict[str, Any]] = {}
+        self.stats: Dict[str, Any] = {'day_files': 0, 'messages': 0, 'duplicates': 0, 'users': 0,
+                                      'analytics_rows': 0, 'insights': 0, 'questions': 0, 'llm_calls_avoided': 0}
+
+    def run(self) -> Dict[str, Any]:
+        return asyncio.run(self.run_async())
+
+    async def run_async(self) -> Dict[str, Any]:
+        started = time.monotonic()
+        day_queue = asyncio.Queue(self.queue_size)
+        user_queue = asyncio.Queue(self.queue_size)
+        insight_queue = asyncio.Queue(self.queue_size)
+        persist_queue = asyncio.Queue(self.queue_size)
+
+        with SlackExportReader(self.export_path) as reader, \
+                ProcessPoolExecutor(max_workers=self.ingest_workers, initializer=untrace) as pool:
+            members = reader.members()
+            channel_ids = {c['name']: c['id'] for c in reader.read_metadata('channels.json') if 'name' in c and 'id' in c}
+            groups = asyncio.Queue()
+            for group in balanced_groups(members, self.ingest_workers * 8):
+                groups.put_nowait(group)
+
+            await asyncio.gather(
+                self._group('ingest', [self._ingest(pool, groups, day_queue) for _ in range(self.ingest_workers)], day_queue, 1),
+                self._group('metrics', [self._metrics(day_queue, user_queue, persist_queue, channel_ids)], user_queue, 1,
+                            profile=False),
+                self._group('classify', [self._classify(user_queue, insight_queue)], insight_queue, self.insight_workers,
+                            profile=False),
+                self._group('insights', [self._insights(insight_queue, persist_queue) for _ in range(self.insight_workers)], persist_queue, 1),
+                self._group('persist', [self._persist(persist_queue)], None, 0),
+            )
+
+        # Only remember messages once their rows are written
+        if self.dedup:
+            self.dedup.save()
+        if self.analytics:
+            self.analytics.save()
+        self.stats['elapsed'] = time.monotonic() - started
+        self.stats['rows_written'] = self.writer.rows_written
+        self.stats['round_trips'] = self.writer.round_trips
+        return self.stats
+
+    async def _group(self, stage: str, workers: List, downstream: Optional[asyncio.Queue], downstream_workers: int,
+                     profile: bool = True):
+        """Run a stage's workers, then tell every downstream worker the stage is finished
+
+        Stages share the event loop thread, so each is profiled through the
+        work it hands to threads and processes (see Profiler.profiled);
+        metrics profiles its steps itself.
+        """
+        with REGISTRY.timer(stage), (self.profiler.stage(stage, cpu=False) if profile else nullcontext()):
+            await asyncio.gather(*workers)
+        for _ in range(downstream_workers):
+            await downstream.put(DONE)
+
+    async def _ingest(self, pool: ProcessPoolExecutor, groups: asyncio.Queue, day_queue: asyncio.Queue):
+        """Parse groups of day-files in worker processes"""
+        loop = asyncio.get_running_loop()
+        while not groups.empty():
+            group = groups.get_nowait()
+            names = [m.name for m in group]
+            if self.profiler.enabled:
+                results, stats = await loop.run_in_executor(pool, profile_call, parse_members, self.export_path, names)
+                self.profiler.collect('ingest', stats)
+            else:
+                results = await loop.run_in_executor(pool, parse_members, self.export_path, names)
+            for member, messages in zip(group, results):
+                record_day_file(member, messages)
+                await day_queue.put((member, messages))
+
+    async def _metrics(self, day_queue: asyncio.Queue, user_queue: asyncio.Queue, persist_queue: asyncio.Queue,
+                       channel_ids: Dict[str, str]):
+        """Build the message store while streaming raw rows to the writer, then emit per-user metrics"""
+        builder = MessageStoreBuilder()
+        channels: Dict[str, str] = {}
+        users = set()
+
+        while True:
+            item = await day_queue.get()
+            if item is DONE:
+                break
+            member, messages = item
+            self.stats['day_files'] += 1
+
+            channel_id = channels.get(member.channel)
+            if channel_id is None:
+                channel_id = channels[member.channel] = resolve_channel_id(member.channel, channel_ids)
+                await persist_queue.put(('channels', [{"id": channel_id, "name": member.channel, "is_channel": True}]))
+
+            new_users = []
+            records = []
+            for msg in messages:
+                if not builder.add(channel_id, msg):
+                    continue
+                if msg['user'] not in users:
+                    users.add(msg['user'])
+                    new_users.append({"id": msg['user'], "name": msg['user']})
+                self.stats['messages'] += 1
+                # Metrics see the whole export; rows from earlier imports are not written again
+                if self.dedup and self.dedup.seen(channel_id, msg):
+                    self.stats['duplicates'] += 1
+                    continue
+                records.append(message_record(msg, channel_id))
+
+            if new_users:
+                await persist_queue.put(('users', new_users))
+            if records:
+                await persist_queue.put(('messages', records))
+
+        # Metrics need the complete history, so they start once ingest is finished
+        profiled = self.profiler.profiled
+        with self.profiler.stage('store', cpu=False):
+            store = await asyncio.to_thread(profiled, 'store', builder.build)
+            threads = await asyncio.to_thread(profiled, 'store', ThreadIndex.build, store)
+            if self.store_dir:
+                await asyncio.to_thread(profiled, 'store', store.save, self.store_dir)
+                await asyncio.to_thread(profiled, 'store', threads.save, self.store_dir)
+            if self.snapshot_path:
+                await asyncio.to_thread(profiled, 'store', write_snapshot, self.snapshot_path, store, threads,
+                                        {'export': self.export_path})
+        if self.analytics:
+            with self.profiler.stage('analytics', cpu=False):
+                for rows in await asyncio.to_thread(profiled, 'analytics', list, self.analytics.rows(store, threads)):
+                    self.stats['analytics_rows'] += len(rows)
+                    await persist_queue.put(('analytics', rows))
+        with self.profiler.stage('metrics', cpu=False):
+            all_metrics = await self._user_metrics(store, threads)
+
+        for user_id, metrics in all_metrics.items():
+            self.stats['users'] += 1
+            await user_queue.put((user_id, metrics))
+
+    async def _user_metrics(self, store: MessageStore, threads: ThreadIndex) -> Dict[str, Dict[str, Any]]:
+        """Every user's metrics, with the team baselines, rule insights and warm state derived from them"""
+        profiled = self.profiler.profiled
+        all_metrics = await asyncio.to_thread(profiled, 'metrics', compute_user_metrics, store, threads, self.window_days)
+
+        # Classification ranks users within their team, so every user is sketched before any is emitted
+        baselines = TeamBaselines()
+        for metrics in all_metrics.values():
+            baselines.update(metrics['team'], metrics)
+        self.ai.baselines = baselines
+        if self.baselines_path:
+            await asyncio.to_thread(profiled, 'metrics', baselines.save, self.baselines_path)
+        if self.rules and self.generate_insights:
+            # Clear-cut users get their insights locally; only the rest reach the LLM
+            self.rules.baselines = baselines
+            resolved = await asyncio.to_thread(profiled, 'metrics', self.rules.evaluate, all_metrics)
+            self._rule_insights = resolved['insights']
+            self.stats['llm_calls_avoided'] = resolved['llm_calls_avoided']
+        if self.warm_state_path:
+            insight_types = {user_id: self.ai._determine_insight_type(m) for user_id, m in all_metrics.items()}
+            await asyncio.to_thread(profiled, 'metrics', WarmState(all_metrics, insight_types).save, self.warm_state_path)
+        return all_metrics
+
+    async def _classify(self, user_queue: asyncio.Queue, insight_queue: asyncio.Queue):
+        """Attach the insight type that decides which questions to generate"""
+        while True:
+            item = await user_queue.get()
+            if item is DONE:
+                break
+            user_id, metrics = item
+            await insight_queue.put((user_id, metrics, self.ai._determine_insight_type(metrics)))
+
+    async def _insights(self, insight_queue: asyncio.Queue, persist_queue: asyncio.Queue):
+        """Generate questions and insights; rows go to the persistence stage"""
+        profiled = self.profiler.profiled
+        while True:
+            item = await insight_queue.get()
+            if item is DONE:
+                break
+            if not self.generate_insights:
+                continue
+            user_id, metrics, insight_type = item
+
+            generator = QUESTION_GENERATORS.get(insight_type)
+            if generator:
+                questions = await asyncio.to_thread(profiled, 'insights', getattr(self.ai, generator), user_id, metrics, False)
+                await persist_queue.put(('ai_questions', self.ai.question_records(user_id, insight_type, questions, metrics)))
+                self.stats['questions'] += len(questions)
+
+            insights = self._rule_insights.get(user_id)
+            if insights is None:
+                insights = await asyncio.to_thread(profiled, 'insights', self.ai.generate_insights, user_id, metrics, False)
+            await persist_queue.put(('ai_insights', [self.ai.insight_record(user_id, metrics, insights)]))
+            self.stats['insights'] += 1
+
+    async def _persist(self, persist_queue: asyncio.Queue):
+        """Write rows in batches; flushes run in a thread so the loop keeps draining"""
+        while True:
+            item = await persist_queue.get()
+            if item is DONE:
+                break
+            table, rows = item
+            if self.writer.add_many(table, rows):
+                await asyncio.to_thread(self.profiler.profiled, 'persist', self.writer.flush)
+        await asyncio.to_thread(self.profiler.profiled, 'persist', self.writer.flush)
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from ai_insights_api import SlackAnalyticsAI
+
+    parser = argparse.ArgumentParser(description="Run the export -> insights pipeline")
+    parser.add_argument('export_path', help="Slack export .zip archive or extracted directory")
+    parser.add_argument('--store-dir', help="Also write the local message store and thread index here")
+    parser.add_argument('--ingest-workers', type=int, default=os.cpu_count() or 1, help="Processes parsing day-files")
+    parser.add_argument('--insight-workers', type=int, default=8, help="Concurrent LLM generations")
+    parser.add_argument('--queue-size', type=int, default=64, help="Capacity of each stage queue")
+    parser.add_argument('--batch-size', type=int, default=500, help="Rows per database write")
+    parser.add_argument('--window-days', type=int, default=30, help="Metrics window")
+    parser.add_argument('--no-insights', action='store_true', help="Import and compute metrics only")
+    parser.add_argument('--metrics-out', help="Write run metrics here (.prom for Prometheus text, otherwise JSON)")
+    parser.add_argument('--profile', action='store_true', default=None, help="Write CPU/allocation profiles")
+    parser.add_argument('--warm-state', help="Write a warm-state snapshot for fast agent cold starts")
+    parser.add_argument('--analytics-state', help="Materialize the analytics table, tracking done periods in this file")
+    parser.add_argument('--baselines', help="Save the per-team metric sketches used for classification here")
+    parser.add_argument('--dedup-state', help="Skip messages already imported by runs sharing this state path")
+    parser.add_argument('--snapshot', help="Write a memory-mapped workspace snapshot for fast readers here")
+    parser.add_argument('--rules', action='store_true', help="Answer clear-cut users with local rules, escalating only ambiguous ones")
+    args = parser.parse_args()
+
+    load_dotenv('../.env')  # Load from parent directory
+
+    ai = SlackAnalyticsAI()
+    pipeline = Pipeline(args.export_path, ai, BatchWriter(ai.supabase, args.batch_size), store_dir=args.store_dir,
+                        ingest_workers=args.ingest_workers, insight_workers=args.insight_workers,
+                        queue_size=args.queue_size, window_days=args.window_days,
+                        generate_insights=not args.no_insights, profiler=Profiler(enabled=args.profile),
+                        warm_state_path=args.warm_state,
+                        dedup=MessageDeduplicator(args.dedup_state) if args.dedup_state else None,
+                        analytics=AnalyticsMaterializer(args.analytics_state) if args.analytics_state else None,
+                        baselines_path=args.baselines, snapshot_path=args.snapshot,
+                        rules=InsightRules() if args.rules else None)
+    stats = pipeline.run()
+
+    print(f"✓ Parsed {stats['day_files']} day-files, {stats['messages']} messages, {stats['users']} users")
+    if stats['duplicates']:
+        print(f"✓ Skipped {stats['duplicates']} messages already imported")
+    if stats['analytics_rows']:
+        print(f"✓ Materialized {stats['analytics_rows']} analytics rows")
+    print(f"✓ Generated {stats['insights']} insights and {stats['questions']} questions")
+    if stats['llm_calls_avoided']:
+        print(f"✓ Answered {stats['llm_calls_avoided']} users with local rules (LLM calls avoided)")
+    print(f"✓ Wrote {stats['rows_written']} rows in {stats['round_trips']} round trips ({stats['elapsed']:.1f}s)")
+    
+    if args.metrics_out:
+        REGISTRY.write(args.metrics_out)
+        print(f"✓ Saved run metrics to {args.metrics_out}")
@@ -0,0 +1,168 @@
+import io
+import os
+import time
+import cProfile
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Set PEPITO_PROFILE=1 (or pass --profile) to capture per-stage reports
+PROFILE_ENV = 'PEPITO_PROFILE'
+PROFILE_DIR_ENV = 'PEPITO_PROFILE_DIR'
+
+
+def profiling_requested() -> bool:
+    return os.getenv(PROFILE_ENV, '').lower() in ('1', 'true', 'yes', 'on')
+
+
+class CallStats:
+    """Profile of a call made in a worker process, in the form pstats.Stats reads"""
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def profile_call(function: Callable[..., Any], *args, **kwargs) -> Tuple[Any, CallStats]:
+    """Worker-process side of profiling: call function under cProfile and return (result, its stats)"""
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        profile.disable()
+    profile.create_stats()
+    return result, CallStats(profile.stats)
+
+
+def untrace():
+    """Process pool initializer: forked workers inherit allocation tracing they never report, so stop it"""
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+class Profiler:
+    """Opt-in CPU and allocation profiling of named stages
+
+    Each stage writes a timestamped text report (top functions by cumulative
+    time and top allocation sites) plus the raw .prof file for tools such as
+    snakeviz. When disabled, stage() costs nothing but a generator frame.
+
+    cProfile only follows the calling thread, so work handed to thread or
+    process pools shows up as time spent waiting. Functions run through
+    profiled() are profiled in the thread that runs them, and worker
+    processes can return profile_call() stats for collect(); both are
+    merged into the report of the stage they name. Stages that overlap on
+    one thread (e.g. asyncio tasks) pass cpu=False and rely on those.
+    tracemalloc sees every thread of this process, so overlapping stages
+    share its peak and skip the allocation-site diff, which could not tell
+    them apart.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, output_dir: Optional[str] = None, top_n: int = 30):
+        self.enabled = profiling_requested() if enabled is None else enabled
+        self.output_dir = output_dir or os.getenv(PROFILE_DIR_ENV, 'profiles')
+        self.top_n = top_n
+        self.run_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.reports: List[str] = []
+        self._lock = threading.Lock()
+        self._active = 0
+        self._owns_tracing = False
+        self._thread_profiles: Dict[str, List[cProfile.Profile]] = {}
+
+    @contextmanager
+    def stage(self, name: str, cpu: bool = True):
+        if not self.enabled:
+            yield
+            return
+
+        with self._lock:
+            if self._active == 0:
+                self._owns_tracing = not tracemalloc.is_tracing()
+                if self._owns_tracing:
+                    tracemalloc.start(25)
+                tracemalloc.reset_peak()
+            self._active += 1
+        before = tracemalloc.take_snapshot() if cpu else None
+
+        profile = cProfile.Profile() if cpu else None
+        started = time.perf_counter()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            elapsed = time.perf_counter() - started
+            after = tracemalloc.take_snapshot() if cpu else None
+            current, peak = tracemalloc.get_traced_memory()
+            with self._lock:
+                self._active -= 1
+                if self._active == 0 and self._owns_tracing:
+                    tracemalloc.stop()
+                profiles = ([profile] if profile else []) + self._thread_profiles.pop(name, [])
+            self._write_report(name, elapsed, profiles, before, after, current, peak)
+
+    def profiled(self, name: str, function: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call function under cProfile in the current thread, adding it to stage `name`'s report"""
+        if not self.enabled:
+            return function(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per process; run this call unprofiled
+            return function(*args, **kwargs)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.disable()
+            self.collect(name, profile)
+
+    def collect(self, name: str, profile):
+        """Merge a finished profile (or a profile_call() result from a worker process) into stage `name`"""
+        if self.enabled:
+            with self._lock:
+                self._thread_profiles.setdefault(name, []).append(profile)
+
+    def _write_report(self, name: str, elapsed: float, profiles: List[cProfile.Profile],
+                      before: Optional[tracemalloc.Snapshot], after: Optional[tracemalloc.Snapshot],
+                      current: int, peak: int):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{self.run_id}-{name}")
+
+        cpu = io.StringIO()
+        if profiles:
+            stats = pstats.Stats(*profiles, stream=cpu)
+            stats.dump_stats(f"{base}.prof")
+            stats.strip_dirs().sort_stats('cumulative').print_stats(self.top_n)
+        else:
+            cpu.write("No CPU profile: the stage ran no profiled calls\n")
+
+        # Ignore the profiler's own bookkeeping when ranking allocation sites
+        allocations = []
+        if before is not None:
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, '<frozen importlib._bootstrap>')]
+            allocations = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+
+        with open(f"{base}.txt", 'w') as f:
+            f.write(f"Stage: {name}\n")
+            f.write(f"Run: {self.run_id}\n")
+            f.write(f"Wall time: {elapsed:.3f}s\n")
+            f.write(f"Traced memory: {current / 1e6:.1f} MB current, {peak / 1e6:.1f} MB peak\n\n")
+            f.write(f"=== Top {self.top_n} functions by cumulative time ===\n")
+            f.write(cpu.getvalue())
+            f.write(f"\n=== Top {self.top_n} allocation sites (growth during stage) ===\n")
+            if before is None:
+                f.write("Not attributed: the stage overlapped others\n")
+            for stat in allocations[:self.top_n]:
+                f.write(f"{stat}\n")
+
+        self.reports.append(f"{base}.txt")
+        print(f"✓ Profile for stage '{name}' written to {base}.txt")
@@ -0,0 +1,222 @@
+import os
+import json
+import math
+import zlib
+import random
+import numpy as np
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Any, Optional
+
+# Metrics tracked per team for percentile-relative classification
+BASELINE_METRICS = ('messages_sent', 'participation_rate', 'days_since_active')
+
+
+class KLLSketch:
+    """Mergeable streaming quantile sketch (Karnin, Lang and Liberty)
+
+    Keeps a stack of compactors; level h holds items of weight 2**h. When
+    the sketch is full, the lowest overfull level is sorted and every other
+    item is promoted, so memory stays O(k) while ranks stay within roughly
+    1/k of the truth. Two sketches merge by concatenating their levels.
+    """
+
+    def __init__(self, k: int = 200, c: float = 2 / 3, seed: Optional[int] = None):
+        self.k = k
+        self.c = c
+        self.count = 0
+        self.compactors: List[List[float]] = []
+        self._random = random.Random(seed)
+        self._sorted: Optional[tuple] = None
+        self._grow()
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self):
+        self.compactors.append([])
+        self.max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def _capacity(self, height: int) -> int:
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def _size(self) -> int:
+        return sum(len(items) for items in self.compactors)
+
+    def _compress(self):
+        for height in range(len(self.compactors)):
+            items = self.compactors[height]
+            if len(items) < self._capacity(height):
+                continue
+            if height + 1 >= len(self.compactors):
+                self._grow()
+            items.sort()
+            # An odd item out stays behind so total weight is preserved
+            keep = [items.pop()] if len(items) % 2 else []
+            self.compactors[height + 1].extend(items[self._random.random() < 0.5::2])
+            self.compactors[height] = keep
+            if self._size() < self.max_size:
+                break
+
+    def update(self, value: float):
+        self.compactors[0].append(float(value))
+        self.count += 1
+        self._sorted = None
+        if self._size() >= self.max_size:
+            self._compress()
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        """Fold another sketch into this one"""
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for height, items in enumerate(other.compactors):
+            self.compactors[height].extend(items)
+        self.count += other.count
+        self._sorted = None
+        while self._size() >= self.max_size:
+            self._compress()
+        return self
+
+    def _weighted(self) -> tuple:
+        """Retained items in order with their cumulative weights (cached until the next update)"""
+        if self._sorted is None:
+            pairs = sorted((value, 1 << height) for height, items in enumerate(self.compactors) for value in items)
+            values, cumulative, total = [], [], 0
+            for value, weight in pairs:
+                total += weight
+                values.append(value)
+                cumulative.append(total)
+            self._sorted = (values, cumulative, total)
+        return self._sorted
+
+    def percentile(self, value: float) -> float:
+        """Approximate share of observations below `value` (ties count half)"""
+        values, cumulative, total = self._weighted()
+        if not total:
+            return 0.5
+        lo, hi = bisect_left(values, value), bisect_right(values, value)
+        below = cumulative[lo - 1] if lo else 0
+        through = cumulative[hi - 1] if hi else 0
+        return (below + (through - below) / 2) / total
+
+    def percentiles(self, values) -> np.ndarray:
+        """percentile() of every value in an array, in one pass over the sketch"""
+        values = np.asarray(values, dtype=np.float64)
+        items, cumulative, total = self._weighted()
+        if not total:
+            return np.full(values.shape, 0.5)
+        items = np.asarray(items, dtype=np.float64)
+        cumulative = np.concatenate([[0], np.asarray(cumulative, dtype=np.float64)])
+        below = cumulative[np.searchsorted(items, values, side='left')]
+        through = cumulative[np.searchsorted(items, values, side='right')]
+        return (below + (through - below) / 2) / total
+
+    def quantile(self, q: float) -> float:
+        """Approximate value at rank q (0..1)"""
+        values, cumulative, total = self._weighted()
+        if not total:
+            return float('nan')
+        index = bisect_left(cumulative, q * total)
+        return values[min(index, len(values) - 1)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'k': self.k, 'c': self.c, 'count': self.count, 'compactors': self.compactors}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'KLLSketch':
+        sketch = cls(data['k'], data['c'])
+        while len(sketch.compactors) < len(data['compactors']):
+            sketch._grow()
+        sketch.compactors = [list(items) for items in data['compactors']]
+        sketch.count = data['count']
+        return sketch
+
+
+class TeamBaselines:
+    """KLL sketches per metric and per team, plus an organization-wide merge
+
+    Feed every user's metrics through update() as they are produced; the
+    organization sketch is rebuilt by merging the team sketches, so teams can
+    also be sketched in separate processes and combined with merge().
+    """
+
+    def __init__(self, metrics=BASELINE_METRICS, k: int = 200, min_count: int = 20):
+        self.metrics = tuple(metrics)
+        self.k = k
+        self.min_count = min_count
+        self.teams: Dict[str, Dict[str, KLLSketch]] = {}
+        self._org: Optional[Dict[str, KLLSketch]] = None
+
+    def _team(self, team: str) -> Dict[str, KLLSketch]:
+        sketches = self.teams.get(team)
+        if sketches is None:
+            sketches = self.teams[team] = {metric: KLLSketch(self.k, seed=zlib.crc32(f"{team}:{metric}".encode()))
+                                           for metric in self.metrics}
+        return sketches
+
+    def update(self, team: str, metrics: Dict[str, Any]):
+        sketches = self._team(team or '')
+        for metric in self.metrics:
+            value = metrics.get(metric)
+            if value is not None:
+                sketches[metric].update(value)
+        self._org = None
+
+    def merge(self, other: 'TeamBaselines') -> 'TeamBaselines':
+        for team, sketches in other.teams.items():
+            mine = self._team(team)
+            for metric, sketch in sketches.items():
+                if metric in mine:
+                    mine[metric].merge(sketch)
+        self._org = None
+        return self
+
+    def org(self) -> Dict[str, KLLSketch]:
+        if self._org is None:
+            self._org = {metric: KLLSketch(self.k, seed=0) for metric in self.metrics}
+            for sketches in self.teams.values():
+                for metric, sketch in sketches.items():
+                    self._org[metric].merge(sketch)
+        return self._org
+
+    def sketch(self, team: Optional[str], metric: str) -> Optional[KLLSketch]:
+        """The team's sketch, or the organization's when the team is too small to rank against"""
+        team_sketch = self.teams.get(team or '', {}).get(metric)
+        if team_sketch is not None and len(team_sketch) >= self.min_count:
+            return team_sketch
+        org_sketch = self.org().get(metric)
+        if org_sketch is not None and len(org_sketch) >= self.min_count:
+            return org_sketch
+        return None
+
+    def percentile(self, team: Optional[str], metric: str, value: float) -> Optional[float]:
+        """Where `value` ranks within the team (0..1), or None without enough data"""
+        sketch = self.sketch(team, metric)
+        return sketch.percentile(value) if sketch is not None else None
+
+    def percentiles(self, team: Optional[str], metric: str, values) -> Optional[np.ndarray]:
+        """percentile() for an array of values from one team, or None without enough data"""
+        sketch = self.sketch(team, metric)
+        return sketch.percentiles(values) if sketch is not None else None
+
+    def save(self, path: str):
+        """Write the sketches atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'metrics': self.metrics,
+                'k': self.k,
+                'min_count': self.min_count,
+                'teams': {team: {metric: sketch.to_dict() for metric, sketch in sketches.items()}
+                          for team, sketches in self.teams.items()},
+            }, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'TeamBaselines':
+        with open(path) as f:
+            data = json.load(f)
+        baselines = cls(data['metrics'], data['k'], data['min_count'])
+        baselines.teams = {team: {metric: KLLSketch.from_dict(sketch) for metric, sketch in sketches.items()}
+                           for team, sketches in data['teams'].items()}
+        return baselines
@@ -0,0 +1,157 @@
+import os
+import time
+import fcntl
+import struct
+import argparse
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from instrumentation import REGISTRY
+
+RATE_LIMIT_VERSION = 1
+
+# magic, version, request bucket level, token bucket level, last refill (wall clock seconds)
+STATE = struct.Struct('<4sIddd')
+STATE_MAGIC = b'PTBK'
+
+RATE_LIMIT_WAITS = REGISTRY.counter('llm_rate_limit_waits_total', 'LLM calls delayed to stay under the provider limits')
+RATE_LIMIT_SECONDS = REGISTRY.counter('llm_rate_limit_wait_seconds_total', 'Seconds LLM calls were delayed by the rate limiter')
+
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """Tokens a completion can use at most: ~4 characters per prompt token plus the completion cap"""
+    return len(prompt) // 4 + max_tokens
+
+
+class TokenBucketLimiter:
+    """Request- and token-per-minute pacing shared by every process on the host
+
+    Both buckets live in a small state file guarded by an flock (plus a
+    thread lock, since flock does not exclude threads sharing the file), so any
+    number of workers pacing the same API key draw from one budget. A
+    caller reserves its cost up front, letting the buckets go into debt,
+    and sleeps until the debt is repaid at the refill rate; calls are thus
+    spread evenly at `headroom` times the limits instead of bursting into
+    429s. Refill is computed from the wall clock, which all processes share.
+    """
+
+    def __init__(self, path: str, requests_per_minute: float, tokens_per_minute: float,
+                 headroom: float = 0.9, burst_seconds: float = 2.0):
+        self.path = path
+        self.request_rate = requests_per_minute * headroom / 60.0
+        self.token_rate = tokens_per_minute * headroom / 60.0
+        self.request_capacity = max(self.request_rate * burst_seconds, 1.0)
+        self.token_capacity = self.token_rate * burst_seconds
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._thread_lock = threading.Lock()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _read(self, now: float):
+        data = os.pread(self._fd, STATE.size, 0)
+        if len(data) == STATE.size:
+            magic, version, requests, tokens, updated_at = STATE.unpack(data)
+            if magic == STATE_MAGIC and version == RATE_LIMIT_VERSION:
+                elapsed = max(now - updated_at, 0.0)
+                return (min(self.request_capacity, requests + elapsed * self.request_rate),
+                        min(self.token_capacity, tokens + elapsed * self.token_rate))
+        # New or foreign file: start with full buckets
+        return self.request_capacity, self.token_capacity
+
+    def _write(self, requests: float, tokens: float, now: float):
+        os.pwrite(self._fd, STATE.pack(STATE_MAGIC, RATE_LIMIT_VERSION, requests, tokens, now), 0)
+
+    def reserve(self, tokens: float, requests: float = 1.0) -> float:
+        """Take the cost from both buckets and return the seconds to wait before calling"""
+        with self._locked():
+            now = time.time()
+            request_level, token_level = self._read(now)
+            request_level -= requests
+            token_level -= tokens
+            self._write(request_level, token_level, now)
+        return max(0.0, -request_level / self.request_rate, -token_level / self.token_rate)
+
+    def acquire(self, tokens: float, requests: float = 1.0) -> float:
+        """Reserve the cost and block until the call may go out; returns the seconds waited"""
+        wait = self.reserve(tokens, requests)
+        if wait > 0:
+            RATE_LIMIT_WAITS.inc()
+            RATE_LIMIT_SECONDS.inc(wait)
+            time.sleep(wait)
+        return wait
+
+    def refund(self, tokens: float, requests: float = 0.0):
+        """Return reserved tokens (and requests) that were not used
+
+        A negative `tokens` charges usage beyond the reservation instead;
+        the debt delays later callers rather than this one.
+        """
+        if tokens == 0 and requests == 0:
+            return
+        with self._locked():
+            now = time.time()
+            request_level, token_level = self._read(now)
+            self._write(min(self.request_capacity, request_level + requests),
+                        min(self.token_capacity, token_level + tokens), now)
+
+
+def rate_limiter_from_env() -> Optional[TokenBucketLimiter]:
+    """Limiter for the OpenAI key when OPENAI_RPM and OPENAI_TPM are set, otherwise None"""
+    rpm, tpm = os.getenv('OPENAI_RPM'), os.getenv('OPENAI_TPM')
+    if not rpm or not tpm:
+        return None
+    return TokenBucketLimiter(os.getenv('OPENAI_RATE_LIMIT_FILE', '/tmp/pepito-openai.bucket'), float(rpm), float(tpm),
+                              headroom=float(os.getenv('OPENAI_RATE_LIMIT_HEADROOM', '0.9')))
+
+
+def _simulate_calls(path: str, rpm: float, tpm: float, calls: int, tokens: int):
+    """Worker entry point for the pacing check below"""
+    limiter = TokenBucketLimiter(path, rpm, tpm)
+    for _ in range(calls):
+        limiter.acquire(tokens)
+    limiter.close()
+
+
+if __name__ == '__main__':
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(description="Check cross-process pacing with simulated completions")
+    parser.add_argument('--path', default='/tmp/pepito-ratelimit-check.bucket', help="Shared bucket file")
+    parser.add_argument('--processes', type=int, default=4, help="Worker processes sharing the limit")
+    parser.add_argument('--calls', type=int, default=20, help="Calls per process")
+    parser.add_argument('--rpm', type=float, default=600, help="Requests per minute limit")
+    parser.add_argument('--tpm', type=float, default=600_000, help="Tokens per minute limit")
+    parser.add_argument('--tokens', type=int, default=1000, help="Estimated tokens per call")
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        os.remove(args.path)
+
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=args.processes) as pool:
+        futures = [pool.submit(_simulate_calls, args.path, args.rpm, args.tpm, args.calls, args.tokens)
+                   for _ in range(args.processes)]
+        [future.result() for future in futures]
+    elapsed = time.time() - started
+
+    # The initial burst allowance goes out at once; everything after it is paced
+    calls = args.processes * args.calls
+    limit = min(args.rpm, args.tpm / args.tokens)
+    limiter = TokenBucketLimiter(args.path, args.rpm, args.tpm)
+    burst = min(limiter.request_capacity, limiter.token_capacity / args.tokens)
+    limiter.close()
+    print(f"✓ {calls} calls from {args.processes} processes in {elapsed:.1f}s: "
+          f"{(calls - burst) / elapsed * 60:.0f}/min after a burst of {burst:.0f}, against a limit of {limit:.0f}/min")
@@ -0,0 +1,410 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs, unquote
+from typing import Dict, Any, List, Optional, Tuple
+
+from message_store import SECONDS_PER_DAY
+from snapshot import WorkspaceSnapshot
+from warm_state import load_warm_state
+from dashboard_materializer import cached_dashboard
+from repository import SQLiteRepository
+from instrumentation import REGISTRY
+
+# Roster page size when none is given, and the largest page served
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Rows per user document: most recent first
+INSIGHTS_PER_USER = 10
+QUESTIONS_PER_USER = 20
+
+# Days of daily activity in a user document
+ACTIVITY_DAYS = 30
+
+USER_PARTS = ('metrics', 'insights', 'questions', 'activity')
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+READ_REQUESTS = REGISTRY.counter('read_api_requests_total', 'Read API requests by route and status')
+READ_CACHE = REGISTRY.counter('read_api_cache_total', 'Read API hot-user and roster page lookups by result')
+READ_RELOADS = REGISTRY.counter('read_api_reloads_total', 'Times the read API picked up changed local data')
+
+
+def etag_for(body: bytes) -> str:
+    """Strong ETag over a response body, in the same form as the dashboard cache's"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.replace('W/', '', 1) == etag:
+            return True
+    return False
+
+
+def _encode(payload: Any) -> Tuple[bytes, str]:
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return body, etag_for(body)
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry"""
+
+    def __init__(self, capacity: int, name: str):
+        self.capacity = capacity
+        self.name = name
+        self.entries: 'OrderedDict[Any, Any]' = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            READ_CACHE.inc(1, {'cache': self.name, 'result': 'miss'})
+            return None
+        self.entries.move_to_end(key)
+        READ_CACHE.inc(1, {'cache': self.name, 'result': 'hit'})
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class ReadAPI:
+    """Serves per-user metrics, insights and questions and the roster from local data
+
+    Sources are all optional: metrics come from a pipeline warm-state file,
+    daily activity from a workspace snapshot, the roster from the
+    materialized dashboard payload, and ai_insights / ai_questions rows from
+    the local SQLite repository. Responses are serialized once and kept in
+    an LRU of hot users (and one of roster pages) together with a strong
+    ETag, so a repeat read is a dictionary lookup and a matching
+    If-None-Match is answered with an empty 304. Sources are re-checked at
+    most every `refresh_seconds`; when one changed, it is reloaded and both
+    caches are dropped.
+    """
+
+    def __init__(self, repository: Optional[SQLiteRepository] = None, warm_state_path: Optional[str] = None,
+                 snapshot_path: Optional[str] = None, dashboard_path: Optional[str] = None,
+                 hot_users: int = 1024, refresh_seconds: float = 1.0):
+        self.repository = repository
+        self.warm_state_path = warm_state_path
+        self.snapshot_path = snapshot_path
+        self.dashboard_path = dashboard_path
+        self.refresh_seconds = refresh_seconds
+        self.users = LRUCache(hot_users, 'users')
+        self.pages = LRUCache(256, 'roster')
+
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+        self.insight_types: Dict[str, str] = {}
+        self.snapshot: Optional[WorkspaceSnapshot] = None
+        self.dashboard: Optional[Tuple[bytes, str]] = None
+        self.roster: List[Dict[str, Any]] = []
+        self.roster_index: Dict[str, Dict[str, Any]] = {}
+        self.generation = 0
+        self._versions: Dict[str, Any] = {}
+        self._checked_at = 0.0
+        self.refresh(force=True)
+
+    def close(self):
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    @staticmethod
+    def _file_version(path: Optional[str]):
+        if not path:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload the sources that changed since the last check; returns True if any did"""
+        self._checked_at = time.monotonic()
+        versions = {
+            'warm_state': self._file_version(self.warm_state_path),
+            'snapshot': self._file_version(self.snapshot_path),
+            # The payload and its ETag sidecar are replaced one after the other
+            'dashboard': (self._file_version(self.dashboard_path),
+                          self._file_version(f"{self.dashboard_path}.etag" if self.dashboard_path else None)),
+            'repository': self.repository.data_version() if self.repository is not None else None,
+        }
+        changed = {name for name, version in versions.items() if force or self._versions.get(name) != version}
+        if not changed:
+            return False
+        self._versions = versions
+
+        if 'warm_state' in changed:
+            state = load_warm_state(self.warm_state_path) if self.warm_state_path else None
+            self.metrics = state.metrics if state else {}
+            self.insight_types = state.insight_types if state else {}
+        if 'snapshot' in changed:
+            self.close()
+            if versions['snapshot'] is not None:
+                self.snapshot = WorkspaceSnapshot(self.snapshot_path)
+        if 'dashboard' in changed:
+            self.dashboard = cached_dashboard(self.dashboard_path) if self.dashboard_path else None
+            self.roster = json.loads(self.dashboard[0])['roster'] if self.dashboard else []
+            self.roster_index = {employee['id']: employee for employee in self.roster}
+        if not self.roster_index:
+            # Without a materialized dashboard the roster is every user with metrics
+            self.roster = [{'id': user_id, 'insightType': self.insight_types.get(user_id), 'metrics': self.metrics[user_id]}
+                           for user_id in sorted(self.metrics)]
+
+        self.users.clear()
+        self.pages.clear()
+        self.generation += 1
+        if not force:
+            READ_RELOADS.inc()
+        return True
+
+    def _rows(self, table: str, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        if self.repository is None:
+            return []
+        return self.repository.table(table).select('*').eq('user_id', user_id) \
+            .order('created_at', desc=True).limit(limit).execute().data
+
+    def _activity(self, user_id: str) -> Optional[Dict[str, List]]:
+        if self.snapshot is None:
+            return None
+        days = self.snapshot.arrays['rollup.user_day.day']
+        last_day = int(days.max()) if len(days) else 0
+        rollup = self.snapshot.user_days(user_id)
+        recent = rollup['day'] > last_day - ACTIVITY_DAYS
+        return {
+            'days': [int(day) * SECONDS_PER_DAY for day in rollup['day'][recent]],
+            'messages': rollup['messages'][recent].tolist(),
+            'reactions': rollup['reactions'][recent].tolist(),
+            'replies': rollup['replies'][recent].tolist(),
+        }
+
+    def user_document(self, user_id: str) -> Optional[Dict[str, Tuple[bytes, str]]]:
+        """Serialized parts of one user's document (None for unknown users), from the LRU when hot"""
+        parts = self.users.get(user_id)
+        if parts is not None:
+            return parts
+
+        insights = self._rows('ai_insights', user_id, INSIGHTS_PER_USER)
+        questions = self._rows('ai_questions', user_id, QUESTIONS_PER_USER)
+        if user_id not in self.metrics and user_id not in self.roster_index and not insights and not questions:
+            return None
+        document = {
+            'userId': user_id,
+            'employee': self.roster_index.get(user_id),
+            'insightType': self.insight_types.get(user_id),
+            'metrics': self.metrics.get(user_id),
+            'insights': insights,
+            'questions': questions,
+            'activity': self._activity(user_id),
+        }
+        parts = {part: _encode(document[part]) for part in USER_PARTS}
+        parts[''] = _encode(document)
+        self.users.put(user_id, parts)
+        return parts
+
+    def roster_page(self, query: Dict[str, List[str]]) -> Optional[Tuple[bytes, str]]:
+        """One page of the roster, optionally filtered by team, department or status; None for a bad query"""
+        try:
+            offset = int(query.get('offset', ['0'])[0])
+            limit = int(query.get('limit', [str(DEFAULT_PAGE_SIZE)])[0])
+        except ValueError:
+            return None
+        if offset < 0 or not 0 < limit <= MAX_PAGE_SIZE:
+            return None
+        filters = tuple((name, query[name][0]) for name in ('team', 'department', 'status') if name in query)
+
+        key = (offset, limit, filters)
+        page = self.pages.get(key)
+        if page is None:
+            entries = self.roster
+            if filters:
+                entries = [e for e in entries if all(e.get(name) == value for name, value in filters)]
+            items = entries[offset:offset + limit]
+            next_offset = offset + limit if offset + limit < len(entries) else None
+            page = _encode({'total': len(entries), 'offset': offset, 'limit': limit, 'next': next_offset, 'items': items})
+            self.pages.put(key, page)
+        return page
+
+    def handle(self, method: str, target: str, if_none_match: Optional[str] = None) -> Tuple[int, bytes, Optional[str]]:
+        """Status, body and ETag for one request"""
+        if time.monotonic() - self._checked_at >= self.refresh_seconds:
+            self.refresh()
+        if method not in ('GET', 'HEAD'):
+            return self._count('other', 405, b'{"error":"method not allowed"}')
+
+        url = urlsplit(target)
+        path = [unquote(segment) for segment in url.path.strip('/').split('/')]
+        if path == ['health']:
+            return self._count('health', 200, _encode({'status': 'ok', 'generation': self.generation,
+                                                        'users': len(self.roster), 'hot_users': len(self.users)})[0])
+        if path == ['dashboard']:
+            if self.dashboard is None:
+                return self._count('dashboard', 404, b'{"error":"dashboard not materialized"}')
+            return self._respond('dashboard', self.dashboard, if_none_match)
+        if path == ['roster']:
+            page = self.roster_page(parse_qs(url.query))
+            if page is None:
+                return self._count('roster', 400, f'{{"error":"offset must be >= 0 and limit 1-{MAX_PAGE_SIZE}"}}'.encode())
+            return self._respond('roster', page, if_none_match)
+        if path[0] == 'users' and len(path) in (2, 3) and (len(path) == 2 or path[2] in USER_PARTS):
+            parts = self.user_document(path[1])
+            if parts is None:
+                return self._count('users', 404, b'{"error":"unknown user"}')
+            return self._respond('users', parts[path[2] if len(path) == 3 else ''], if_none_match)
+        return self._count('other', 404, b'{"error":"not found"}')
+
+    def _respond(self, route: str, entry: Tuple[bytes, str], if_none_match: Optional[str]):
+        body, etag = entry
+        if etag_matches(if_none_match, etag):
+            return self._count(route, 304, b'', etag)
+        return self._count(route, 200, body, etag)
+
+    @staticmethod
+    def _count(route: str, status: int, body: bytes, etag: Optional[str] = None):
+        READ_REQUESTS.inc(1, {'route': route, 'status': status})
+        return status, body, etag
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """HTTP/1.1 with keep-alive; request bodies are read and ignored"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if headers.get('content-length'):
+                    await reader.readexactly(int(headers['content-length']))
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    status, body, etag, version = 400, b'{"error":"bad request line"}', None, 'HTTP/1.0'
+                else:
+                    status, body, etag = self.handle(method, target, headers.get('if-none-match'))
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                head = [f"HTTP/1.1 {status} {REASONS[status]}",
+                        "Content-Type: application/json",
+                        f"Content-Length: {len(body)}",
+                        "Cache-Control: no-cache"]
+                if etag:
+                    head.append(f"ETag: {etag}")
+                if not keep_alive:
+                    head.append("Connection: close")
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + (b'' if request_line.startswith(b'HEAD') else body))
+                await writer.drain()
+                if not keep_alive or status == 400:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8090):
+        server = await asyncio.start_server(self.serve_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+async def _benchmark(api: ReadAPI, seconds: float, connections: int) -> Tuple[int, int]:
+    """Keep-alive clients requesting hot users in a loop; returns (requests, 304s)"""
+    server = await asyncio.start_server(api.serve_connection, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    users = [employee['id'] for employee in api.roster] or ['unknown']
+    deadline = time.perf_counter() + seconds
+    counts = [0, 0]
+
+    async def client(worker: int):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        etags: Dict[str, str] = {}
+        i = worker
+        while time.perf_counter() < deadline:
+            user_id = users[i % len(users)]
+            i += 1
+            conditional = f"If-None-Match: {etags[user_id]}\r\n" if user_id in etags and i % 2 else ''
+            writer.write(f"GET /users/{user_id} HTTP/1.1\r\nHost: bench\r\n{conditional}\r\n".encode())
+            status_line = await reader.readline()
+            length, etag = 0, None
+            while True:
+                line = await reader.readline()
+                if line == b'\r\n':
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+                elif name.lower() == 'etag':
+                    etag = value.strip()
+            await reader.readexactly(length)
+            if etag:
+                etags[user_id] = etag
+            counts[0] += 1
+            counts[1] += status_line.split()[1] == b'304'
+        writer.close()
+
+    await asyncio.gather(*(client(worker) for worker in range(connections)))
+    server.close()
+    await server.wait_closed()
+    return counts[0], counts[1]
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from repository import repository_from_env
+
+    parser = argparse.ArgumentParser(description="Serve metrics, insights, questions and the roster from local data")
+    parser.add_argument('--warm-state', help="Warm-state file written by the pipeline (--warm-state)")
+    parser.add_argument('--snapshot', help="Workspace snapshot written by the pipeline (--snapshot)")
+    parser.add_argument('--dashboard', help="Payload written by the dashboard materializer (--out)")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=8090, help="Port to listen on")
+    parser.add_argument('--hot-users', type=int, default=1024, help="User documents kept serialized in memory")
+    parser.add_argument('--refresh-seconds', type=float, default=1.0, help="How often sources are checked for changes")
+    parser.add_argument('--benchmark', type=float, help="Instead of serving, measure throughput for this many seconds")
+    parser.add_argument('--connections', type=int, default=16, help="Benchmark client connections")
+    args = parser.parse_args()
+
+    load_dotenv('../.env')  # Load from parent directory
+
+    # ai_insights and ai_questions are read from the local store named by PEPITO_STORAGE
+    api = ReadAPI(repository_from_env(), args.warm_state, args.snapshot, args.dashboard,
+                  hot_users=args.hot_users, refresh_seconds=args.refresh_seconds)
+    print(f"✓ Loaded {len(api.roster)} roster entries, {len(api.metrics)} users with metrics"
+          f"{', snapshot' if api.snapshot else ''}{', insights store' if api.repository else ''}")
+
+    if args.benchmark:
+        requests, not_modified = asyncio.run(_benchmark(api, args.benchmark, args.connections))
+        print(f"✓ {requests / args.benchmark:.0f} requests/s over {args.connections} connections "
+              f"(client in the same process), {not_modified / max(requests, 1):.0%} answered 304")
+    else:
+        print(f"✓ Listening on http://{args.host}:{args.port}")
+        try:
+            asyncio.run(api.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    api.close()
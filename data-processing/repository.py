@@ -0,0 +1,325 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional, Union
+
+# Set PEPITO_STORAGE=sqlite:///path/to/pepito.db to run without the hosted service
+STORAGE_ENV = 'PEPITO_STORAGE'
+
+SCHEMA = """
+create table if not exists channels (
+    id text primary key,
+    name text not null,
+    is_channel integer default 1,
+    created_at text default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')) not null
+);
+
+create table if not exists users (
+    id text primary key,
+    name text,
+    real_name text,
+    email text,
+    created_at text default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')) not null
+);
+
+create table if not exists messages (
+    id text primary key,
+    channel_id text references channels(id),
+    user_id text references users(id),
+    text text not null,
+    ts text not null,
+    thread_ts text,
+    reactions text,
+    created_at text default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')) not null
+);
+create index if not exists messages_user_ts on messages (user_id, ts);
+create index if not exists messages_channel_ts on messages (channel_id, ts);
+create index if not exists messages_thread_ts on messages (thread_ts);
+
+create table if not exists analytics (
+    id text primary key default (lower(hex(randomblob(16)))),
+    user_id text references users(id),
+    metric_type text not null,
+    metric_value real not null,
+    period_start text not null,
+    period_end text not null,
+    created_at text default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')) not null
+);
+create unique index if not exists analytics_period on analytics (user_id, metric_type, period_start, period_end);
+
+create table if not exists ai_questions (
+    id text primary key default (lower(hex(randomblob(16)))),
+    user_id text,
+    question_type text,
+    question text,
+    context text,
+    priority integer,
+    metadata text,
+    created_at text default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')) not null
+);
+create index if not exists ai_questions_user on ai_questions (user_id, created_at);
+
+create table if not exists ai_insights (
+    id text primary key default (lower(hex(randomblob(16)))),
+    user_id text,
+    insight_type text,
+    title text,
+    description text,
+    confidence_score real,
+    suggested_actions text,
+    metadata text,
+    created_at text default (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')) not null
+);
+create index if not exists ai_insights_user on ai_insights (user_id, created_at);
+"""
+
+# Columns stored as JSON text locally (jsonb in Supabase)
+JSON_COLUMNS = {
+    'messages': {'reactions'},
+    'ai_questions': {'metadata'},
+    'ai_insights': {'suggested_actions', 'metadata'},
+}
+
+# Default conflict target for upserts
+PRIMARY_KEYS = {
+    'channels': 'id',
+    'users': 'id',
+    'messages': 'id',
+    'analytics': 'id',
+    'ai_questions': 'id',
+    'ai_insights': 'id',
+}
+
+
+class QueryResult:
+    """Mirrors the `.data` / `.count` shape of a Supabase response"""
+
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class TableQuery:
+    """The subset of the supabase-py query builder used by this project"""
+
+    def __init__(self, repository: 'SQLiteRepository', table: str):
+        self.repository = repository
+        self.table = table
+        self.operation = 'select'
+        self.rows: List[Dict[str, Any]] = []
+        self.values: Dict[str, Any] = {}
+        self.columns = '*'
+        self.on_conflict: Optional[str] = None
+        self.filters: List[tuple] = []
+        self.ordering: List[tuple] = []
+        self.limit_count: Optional[int] = None
+        self.offset_count = 0
+
+    # Operations
+    def insert(self, rows: Union[Dict[str, Any], List[Dict[str, Any]]]) -> 'TableQuery':
+        self.operation = 'insert'
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows: Union[Dict[str, Any], List[Dict[str, Any]]], on_conflict: Optional[str] = None) -> 'TableQuery':
+        self.operation = 'upsert'
+        self.rows = rows if isinstance(rows, list) else [rows]
+        self.on_conflict = on_conflict
+        return self
+
+    def select(self, columns: str = '*') -> 'TableQuery':
+        self.operation = 'select'
+        self.columns = columns
+        return self
+
+    def update(self, values: Dict[str, Any]) -> 'TableQuery':
+        self.operation = 'update'
+        self.values = values
+        return self
+
+    def delete(self) -> 'TableQuery':
+        self.operation = 'delete'
+        return self
+
+    # Filters
+    def eq(self, column: str, value: Any) -> 'TableQuery':
+        self.filters.append((column, '=', value))
+        return self
+
+    def neq(self, column: str, value: Any) -> 'TableQuery':
+        self.filters.append((column, '!=', value))
+        return self
+
+    def gt(self, column: str, value: Any) -> 'TableQuery':
+        self.filters.append((column, '>', value))
+        return self
+
+    def gte(self, column: str, value: Any) -> 'TableQuery':
+        self.filters.append((column, '>=', value))
+        return self
+
+    def lt(self, column: str, value: Any) -> 'TableQuery':
+        self.filters.append((column, '<', value))
+        return self
+
+    def lte(self, column: str, value: Any) -> 'TableQuery':
+        self.filters.append((column, '<=', value))
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> 'TableQuery':
+        self.filters.append((column, 'in', list(values)))
+        return self
+
+    # Shaping
+    def order(self, column: str, desc: bool = False) -> 'TableQuery':
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, count: int) -> 'TableQuery':
+        self.limit_count = count
+        return self
+
+    def range(self, start: int, end: int) -> 'TableQuery':
+        """Inclusive row range, like Supabase"""
+        self.offset_count = start
+        self.limit_count = end - start + 1
+        return self
+
+    def execute(self) -> QueryResult:
+        return self.repository._execute(self)
+
+
+class SQLiteRepository:
+    """Embedded SQLite backend exposing the same table API as the Supabase client
+
+    Code written against `client.table(...).insert(...).execute()` runs
+    unchanged on either backend, so offline runs, tests and benchmarks can
+    point at a local file while production keeps the hosted tables.
+    """
+
+    def __init__(self, path: str = 'pepito.db'):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        # WAL keeps readers unblocked while bulk writes commit
+        self._conn.execute('pragma journal_mode=wal')
+        self._conn.execute('pragma synchronous=normal')
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def data_version(self) -> int:
+        """Changes whenever another connection commits, so readers can tell when cached rows went stale"""
+        with self._lock:
+            return self._conn.execute('pragma data_version').fetchone()[0]
+
+    def table(self, name: str) -> TableQuery:
+        return TableQuery(self, name)
+
+    def _encode(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        json_columns = JSON_COLUMNS.get(table, ())
+        encoded = {}
+        for key, value in row.items():
+            if key in json_columns and value is not None and not isinstance(value, str):
+                value = json.dumps(value)
+            elif isinstance(value, (dict, list)):
+                value = json.dumps(value)
+            elif isinstance(value, bool):
+                value = int(value)
+            encoded[key] = value
+        return encoded
+
+    def _decode(self, table: str, row: sqlite3.Row) -> Dict[str, Any]:
+        decoded = dict(row)
+        for key in JSON_COLUMNS.get(table, ()):
+            value = decoded.get(key)
+            if isinstance(value, str):
+                try:
+                    decoded[key] = json.loads(value)
+                except ValueError:
+                    pass
+        return decoded
+
+    def _where(self, query: TableQuery):
+        clauses, params = [], []
+        for column, op, value in query.filters:
+            if op == 'in':
+                clauses.append(f'"{column}" in ({",".join("?" * len(value))})')
+                params.extend(value)
+            elif value is None and op in ('=', '!='):
+                clauses.append(f'"{column}" is {"not " if op == "!=" else ""}null')
+            else:
+                clauses.append(f'"{column}" {op} ?')
+                params.append(value)
+        return (' where ' + ' and '.join(clauses)) if clauses else '', params
+
+    def _write_rows(self, query: TableQuery) -> List[Dict[str, Any]]:
+        rows = [self._encode(query.table, row) for row in query.rows]
+        # Group rows by column set so omitted columns keep their defaults
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in rows:
+            groups.setdefault(tuple(row), []).append(row)
+
+        for columns, group in groups.items():
+            column_sql = ', '.join(f'"{c}"' for c in columns)
+            sql = f'insert into "{query.table}" ({column_sql}) values ({", ".join("?" * len(columns))})'
+            if query.operation == 'upsert':
+                target = query.on_conflict or PRIMARY_KEYS.get(query.table, 'id')
+                target_columns = [c.strip() for c in target.split(',')]
+                updates = [c for c in columns if c not in target_columns]
+                conflict_sql = ', '.join(f'"{c}"' for c in target_columns)
+                if updates:
+                    sql += f' on conflict ({conflict_sql}) do update set ' + ', '.join(f'"{c}" = excluded."{c}"' for c in updates)
+                else:
+                    sql += f' on conflict ({conflict_sql}) do nothing'
+            self._conn.executemany(sql, [tuple(row[c] for c in columns) for row in group])
+        return query.rows
+
+    def _execute(self, query: TableQuery) -> QueryResult:
+        with self._lock:
+            if query.operation in ('insert', 'upsert'):
+                if not query.rows:
+                    return QueryResult([])
+                # One transaction per batch keeps bulk writes cheap
+                self._conn.execute('begin')
+                try:
+                    data = self._write_rows(query)
+                    self._conn.execute('commit')
+                except Exception:
+                    self._conn.execute('rollback')
+                    raise
+                return QueryResult(data, len(data))
+
+            where, params = self._where(query)
+            if query.operation == 'update':
+                values = self._encode(query.table, query.values)
+                assignments = ', '.join(f'"{c}" = ?' for c in values)
+                cursor = self._conn.execute(f'update "{query.table}" set {assignments}{where}', list(values.values()) + params)
+                return QueryResult([], cursor.rowcount)
+            if query.operation == 'delete':
+                cursor = self._conn.execute(f'delete from "{query.table}"{where}', params)
+                return QueryResult([], cursor.rowcount)
+
+            columns = '*' if query.columns.strip() == '*' else ', '.join(f'"{c.strip()}"' for c in query.columns.split(','))
+            sql = f'select {columns} from "{query.table}"{where}'
+            if query.ordering:
+                sql += ' order by ' + ', '.join(f'"{c}" {"desc" if desc else "asc"}' for c, desc in query.ordering)
+            if query.limit_count is not None or query.offset_count:
+                sql += ' limit ? offset ?'
+                params += [query.limit_count if query.limit_count is not None else -1, query.offset_count]
+            data = [self._decode(query.table, row) for row in self._conn.execute(sql, params)]
+            return QueryResult(data, len(data))
+
+
+def repository_from_env() -> Optional[SQLiteRepository]:
+    """Local repository named by PEPITO_STORAGE, or None to use the hosted Supabase tables"""
+    url = os.getenv(STORAGE_ENV, '')
+    if not url.startswith('sqlite:'):
+        return None
+    path = url[len('sqlite:'):]
+    if path.startswith('//'):
+        path = path[2:]
+    return SQLiteRepository(path or 'pepito.db')
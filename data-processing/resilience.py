@@ -0,0 +1,229 @@
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Any, Hashable, Optional, Tuple
+
+from instrumentation import REGISTRY
+
+TRIPS = REGISTRY.counter('llm_circuit_trips_total', 'Times the LLM circuit breaker opened')
+REJECTED = REGISTRY.counter('llm_circuit_rejected_total', 'Calls served by the fallback while the circuit was open')
+TIMEOUTS = REGISTRY.counter('llm_timeouts_total', 'LLM calls that missed their deadline')
+HEDGES = REGISTRY.counter('llm_hedges_total', 'Duplicate requests started for slow LLM calls')
+HEDGE_WINS = REGISTRY.counter('llm_hedge_wins_total', 'Hedged requests that answered first')
+COALESCED = REGISTRY.counter('llm_coalesced_total', 'Calls that joined an identical in-flight generation')
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the circuit is open"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call does not finish before its deadline"""
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures; half-open probe after a cool-down"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go to the provider right now"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                # Let exactly one probe through to test the provider
+                self._probing = True
+                return True
+            self.rejected += 1
+            REJECTED.inc()
+            return False
+
+    def reject_if_open(self) -> bool:
+        """True (counted as a rejection) while the circuit is open and still cooling down
+
+        Unlike allow(), this never takes the half-open probe slot, so callers
+        can fail fast before queueing for other resources.
+        """
+        with self._lock:
+            if self.state != self.OPEN or time.monotonic() - self.opened_at >= self.reset_timeout:
+                return False
+            self.rejected += 1
+            REJECTED.inc()
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                    TRIPS.inc()
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+
+class ResilientCaller:
+    """Runs provider calls with a deadline, a circuit breaker and optional hedging
+
+    A hedged call starts a duplicate request if the first has not answered
+    after `hedge_after` seconds and returns whichever finishes first.
+    """
+
+    def __init__(self, timeout: float = 20.0, hedge_after: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None, max_workers: int = 16):
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-call')
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call fn(*args, **kwargs) under the configured protections"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM provider circuit is open")
+
+        started = time.monotonic()
+        deadline = started + self.timeout
+        futures = [self._executor.submit(fn, *args, **kwargs)]
+
+        try:
+            result, winner = self._wait(futures, deadline, fn, args, kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            # Best effort: drop any request still queued
+            for future in futures:
+                future.cancel()
+            self._record_latency(time.monotonic() - started)
+
+        self.breaker.record_success()
+        if winner > 0:
+            HEDGE_WINS.inc()
+            with self._lock:
+                self.hedge_wins += 1
+        return result
+
+    def _wait(self, futures, deadline, fn, args, kwargs):
+        pending = set(futures)
+        hedge_at = time.monotonic() + self.hedge_after if self.hedge_after is not None else None
+        last_error = None
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                TIMEOUTS.inc()
+                with self._lock:
+                    self.timeouts += 1
+                raise DeadlineExceeded(f"LLM call exceeded {self.timeout:.1f}s deadline")
+
+            wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+            done, pending = wait(pending, timeout=max(wake_at - now, 0), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if future.exception() is None:
+                    return future.result(), futures.index(future)
+                last_error = future.exception()
+
+            if hedge_at is not None and time.monotonic() >= hedge_at:
+                # Tail-latency case: race a duplicate request against the first
+                hedge_at = None
+                hedge = self._executor.submit(fn, *args, **kwargs)
+                futures.append(hedge)
+                pending.add(hedge)
+                HEDGES.inc()
+                with self._lock:
+                    self.hedges += 1
+
+        raise last_error
+
+    def _record_latency(self, seconds: float):
+        with self._lock:
+            self.calls += 1
+            self.latency_total += seconds
+            self.latency_max = max(self.latency_max, seconds)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Counters for trips, rejections, timeouts and hedges"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'circuit_state': self.breaker.state,
+                'circuit_trips': self.breaker.trips,
+                'circuit_rejected': self.breaker.rejected,
+                'latency_avg': self.latency_total / self.calls if self.calls else 0.0,
+                'latency_max': self.latency_max,
+            }
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for it and receive the same result (or exception).
+    Nothing is cached: once the call finishes, the next caller runs again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, Future] = {}
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """Run or join the call for `key`; returns (result, shared) where shared means it was joined"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            COALESCED.inc()
+            return flight.result(), True
+
+        try:
+            flight.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            flight.set_exception(e)
+        finally:
+            with self._lock:
+                del self._flights[key]
+        return flight.result(), False
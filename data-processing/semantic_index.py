@@ -0,0 +1,335 @@
+import os
+import re
+import json
+import zlib
+import time
+import argparse
+import numpy as np
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+from message_store import MessageStore, Dictionary, format_ts
+from slack_export import message_id
+
+INDEX_VERSION = 1
+INDEX_FILE = 'semantic.npz'
+INDEX_META_FILE = 'semantic.json'
+
+# Slack markup (mentions, links, channel refs, :emoji:) carries no topic
+MARKUP_RE = re.compile(r"<[^>]*>|:[a-z0-9_+'-]+:")
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9'_-]*[a-z0-9]")
+STOPWORDS = frozenset("""
+an and are as at be been but by can could did do does for from had has have he her him his how if in into
+is it its just me my no not of on or our out so that the their them then there these they this to too up
+us was we were what when where which who why will with would you your yeah yes ok okay thanks thank hi
+hey also i'm it's that's don't can't we're you're let's
+""".split())
+
+# Most frequent terms kept per topic for labelling
+TOPIC_TERMS_KEPT = 200
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word unigrams and bigrams, without markup and stopwords"""
+    words = [w for w in TOKEN_RE.findall(MARKUP_RE.sub(' ', text.lower())) if w not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class SemanticIndex:
+    """Local similarity search and topic clustering over message text
+
+    Messages are embedded with a signed hashing vectorizer (no vocabulary,
+    no external service) into L2-normalized sparse vectors. Random
+    hyperplane LSH over several tables narrows a query to a few candidate
+    buckets (its own plus those one bit away, i.e. multi-probe), which are
+    then ranked by exact cosine. Every message is also assigned to an
+    online topic cluster (leader clustering on running-sum centroids), so
+    topics per channel or user are a bincount away.
+    """
+
+    def __init__(self, dim: int = 1 << 14, tables: int = 8, bits: int = 10, seed: int = 7,
+                 cluster_threshold: float = 0.25, max_clusters: int = 256):
+        self.dim = dim
+        self.tables = tables
+        self.bits = bits
+        self.seed = seed
+        self.cluster_threshold = cluster_threshold
+        self.max_clusters = max_clusters
+        self.planes = np.random.default_rng(seed).standard_normal((dim, tables * bits)).astype(np.float32)
+
+        # CSR embeddings plus per-message metadata, one row per indexed message
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.data = np.zeros(0, dtype=np.float32)
+        self.signatures = np.zeros((0, tables), dtype=np.int64)
+        self.channel = np.zeros(0, dtype=np.int32)
+        self.user = np.zeros(0, dtype=np.int32)
+        self.ts = np.zeros(0, dtype=np.int64)
+        self.cluster = np.zeros(0, dtype=np.int32)
+        self.channels = Dictionary()
+        self.users = Dictionary()
+
+        # Topic centroids are preallocated; only the first n_clusters rows are live
+        self.n_clusters = 0
+        self.centroid_sums = np.zeros((max_clusters, dim), dtype=np.float32)
+        self.centroid_norms_sq = np.zeros(max_clusters, dtype=np.float64)
+        self.cluster_sizes = np.zeros(max_clusters, dtype=np.int64)
+        self.cluster_terms: List[Counter] = []
+        self._buckets: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    # Embedding
+    def embed(self, texts: Iterable[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[List[str]]]:
+        """Hashing-vectorizer CSR embeddings (indptr, indices, data) plus the tokens of each text"""
+        mask = self.dim - 1
+        indptr, indices, data, tokens = [0], [], [], []
+        for text in texts:
+            words = tokenize(text or '')
+            features = Counter()
+            for word in words:
+                h = zlib.crc32(word.encode('utf-8'))
+                features[h & mask] += 1.0 if h & 0x80000000 else -1.0
+            values = np.fromiter(features.values(), dtype=np.float32, count=len(features))
+            norm = float(np.sqrt(np.dot(values, values))) if len(values) else 0.0
+            if norm > 0:
+                indices.extend(features.keys())
+                data.extend((values / norm).tolist())
+            indptr.append(len(indices))
+            tokens.append(words)
+        return (np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int32),
+                np.asarray(data, dtype=np.float32), tokens)
+
+    @staticmethod
+    def _project(indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        """Sparse rows times a dense (dim x n) matrix; empty rows project to zero"""
+        result = np.zeros((len(indptr) - 1, matrix.shape[1]), dtype=np.float32)
+        rows = np.flatnonzero(np.diff(indptr))
+        if len(rows):
+            result[rows] = np.add.reduceat(data[:, None] * matrix[indices], indptr[:-1][rows], axis=0)
+        return result
+
+    def _signatures(self, projections: np.ndarray) -> np.ndarray:
+        """Bucket key per LSH table from the signs of the hyperplane projections"""
+        bits = (projections > 0).reshape(len(projections), self.tables, self.bits).astype(np.int64)
+        return bits @ (1 << np.arange(self.bits, dtype=np.int64))
+
+    # Indexing
+    def add(self, texts: List[str], channels: List[str], users: List[str], ts: List[int],
+            batch_size: int = 5000) -> int:
+        """Embed, bucket and cluster messages in batches; returns how many had indexable text"""
+        added = 0
+        for start in range(0, len(texts), batch_size):
+            indptr, indices, data, tokens = self.embed(texts[start:start + batch_size])
+            lengths = np.diff(indptr)
+            keep = np.flatnonzero(lengths)
+            if len(keep) == 0:
+                continue
+            # Empty rows hold no entries, so dropping them only shortens indptr
+            indptr = np.concatenate(([0], np.cumsum(lengths[keep])))
+            tokens = [tokens[i] for i in keep]
+
+            signatures = self._signatures(self._project(indptr, indices, data, self.planes))
+            clusters = self._assign(indptr, indices, data, tokens)
+
+            self.indptr = np.concatenate([self.indptr, self.indptr[-1] + indptr[1:]])
+            self.indices = np.concatenate([self.indices, indices])
+            self.data = np.concatenate([self.data, data])
+            self.signatures = np.concatenate([self.signatures, signatures])
+            self.cluster = np.concatenate([self.cluster, clusters])
+            rows = (start + keep).tolist()
+            self.channel = np.concatenate([self.channel, np.asarray([self.channels.code(channels[r]) for r in rows], dtype=np.int32)])
+            self.user = np.concatenate([self.user, np.asarray([self.users.code(users[r]) for r in rows], dtype=np.int32)])
+            self.ts = np.concatenate([self.ts, np.asarray([ts[r] for r in rows], dtype=np.int64)])
+            added += len(keep)
+        self._buckets = None
+        return added
+
+    def add_store(self, store: MessageStore, rows: Optional[np.ndarray] = None, batch_size: int = 5000) -> int:
+        """Index messages of a MessageStore (all rows, or the given ones)"""
+        rows = np.arange(len(store)) if rows is None else rows
+        return self.add([store.text(int(r)) for r in rows],
+                        [store.channels[int(c)] for c in store.columns['channel'][rows]],
+                        [store.users[int(u)] for u in store.columns['user'][rows]],
+                        store.columns['ts'][rows].tolist(), batch_size)
+
+    def _join(self, cluster: int, indices: np.ndarray, data: np.ndarray, tokens: List[str]):
+        """Fold one message into a topic centroid and its term counts"""
+        before = self.centroid_sums[cluster, indices].astype(np.float64)
+        after = before + data
+        self.centroid_norms_sq[cluster] += float(after @ after - before @ before)
+        self.centroid_sums[cluster, indices] = after
+        self.cluster_sizes[cluster] += 1
+        terms = self.cluster_terms[cluster]
+        terms.update(tokens)
+        if len(terms) > 2 * TOPIC_TERMS_KEPT:
+            self.cluster_terms[cluster] = Counter(dict(terms.most_common(TOPIC_TERMS_KEPT)))
+
+    def _assign(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, tokens: List[List[str]]) -> np.ndarray:
+        """Online leader clustering: join the closest topic above the threshold or start a new one"""
+        assigned = np.full(len(indptr) - 1, -1, dtype=np.int32)
+
+        # Vectorized first pass against the topics as they stood before this batch
+        if self.n_clusters:
+            norms = np.sqrt(np.maximum(self.centroid_norms_sq[:self.n_clusters], 1e-24))
+            centroids = np.ascontiguousarray((self.centroid_sums[:self.n_clusters] / norms[:, None]).T)
+            similarity = self._project(indptr, indices, data, centroids)
+            best = similarity.argmax(axis=1)
+            close = similarity[np.arange(len(best)), best] >= self.cluster_threshold
+            assigned[close] = best[close]
+
+        for row in range(len(assigned)):
+            lo, hi = indptr[row], indptr[row + 1]
+            cluster = int(assigned[row])
+            # Messages far from every topic go one at a time, since each may seed a new topic
+            if cluster < 0 and self.n_clusters:
+                norms = np.sqrt(np.maximum(self.centroid_norms_sq[:self.n_clusters], 1e-24))
+                similarity = (self.centroid_sums[:self.n_clusters, indices[lo:hi]] @ data[lo:hi]) / norms
+                best = int(similarity.argmax())
+                if similarity[best] >= self.cluster_threshold or self.n_clusters >= self.max_clusters:
+                    cluster = best
+            if cluster < 0:
+                cluster = self.n_clusters
+                self.n_clusters += 1
+                self.cluster_terms.append(Counter())
+            assigned[row] = cluster
+            self._join(cluster, indices[lo:hi], data[lo:hi], tokens[row])
+        return assigned
+
+    # Queries
+    def _bucket_tables(self) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Per LSH table, bucket keys sorted with the rows holding them (rebuilt after add)"""
+        if self._buckets is None:
+            self._buckets = []
+            for table in range(self.tables):
+                order = np.argsort(self.signatures[:, table], kind='stable')
+                self._buckets.append((self.signatures[order, table], order))
+        return self._buckets
+
+    def _filter(self, channel: Optional[str] = None, user: Optional[str] = None) -> np.ndarray:
+        mask = np.ones(len(self), dtype=bool)
+        if channel is not None:
+            mask &= self.channel == self.channels.get(channel)
+        if user is not None:
+            mask &= self.user == self.users.get(user)
+        return mask
+
+    def _result(self, row: int, score: float) -> Dict[str, Any]:
+        channel = self.channels[int(self.channel[row])]
+        ts = format_ts(int(self.ts[row]))
+        return {'id': message_id(channel, ts), 'channel': channel, 'user': self.users[int(self.user[row])],
+                'ts': ts, 'topic': int(self.cluster[row]), 'score': score}
+
+    def similar(self, text: str, k: int = 10, channel: Optional[str] = None, user: Optional[str] = None,
+                min_score: float = 0.2) -> List[Dict[str, Any]]:
+        """Messages most similar to `text`, optionally within one channel or from one user"""
+        indptr, indices, data, _ = self.embed([text])
+        if len(indices) == 0 or len(self) == 0:
+            return []
+        signature = self._signatures(self._project(indptr, indices, data, self.planes))[0]
+
+        # Probe each table's bucket and its neighbours one hyperplane away
+        probes = np.bitwise_xor.outer(signature, np.concatenate(([0], 1 << np.arange(self.bits))))
+        candidates = []
+        for table, (keys, rows) in enumerate(self._bucket_tables()):
+            los = np.searchsorted(keys, probes[table])
+            his = np.searchsorted(keys, probes[table], side='right')
+            candidates.extend(rows[lo:hi] for lo, hi in zip(los, his))
+        candidates = np.unique(np.concatenate(candidates))
+        candidates = candidates[self._filter(channel, user)[candidates]]
+        if len(candidates) == 0:
+            return []
+
+        # Exact cosine against the dense query
+        query = np.zeros(self.dim, dtype=np.float32)
+        query[indices] = data
+        starts, lengths = self.indptr[candidates], np.diff(self.indptr)[candidates]
+        offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        spans = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        scores = np.add.reduceat(self.data[spans] * query[self.indices[spans]], offsets)
+        order = np.argsort(-scores)[:k]
+        return [self._result(int(candidates[i]), float(scores[i])) for i in order if scores[i] >= min_score]
+
+    def topic_terms(self, cluster: int, n: int = 5) -> List[str]:
+        return [term for term, _ in self.cluster_terms[cluster].most_common(n)]
+
+    def topics(self, channel: Optional[str] = None, user: Optional[str] = None, top: int = 5) -> List[Dict[str, Any]]:
+        """Largest topics, optionally within one channel or for one user"""
+        clusters = self.cluster[self._filter(channel, user)]
+        if len(clusters) == 0:
+            return []
+        counts = np.bincount(clusters, minlength=self.n_clusters)
+        order = np.argsort(-counts)[:top]
+        return [{'topic': int(c), 'messages': int(counts[c]), 'share': float(counts[c] / len(clusters)),
+                 'terms': self.topic_terms(int(c))} for c in order if counts[c] > 0]
+
+    # Persistence
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.savez(os.path.join(directory, INDEX_FILE), indptr=self.indptr, indices=self.indices, data=self.data,
+                 signatures=self.signatures, channel=self.channel, user=self.user, ts=self.ts, cluster=self.cluster,
+                 centroid_sums=self.centroid_sums[:self.n_clusters], cluster_sizes=self.cluster_sizes[:self.n_clusters],
+                 centroid_norms_sq=self.centroid_norms_sq[:self.n_clusters])
+        with open(os.path.join(directory, INDEX_META_FILE), 'w') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'dim': self.dim, 'tables': self.tables, 'bits': self.bits, 'seed': self.seed,
+                'cluster_threshold': self.cluster_threshold, 'max_clusters': self.max_clusters,
+                'channels': self.channels.values, 'users': self.users.values,
+                'cluster_terms': [dict(terms.most_common(TOPIC_TERMS_KEPT)) for terms in self.cluster_terms],
+            }, f)
+
+    @classmethod
+    def load(cls, directory: str) -> 'SemanticIndex':
+        with open(os.path.join(directory, INDEX_META_FILE)) as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported semantic index version: {meta.get('version')}")
+        index = cls(meta['dim'], meta['tables'], meta['bits'], meta['seed'],
+                    meta['cluster_threshold'], meta['max_clusters'])
+        with np.load(os.path.join(directory, INDEX_FILE)) as data:
+            for name in ('indptr', 'indices', 'data', 'signatures', 'channel', 'user', 'ts', 'cluster'):
+                setattr(index, name, data[name])
+            index.n_clusters = len(data['cluster_sizes'])
+            index.centroid_sums[:index.n_clusters] = data['centroid_sums']
+            index.cluster_sizes[:index.n_clusters] = data['cluster_sizes']
+            index.centroid_norms_sq[:index.n_clusters] = data['centroid_norms_sq']
+        index.channels = Dictionary(meta['channels'])
+        index.users = Dictionary(meta['users'])
+        index.cluster_terms = [Counter(terms) for terms in meta['cluster_terms']]
+        return index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or query the local semantic message index")
+    parser.add_argument('index_dir', help="Directory holding (or receiving) the index")
+    parser.add_argument('--build-from', help="Message store directory to index")
+    parser.add_argument('--similar', help="Find messages similar to this text")
+    parser.add_argument('--topics', action='store_true', help="List the largest topics")
+    parser.add_argument('--channel', help="Restrict queries to one channel")
+    parser.add_argument('--user', help="Restrict queries to one user")
+    parser.add_argument('-k', type=int, default=10, help="Results to return")
+    args = parser.parse_args()
+
+    if args.build_from:
+        started = time.perf_counter()
+        index = SemanticIndex()
+        added = index.add_store(MessageStore.load(args.build_from))
+        index.save(args.index_dir)
+        print(f"✓ Indexed {added} messages into {index.n_clusters} topics in {time.perf_counter() - started:.1f}s")
+    else:
+        index = SemanticIndex.load(args.index_dir)
+
+    if args.similar:
+        started = time.perf_counter()
+        results = index.similar(args.similar, args.k, args.channel, args.user)
+        print(f"✓ {len(results)} similar messages in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for result in results:
+            print(f"  {result['score']:.2f}  {result['id']}  {result['user']}  topic {result['topic']}")
+    if args.topics:
+        started = time.perf_counter()
+        topics = index.topics(args.channel, args.user, args.k)
+        print(f"✓ {len(topics)} topics in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for topic in topics:
+            print(f"  #{topic['topic']}  {topic['share']:.0%}  {', '.join(topic['terms'])}")
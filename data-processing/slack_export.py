@@ -0,0 +1,248 @@
+import os
+import io
+import re
+import json
+import hashlib
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator, Tuple, Optional
+
+from instrumentation import REGISTRY
+
+# Channel day-files look like "<channel>/<YYYY-MM-DD>.json", optionally nested
+# under the export's top-level folder
+DAY_FILE_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2})\.json$')
+
+# Metadata files that live next to the channel folders
+METADATA_FILES = ('users.json', 'channels.json', 'groups.json', 'dms.json', 'mpims.json', 'integration_logs.json')
+
+DAY_FILES = REGISTRY.counter('ingest_day_files_total', 'Channel/day files parsed')
+INGEST_MESSAGES = REGISTRY.counter('ingest_messages_total', 'Export entries parsed')
+INGEST_BYTES = REGISTRY.counter('ingest_bytes_total', 'Uncompressed bytes of parsed day files')
+
+
+class ExportMember:
+    """A single channel/day file inside a Slack export"""
+
+    __slots__ = ('name', 'channel', 'day', 'size')
+
+    def __init__(self, name: str, channel: str, day: str, size: int):
+        self.name = name
+        self.channel = channel
+        self.day = day
+        self.size = size
+
+    def __repr__(self):
+        return f"ExportMember({self.channel}/{self.day}, {self.size} bytes)"
+
+
+def iter_json_array(fh, chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """Incrementally decode the items of a top-level JSON array from a text stream"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        # Skip whitespace and the separators between items
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+
+        if pos == len(buffer):
+            if eof:
+                if started:
+                    raise ValueError("Unterminated JSON array")
+                return
+            chunk = fh.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        if not started:
+            if buffer[pos] != '[':
+                raise ValueError("Expected a JSON array")
+            started = True
+            pos += 1
+            continue
+
+        if buffer[pos] == ']':
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            end = None
+
+        # An item touching the end of the buffer may continue in the next chunk
+        if end is None or (end == len(buffer) and not eof):
+            if eof:
+                raise ValueError("Malformed JSON array item")
+            chunk = fh.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        yield item
+        pos = end
+
+
+class SlackExportReader:
+    """Reads a Slack export from its .zip archive or an extracted directory"""
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self.is_zip = os.path.isfile(self.path) and zipfile.is_zipfile(self.path)
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._members: Optional[List[ExportMember]] = None
+        self._metadata_names: Dict[str, str] = {}
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _archive(self) -> zipfile.ZipFile:
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.path)
+        return self._zip
+
+    def _entries(self) -> Iterator[Tuple[str, int]]:
+        """List (relative name, uncompressed size) for every JSON file in the export"""
+        if self.is_zip:
+            # infolist() only reads the central directory; nothing is decompressed
+            for info in self._archive().infolist():
+                if not info.is_dir() and info.filename.endswith('.json'):
+                    yield info.filename, info.file_size
+        else:
+            for root, dirs, files in os.walk(self.path):
+                for file in files:
+                    if file.endswith('.json'):
+                        full_path = os.path.join(root, file)
+                        name = os.path.relpath(full_path, self.path).replace(os.sep, '/')
+                        yield name, os.path.getsize(full_path)
+
+    def members(self) -> List[ExportMember]:
+        """Enumerate the channel/day files in the export, ordered by channel and day"""
+        if self._members is None:
+            members = []
+            for name, size in self._entries():
+                parts = name.split('/')
+                match = DAY_FILE_PATTERN.match(parts[-1])
+                if match and len(parts) >= 2:
+                    members.append(ExportMember(name, parts[-2], match.group(1), size))
+                elif parts[-1] in METADATA_FILES:
+                    self._metadata_names[parts[-1]] = name
+            members.sort(key=lambda m: (m.channel, m.day))
+            self._members = members
+        return self._members
+
+    def channels(self) -> List[str]:
+        """Channel names that have at least one day-file"""
+        return sorted({m.channel for m in self.members()})
+
+    def open_member(self, name: str):
+        """Open a member as a binary stream, decompressing on the fly for archives"""
+        if self.is_zip:
+            return self._archive().open(name)
+        return open(os.path.join(self.path, name), 'rb')
+
+    def read_metadata(self, filename: str) -> List[Dict[str, Any]]:
+        """Load a top-level metadata file such as users.json or channels.json"""
+        self.members()
+        name = self._metadata_names.get(filename)
+        if name is None:
+            return []
+        with self.open_member(name) as fh:
+            return json.load(io.TextIOWrapper(fh, encoding='utf-8'))
+
+    def iter_messages(self, member: ExportMember) -> Iterator[Dict[str, Any]]:
+        """Stream the messages of one channel/day file straight into the JSON parser"""
+        return self._stream_member(member.name)
+
+    def _stream_member(self, name: str) -> Iterator[Dict[str, Any]]:
+        with self.open_member(name) as fh:
+            for item in iter_json_array(io.TextIOWrapper(fh, encoding='utf-8')):
+                if isinstance(item, dict):
+                    yield item
+
+    def iter_days(self, workers: int = 1, members: Optional[List[ExportMember]] = None) -> Iterator[Tuple[ExportMember, List[Dict[str, Any]]]]:
+        """Yield (member, messages) for each day-file, optionally parsing in worker processes"""
+        members = self.members() if members is None else members
+
+        if workers <= 1 or len(members) < 2:
+            for member in members:
+                messages = list(self.iter_messages(member))
+                record_day_file(member, messages)
+                yield member, messages
+            return
+
+        # Each worker opens its own handle on the export; hand out contiguous
+        # groups of members of roughly equal size to keep the workers busy
+        groups = balanced_groups(members, workers * 4)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for group, results in zip(groups, executor.map(parse_members, [self.path] * len(groups), [[m.name for m in g] for g in groups])):
+                for member, messages in zip(group, results):
+                    record_day_file(member, messages)
+                    yield member, messages
+
+
+def record_day_file(member: ExportMember, messages: List[Dict[str, Any]]):
+    """Count a parsed day-file in the ingest metrics"""
+    DAY_FILES.inc()
+    INGEST_MESSAGES.inc(len(messages))
+    INGEST_BYTES.inc(member.size)
+
+
+def balanced_groups(members: List[ExportMember], count: int) -> List[List[ExportMember]]:
+    """Split members into contiguous groups holding a similar number of bytes"""
+    total = sum(m.size for m in members) or 1
+    target = total / max(count, 1)
+    groups: List[List[ExportMember]] = [[]]
+    filled = 0
+    for member in members:
+        if groups[-1] and filled >= target:
+            groups.append([])
+            filled = 0
+        groups[-1].append(member)
+        filled += member.size
+    return groups
+
+
+def parse_members(path: str, names: List[str]) -> List[List[Dict[str, Any]]]:
+    """Worker entry point: parse a group of members from its own export handle"""
+    with SlackExportReader(path) as reader:
+        return [list(reader._stream_member(name)) for name in names]
+
+
+def resolve_channel_id(name: str, channel_ids: Dict[str, str]) -> str:
+    """ID of a channel folder: from channels.json, else derived from the folder name
+
+    The fallback depends only on the name, never on the order folders are
+    read in, so message IDs and dedup keys stay the same across runs.
+    """
+    return channel_ids.get(name) or f"C{hashlib.sha1(name.encode('utf-8')).hexdigest()[:10].upper()}"
+
+
+def message_id(channel_id: str, ts: str) -> str:
+    """Stable message ID: Slack timestamps are unique within a channel"""
+    return f"{channel_id}-{ts}"
+
+
+def message_record(msg: Dict[str, Any], channel_id: str) -> Dict[str, Any]:
+    """Row for the messages table built from an export message"""
+    return {
+        "id": message_id(channel_id, msg['ts']),
+        "channel_id": channel_id,
+        "user_id": msg['user'],
+        "text": msg.get('text', ''),
+        "ts": msg['ts'],
+        "thread_ts": msg.get('thread_ts'),
+        "reactions": json.dumps(msg.get('reactions', [])) if msg.get('reactions') else None
+    }
@@ -0,0 +1,245 @@
+import os
+import json
+import mmap
+import time
+import struct
+import argparse
+import numpy as np
+from typing import Dict, Any, Optional, Tuple
+
+from message_store import MessageStore, Dictionary, COLUMNS
+from thread_index import ThreadIndex
+from analytics_materializer import group_sums
+
+SNAPSHOT_VERSION = 2
+SNAPSHOT_MAGIC = b'PSNP'
+
+# magic, version, table-of-contents length; arrays follow the TOC, each
+# starting on an ALIGNMENT boundary so every view is aligned for its dtype
+HEADER = struct.Struct('<4sIQ')
+ALIGNMENT = 64
+
+THREAD_ARRAYS = ('channel', 'thread_ts', 'root', 'reply_offsets', 'reply_rows', 'participant_offsets', 'participants')
+
+
+def _csr(keys: np.ndarray, n: int) -> np.ndarray:
+    """Offsets [n + 1] for rows already sorted by key"""
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=offsets[1:])
+    return offsets
+
+
+def _day_rollup(store: MessageStore, column: str, n: int, folded: Optional[Tuple[np.ndarray, ...]] = None) -> Dict[str, np.ndarray]:
+    """Per-(key, day) totals grouped by key: offsets, day, messages, reactions, replies
+
+    `folded` adds the (key, day, messages, reactions, replies) rollup of
+    messages a compaction removed from the store.
+    """
+    parts = [(store.columns[column], store.day_index(), np.ones(len(store), dtype=np.int64),
+              store.columns['reaction_count'], store.columns['reply_count'])]
+    if folded is not None:
+        parts.append(folded)
+    keys, days, messages, reactions, replies = group_sums(*(np.concatenate(arrays) for arrays in zip(*parts)))
+    return {
+        'offsets': _csr(keys, n),
+        'day': days.astype(np.int32),
+        'messages': messages.astype(np.int32),
+        'reactions': reactions.astype(np.int32),
+        'replies': replies.astype(np.int32),
+    }
+
+
+def snapshot_arrays(store: MessageStore, threads: ThreadIndex, history: Optional['FoldedHistory'] = None) -> Dict[str, np.ndarray]:
+    """Every array a snapshot holds, keyed by section name
+
+    For a compacted store, the folded history is merged into the daily
+    rollups and stored alongside so readers see the whole history.
+    """
+    arrays = {f"messages.{name}": np.asarray(store.columns[name]) for name in COLUMNS}
+    arrays['messages.text_offsets'] = np.asarray(store.text_offsets)
+    arrays['messages.text'] = np.frombuffer(store.text_data, dtype=np.uint8)
+
+    for kind, dictionary in (('users', store.users), ('channels', store.channels), ('teams', store.teams)):
+        arrays[f"dictionary.{kind}"] = np.frombuffer(''.join(f"{value}\0" for value in dictionary.values).encode('utf-8'),
+                                                       dtype=np.uint8)
+
+    for name in THREAD_ARRAYS:
+        arrays[f"threads.{name}"] = np.asarray(getattr(threads, name))
+
+    # Rows of each user in time order, for per-user scans without a full pass
+    users = store.columns['user']
+    arrays['index.user_rows'] = np.argsort(users, kind='stable').astype(np.int64)
+    arrays['index.user_offsets'] = _csr(users, len(store.users))
+
+    for kind, column, n in (('user_day', 'user', len(store.users)), ('channel_day', 'channel', len(store.channels))):
+        folded = history.rollup(kind) if history is not None else None
+        for name, value in _day_rollup(store, column, n, folded).items():
+            arrays[f"rollup.{kind}.{name}"] = value
+    if history is not None:
+        for name, value in history.arrays.items():
+            arrays[f"history.{name}"] = value
+    return arrays
+
+
+def write_snapshot(path: str, store: MessageStore, threads: ThreadIndex, meta: Optional[Dict[str, Any]] = None,
+                   history: Optional['FoldedHistory'] = None) -> int:
+    """Write a snapshot atomically; returns its size in bytes
+
+    Readers that already have the previous file mapped keep their pages
+    until they reopen, because the new file replaces it under a new inode.
+    """
+    arrays = snapshot_arrays(store, threads, history)
+    sections = {}
+    offset = 0
+    for name, values in arrays.items():
+        sections[name] = [values.dtype.str, list(values.shape), offset]
+        offset += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+    toc = json.dumps({
+        'created_at': time.time(),
+        'messages': len(store),
+        'meta': meta or {},
+        'sections': sections,
+    }).encode('utf-8')
+    data_start = -(-(HEADER.size + len(toc)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(toc)))
+        f.write(toc)
+        for name, values in arrays.items():
+            f.seek(data_start + sections[name][2])
+            f.write(np.ascontiguousarray(values).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+    return data_start + offset
+
+
+class WorkspaceSnapshot:
+    """Read-only, memory-mapped view of a workspace snapshot
+
+    Opening parses the header and table of contents and wraps every section
+    in a zero-copy numpy view over one shared read-only mapping; only the
+    dictionaries are decoded. Pages are loaded on first touch and shared
+    through the page cache by every process reading the same file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, toc_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != SNAPSHOT_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"Not a workspace snapshot: {path}")
+        if version != SNAPSHOT_VERSION:
+            self._mmap.close()
+            raise ValueError(f"Unsupported snapshot version: {version}")
+
+        toc = json.loads(bytes(self._mmap[HEADER.size:HEADER.size + toc_length]))
+        data_start = -(-(HEADER.size + toc_length) // ALIGNMENT) * ALIGNMENT
+        self.created_at = toc['created_at']
+        self.meta = toc['meta']
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, (dtype, shape, offset) in toc['sections'].items():
+            count = int(np.prod(shape)) if shape else 1
+            self.arrays[name] = np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=count,
+                                              offset=data_start + offset).reshape(shape)
+
+        self.users, self.channels, self.teams = (self._dictionary(kind) for kind in ('users', 'channels', 'teams'))
+        self._store: Optional[MessageStore] = None
+        self._threads: Optional[ThreadIndex] = None
+        self._history = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.arrays['messages.ts'])
+
+    def _dictionary(self, kind: str) -> Dictionary:
+        data = self.arrays[f"dictionary.{kind}"]
+        # Every value is NUL-terminated, so an empty id (e.g. a message without a team) survives
+        return Dictionary(data.tobytes().decode('utf-8').split('\0')[:-1])
+
+    def age(self) -> float:
+        """Seconds since the snapshot was written"""
+        return time.time() - self.created_at
+
+    @property
+    def store(self) -> MessageStore:
+        if self._store is None:
+            columns = {name: self.arrays[f"messages.{name}"] for name in COLUMNS}
+            self._store = MessageStore(columns, self.arrays['messages.text_offsets'],
+                                       memoryview(self.arrays['messages.text']), self.users, self.channels, self.teams)
+        return self._store
+
+    @property
+    def threads(self) -> ThreadIndex:
+        if self._threads is None:
+            self._threads = ThreadIndex(*(self.arrays[f"threads.{name}"] for name in THREAD_ARRAYS))
+        return self._threads
+
+    @property
+    def history(self) -> Optional['FoldedHistory']:
+        """Aggregates of the messages compacted out of the store, or None if it was never compacted"""
+        if self._history is None and 'history.horizon' in self.arrays:
+            from compaction import FoldedHistory
+            prefix = 'history.'
+            self._history = FoldedHistory({name[len(prefix):]: values for name, values in self.arrays.items()
+                                           if name.startswith(prefix)})
+        return self._history
+
+    def user_rows(self, user_id: str) -> np.ndarray:
+        """Store rows of one user's messages in time order (empty for unknown users)"""
+        code = self.users.get(user_id)
+        if code < 0:
+            return self.arrays['index.user_rows'][:0]
+        offsets = self.arrays['index.user_offsets']
+        return self.arrays['index.user_rows'][offsets[code]:offsets[code + 1]]
+
+    def _rollup(self, kind: str, code: int) -> Dict[str, np.ndarray]:
+        prefix = f"rollup.{kind}."
+        offsets = self.arrays[prefix + 'offsets']
+        start, end = (offsets[code], offsets[code + 1]) if code >= 0 else (0, 0)
+        return {name: self.arrays[prefix + name][start:end] for name in ('day', 'messages', 'reactions', 'replies')}
+
+    def user_days(self, user_id: str) -> Dict[str, np.ndarray]:
+        """Daily rollup of one user: day numbers with messages, reactions and replies per day"""
+        return self._rollup('user_day', self.users.get(user_id))
+
+    def channel_days(self, channel_id: str) -> Dict[str, np.ndarray]:
+        """Daily rollup of one channel"""
+        return self._rollup('channel_day', self.channels.get(channel_id))
+
+    def close(self):
+        """Release the mapping; views still held by callers keep it alive until they are dropped"""
+        self._store = self._threads = self._history = None
+        self.arrays = {}
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write or inspect a memory-mapped workspace snapshot")
+    parser.add_argument('snapshot', help="Snapshot file")
+    parser.add_argument('--from-store', help="Build the snapshot from this message store directory")
+    args = parser.parse_args()
+
+    if args.from_store:
+        store = MessageStore.load(args.from_store)
+        size = write_snapshot(args.snapshot, store, ThreadIndex.load(args.from_store), {'source': args.from_store})
+        print(f"✓ Wrote {len(store)} messages to {args.snapshot} ({size / 1e6:.1f} MB)")
+
+    started = time.perf_counter()
+    with WorkspaceSnapshot(args.snapshot) as snapshot:
+        elapsed = time.perf_counter() - started
+        days = snapshot.arrays['rollup.user_day.day']
+        first, last = (int(days.min()), int(days.max())) if len(days) else (0, 0)
+        print(f"✓ Opened {len(snapshot)} messages, {len(snapshot.users)} users, {len(snapshot.channels)} channels, "
+              f"{len(snapshot.threads)} threads in {elapsed * 1000:.1f}ms")
+        print(f"  {len(days)} user-days from day {first} to {last}, written {snapshot.age() / 60:.0f} minutes ago")
@@ -0,0 +1,59 @@
+import os
+import sys
+import statistics
+import subprocess
+
+DATA_PROCESSING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Cumulative import time allowed per module (milliseconds) for the modules
+# the short-lived agent runtimes load on a cold start
+BUDGETS_MS = {
+    'ai_insights_api': 150,
+    'insight_scheduler': 50,
+    'warm_state': 50,
+    'instrumentation': 50,
+    'resilience': 80,
+}
+
+# Heavy dependencies that must only be imported on first use
+DEFERRED_MODULES = ('openai', 'supabase', 'numpy')
+
+
+def measure_import(module, runs=3):
+    """Median cumulative import time of a module in a fresh interpreter (ms)"""
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=DATA_PROCESSING_DIR, capture_output=True, text=True, check=True
+        )
+        for line in result.stderr.splitlines():
+            parts = [part.strip() for part in line.split('|')]
+            if len(parts) == 3 and parts[2] == module:
+                timings.append(int(parts[1]) / 1000)
+    return statistics.median(timings)
+
+
+def eager_heavy_imports(module):
+    """Heavy dependencies a module pulls in at import time"""
+    code = f"import sys, {module}; print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=DATA_PROCESSING_DIR,
+                            capture_output=True, text=True, check=True)
+    return [m for m in result.stdout.strip().split(',') if m]
+
+
+def main():
+    print("Checking cold-start import budgets...")
+    ok = True
+    for module, budget in BUDGETS_MS.items():
+        elapsed = measure_import(module)
+        eager = eager_heavy_imports(module)
+        within = elapsed <= budget and not eager
+        ok = ok and within
+        note = f" (eagerly imports {', '.join(eager)})" if eager else ''
+        print(f"{'✓' if within else '✗'} {module}: {elapsed:.1f} ms / {budget} ms budget{note}")
+    return ok
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
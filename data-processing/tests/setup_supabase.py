@@ -4,6 +4,12 @@ from datetime import datetime
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+# Conflict target of the analytics upserts (batch_writer.UPSERT_TABLES) and
+# the migration that adds its unique key to tables created without it
+ANALYTICS_KEY = 'user_id,metric_type,period_start,period_end'
+ANALYTICS_MIGRATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   'migrations', '001_analytics_period_unique.sql')
+
 def setup_supabase():
     """Set up Supabase tables and schema"""
     print("\nSetting up Supabase...")
@@ -49,6 +55,16 @@ def setup_supabase():
             response = supabase.table('analytics').insert(test_analytics).execute()
             print("✓ Analytics table working")
             
+            # The analytics materializer upserts on this key; tables created
+            # before it existed need the migration
+            try:
+                response = supabase.table('analytics').upsert(test_analytics, on_conflict=ANALYTICS_KEY).execute()
+                print("✓ Analytics unique key present")
+            except Exception as e:
+                print(f"\n✗ Analytics upsert failed: {str(e)}")
+                print(f"Add the unique key by running {ANALYTICS_MIGRATION} in the Supabase SQL editor")
+                return False
+            
             print("\n✓ All tables verified and working!")
             return True
             
@@ -96,9 +112,11 @@ create table if not exists public.analytics (
     metric_value float not null,
     period_start timestamp with time zone not null,
     period_end timestamp with time zone not null,
-    created_at timestamp with time zone default timezone('utc'::text, now()) not null
+    created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+    unique (user_id, metric_type, period_start, period_end)
 );
             """)
+            print(f"For an existing analytics table, add the unique key with {ANALYTICS_MIGRATION}")
             return False
         
     except Exception as e:
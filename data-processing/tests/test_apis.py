@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import time
 from datetime import datetime, timedelta
@@ -6,6 +7,9 @@ from dotenv import load_dotenv
 import requests
 from supabase import create_client, Client
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from slack_export import SlackExportReader
+
 class DummySlackData:
     """Fallback dummy data for Slack testing"""
     
@@ -89,7 +93,7 @@ def test_supabase_api():
         print(f"✗ Error connecting to Supabase: {str(e)}")
         return False
 
-def test_slack_api(use_dummy_data=True, export_path='/Users/franciscoterpolilli/Downloads/Specter Slack export May 29 2025 - Jun 28 2025'):
+def test_slack_api(use_dummy_data=True, export_path=os.getenv('SLACK_EXPORT_PATH', '/Users/franciscoterpolilli/Downloads/Specter Slack export May 29 2025 - Jun 28 2025')):
     """Test Slack API endpoints with fallback to dummy data or local export"""
     print("\nTesting Slack API...")
     
@@ -100,21 +104,19 @@ def test_slack_api(use_dummy_data=True, export_path='/Users/franciscoterpolilli/
             channels = []
             users = set()
             
-            # Walk through the export directory
-            for root, dirs, files in os.walk(export_path):
-                for file in files:
-                    if file.endswith('.json'):
-                        channel_name = os.path.basename(root)
-                        channel_id = f"C{len(channels)}"
-                        channels.append({"id": channel_id, "name": channel_name, "is_channel": True})
-                        
-                        with open(os.path.join(root, file), 'r') as f:
-                            channel_messages = json.load(f)
-                            for msg in channel_messages:
-                                if isinstance(msg, dict) and 'user' in msg:
-                                    msg['channel'] = channel_id  # Add channel reference
-                                    messages.append(msg)
-                                    users.add(msg['user'])
+            # Read the export archive (or extracted directory) member by member
+            with SlackExportReader(export_path) as reader:
+                channel_index = {}
+                for member in reader.members():
+                    if member.channel not in channel_index:
+                        channel_index[member.channel] = f"C{len(channels)}"
+                        channels.append({"id": channel_index[member.channel], "name": member.channel, "is_channel": True})
+                    
+                    for msg in reader.iter_messages(member):
+                        if 'user' in msg:
+                            msg['channel'] = channel_index[member.channel]  # Add channel reference
+                            messages.append(msg)
+                            users.add(msg['user'])
             
             print(f"✓ Using real Slack export data")
             print(f"✓ Retrieved {len(messages)} messages")
@@ -0,0 +1,187 @@
+import os
+import numpy as np
+from typing import Dict, Optional, Tuple, Union
+
+from message_store import MessageStore, NO_TS, MICROS, parse_ts
+
+THREAD_INDEX_FILE = 'threads.npz'
+
+
+def group_threads(channels: np.ndarray, thread_ts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Distinct (channel, thread_ts) keys, sorted, and the key index of every input row
+
+    Slack timestamps are only unique within a channel, so a thread is
+    identified by both.
+    """
+    order = np.lexsort((thread_ts, channels))
+    channels, thread_ts = channels[order], thread_ts[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (channels[1:] != channels[:-1]) | (thread_ts[1:] != thread_ts[:-1])
+    inverse = np.empty(len(order), dtype=np.int64)
+    inverse[order] = np.cumsum(first) - 1
+    return channels[first], thread_ts[first], inverse
+
+
+class ThreadIndex:
+    """Maps (channel, thread_ts) to the thread's root message, ordered replies and participants
+
+    Built once per import from a MessageStore. Everything is kept in flat
+    arrays: replies and participants use CSR-style offset arrays, so slicing
+    out a thread never copies and lookups by thread key are O(1).
+    """
+
+    def __init__(self, channel: np.ndarray, thread_ts: np.ndarray, root: np.ndarray, reply_offsets: np.ndarray,
+                 reply_rows: np.ndarray, participant_offsets: np.ndarray, participants: np.ndarray):
+        self.channel = channel                          # int32 [threads], channel codes, sorted
+        self.thread_ts = thread_ts                      # int64 [threads], sorted within each channel
+        self.root = root                                # int64 [threads], store row or -1 if the root is missing
+        self.reply_offsets = reply_offsets              # int64 [threads + 1]
+        self.reply_rows = reply_rows                    # int64 [replies], store rows in time order per thread
+        self.participant_offsets = participant_offsets  # int64 [threads + 1]
+        self.participants = participants                # int32 [...], user codes per thread
+        self._slots: Optional[Dict[Tuple[int, int], int]] = None
+
+    def __len__(self):
+        return len(self.thread_ts)
+
+    @classmethod
+    def build(cls, store: MessageStore) -> 'ThreadIndex':
+        """Reconstruct every thread from the store's channel/thread_ts/ts columns"""
+        ts = store.columns['ts']
+        thread_ts = store.columns['thread_ts']
+        users = store.columns['user']
+
+        threaded = np.flatnonzero(thread_ts != NO_TS)
+        channels, keys, inverse = group_threads(store.columns['channel'][threaded], thread_ts[threaded])
+        count = len(keys)
+
+        # Roots are the messages whose ts equals their thread_ts
+        is_root = ts[threaded] == thread_ts[threaded]
+        root = np.full(count, -1, dtype=np.int64)
+        root[inverse[is_root]] = threaded[is_root]
+
+        # Replies grouped by thread; rows are already in time order within a thread
+        reply_mask = ~is_root
+        reply_thread = inverse[reply_mask]
+        order = np.argsort(reply_thread, kind='stable')
+        reply_rows = threaded[reply_mask][order].astype(np.int64)
+        reply_offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(reply_thread, minlength=count), out=reply_offsets[1:])
+
+        # Participants are the distinct authors of the root and the replies
+        n_users = max(len(store.users), 1)
+        pairs = np.unique(inverse.astype(np.int64) * n_users + users[threaded])
+        participants = (pairs % n_users).astype(np.int32)
+        participant_offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pairs // n_users, minlength=count), out=participant_offsets[1:])
+
+        return cls(channels.astype(np.int32), keys.astype(np.int64), root, reply_offsets, reply_rows, participant_offsets, participants)
+
+    def save(self, directory: str):
+        """Persist the index next to the message store it was built from"""
+        os.makedirs(directory, exist_ok=True)
+        np.savez(os.path.join(directory, THREAD_INDEX_FILE), channel=self.channel, thread_ts=self.thread_ts, root=self.root,
+                 reply_offsets=self.reply_offsets, reply_rows=self.reply_rows,
+                 participant_offsets=self.participant_offsets, participants=self.participants)
+
+    @classmethod
+    def load(cls, directory: str) -> 'ThreadIndex':
+        with np.load(os.path.join(directory, THREAD_INDEX_FILE)) as data:
+            if 'channel' not in data.files:
+                raise ValueError(f"Thread index in {directory} predates per-channel thread keys; rebuild it")
+            return cls(data['channel'], data['thread_ts'], data['root'], data['reply_offsets'], data['reply_rows'],
+                       data['participant_offsets'], data['participants'])
+
+    def slot(self, channel: int, thread_ts: Union[str, int]) -> int:
+        """Position of a thread (by channel code and thread_ts) in the index, or -1 if unknown"""
+        if self._slots is None:
+            self._slots = dict(zip(zip(self.channel.tolist(), self.thread_ts.tolist()), range(len(self.thread_ts))))
+        key = parse_ts(thread_ts) if isinstance(thread_ts, str) else int(thread_ts)
+        return self._slots.get((int(channel), key), -1)
+
+    def root_row(self, channel: int, thread_ts: Union[str, int]) -> int:
+        slot = self.slot(channel, thread_ts)
+        return int(self.root[slot]) if slot >= 0 else -1
+
+    def replies(self, channel: int, thread_ts: Union[str, int]) -> np.ndarray:
+        """Store rows of the thread's replies, oldest first"""
+        slot = self.slot(channel, thread_ts)
+        if slot < 0:
+            return self.reply_rows[:0]
+        return self.reply_rows[self.reply_offsets[slot]:self.reply_offsets[slot + 1]]
+
+    def participant_codes(self, channel: int, thread_ts: Union[str, int]) -> np.ndarray:
+        """User codes of everyone who posted in the thread"""
+        slot = self.slot(channel, thread_ts)
+        if slot < 0:
+            return self.participants[:0]
+        return self.participants[self.participant_offsets[slot]:self.participant_offsets[slot + 1]]
+
+    def _reply_threads(self) -> np.ndarray:
+        """Thread slot of every entry in reply_rows"""
+        return np.repeat(np.arange(len(self.thread_ts)), np.diff(self.reply_offsets))
+
+    def answers(self, store: MessageStore) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """First answer of each user in each thread started by someone else
+
+        Returns (responder codes, root author codes, latency in seconds).
+        """
+        rows, roots = self.answer_rows(store)
+        users = store.columns['user']
+        latency = (store.columns['ts'][rows] - store.columns['ts'][roots]) / MICROS
+        return users[rows], users[roots], latency
+
+    def answer_rows(self, store: MessageStore) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows of the first answers (see answers()) and of the thread roots they answer"""
+        reply_threads = self._reply_threads()
+        roots = self.root[reply_threads]
+        has_root = roots >= 0
+        reply_threads, roots, rows = reply_threads[has_root], roots[has_root], self.reply_rows[has_root]
+
+        responders = store.columns['user'][rows]
+        others = responders != store.columns['user'][roots]
+        reply_threads, roots, rows, responders = reply_threads[others], roots[others], rows[others], responders[others]
+
+        # Replies are time-ordered inside each thread, so the first index of
+        # every (thread, responder) pair is that responder's first answer
+        n_users = max(len(store.users), 1)
+        _, first = np.unique(reply_threads.astype(np.int64) * n_users + responders, return_index=True)
+        return rows[first], roots[first]
+
+    def response_totals(self, store: MessageStore) -> Tuple[np.ndarray, np.ndarray]:
+        """Per user: summed first-answer latency in microseconds and the number of answers
+
+        Latencies are whole microseconds, so the float sums are exact and
+        totals from different parts of the history add up to the same value.
+        """
+        rows, roots = self.answer_rows(store)
+        n_users = len(store.users)
+        latency = store.columns['ts'][rows] - store.columns['ts'][roots]
+        totals = np.bincount(store.columns['user'][rows], weights=latency, minlength=n_users)
+        counts = np.bincount(store.columns['user'][rows], minlength=n_users)
+        return totals, counts
+
+    def response_times(self, store: MessageStore) -> np.ndarray:
+        """Mean seconds each user takes to first answer someone else's thread (NaN if never)"""
+        totals, counts = self.response_totals(store)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, totals / np.maximum(counts, 1) / MICROS, np.nan)
+
+    def who_answers_whom(self, store: MessageStore) -> Dict[Tuple[str, str], int]:
+        """Count of threads in which one user answered another, keyed by (responder, author)"""
+        responders, authors, _ = self.answers(store)
+        n_users = max(len(store.users), 1)
+        pairs, counts = np.unique(responders.astype(np.int64) * n_users + authors, return_counts=True)
+        return {(store.users[int(p // n_users)], store.users[int(p % n_users)]): int(c)
+                for p, c in zip(pairs, counts)}
+
+    def collaborators(self, store: MessageStore) -> np.ndarray:
+        """Number of distinct users each user has shared at least one thread with"""
+        n_users = len(store.users)
+        sizes = np.diff(self.participant_offsets)
+        partners = [set() for _ in range(n_users)]
+        for slot in np.flatnonzero(sizes > 1):
+            members = self.participants[self.participant_offsets[slot]:self.participant_offsets[slot + 1]].tolist()
+            for user in members:
+                partners[user].update(members)
+        return np.array([max(len(p) - 1, 0) for p in partners], dtype=np.int32)
@@ -0,0 +1,139 @@
+import math
+import time
+import argparse
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from message_store import MessageStore, MICROS, SECONDS_PER_DAY
+
+# Fitted activity must move by this share of the user's mean across the
+# window to count as increasing/decreasing
+TREND_THRESHOLD = 0.2
+
+# Messages in the window at which volume stops limiting confidence (~63%)
+CONFIDENCE_VOLUME = 10.0
+
+TREND_LABELS = np.array(['decreasing', 'stable', 'increasing'])
+
+_erf = np.vectorize(math.erf, otypes=[np.float64])
+
+
+def activity_matrix(store: MessageStore, days: int, as_of: Optional[int] = None) -> np.ndarray:
+    """Dense users x days matrix of message counts for the `days` days ending at `as_of`
+
+    Day columns follow compute_user_metrics: column 0 is the oldest day and
+    a message exactly at `as_of` falls in the last column.
+    """
+    n_users = len(store.users)
+    ts = store.columns['ts']
+    if len(ts) == 0:
+        return np.zeros((n_users, days), dtype=np.float64)
+    as_of = int(ts[-1]) if as_of is None else as_of
+    day_micros = SECONDS_PER_DAY * MICROS
+    window_start = as_of - days * day_micros
+
+    in_window = (ts > window_start) & (ts <= as_of)
+    cells = store.columns['user'][in_window].astype(np.int64) * days + (ts[in_window] - window_start - 1) // day_micros
+    return np.bincount(cells, minlength=n_users * days).reshape(n_users, days).astype(np.float64)
+
+
+def _window_sums(matrix: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per-window sums of y, t*y and y*y for every trailing window, via cumulative sums"""
+    t = np.arange(matrix.shape[1], dtype=np.float64)
+    zeros = np.zeros((matrix.shape[0], 1))
+    cy = np.concatenate([zeros, np.cumsum(matrix, axis=1)], axis=1)
+    cty = np.concatenate([zeros, np.cumsum(matrix * t, axis=1)], axis=1)
+    cyy = np.concatenate([zeros, np.cumsum(matrix * matrix, axis=1)], axis=1)
+    starts = np.arange(matrix.shape[1] - window + 1, dtype=np.float64)
+    sy = cy[:, window:] - cy[:, :-window]
+    # Re-base t to the window start so x runs 0..window-1
+    sxy = cty[:, window:] - cty[:, :-window] - starts * sy
+    syy = cyy[:, window:] - cyy[:, :-window]
+    return sy, sxy, syy
+
+
+def rolling_slopes(matrix: np.ndarray, window: int = 14) -> Tuple[np.ndarray, np.ndarray]:
+    """Least-squares slope (messages/day per day) and its t-statistic over every trailing window
+
+    Both outputs are users x (days - window + 1); column j covers days j..j+window-1.
+    """
+    window = min(window, matrix.shape[1])
+    sy, sxy, syy = _window_sums(matrix, window)
+    sx = window * (window - 1) / 2
+    sxx = (window - 1) * window * (2 * window - 1) / 6
+
+    sxx_c = sxx - sx * sx / window
+    sxy_c = sxy - sx * sy / window
+    syy_c = syy - sy * sy / window
+    slope = sxy_c / sxx_c if sxx_c else np.zeros_like(sy)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        residual = np.maximum(syy_c - slope * sxy_c, 0) / max(window - 2, 1)
+        stderr = np.sqrt(residual / sxx_c) if sxx_c else np.zeros_like(sy)
+        t_stat = np.where(stderr > 0, slope / stderr, np.where(slope == 0, 0.0, np.inf * np.sign(slope)))
+    return slope, t_stat
+
+
+def drop_ratios(matrix: np.ndarray) -> np.ndarray:
+    """Share of first-half activity lost in the second half of the matrix (0 when nothing to lose)"""
+    half = matrix.shape[1] // 2
+    earlier = matrix[:, :half].sum(axis=1)
+    recent = matrix[:, half:].sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(earlier > 0, np.clip(1 - recent / np.maximum(earlier, 1), 0, 1), 0.0)
+
+
+def estimate_trends(matrix: np.ndarray) -> Dict[str, np.ndarray]:
+    """Trend label, confidence, fitted relative change and drop ratio for every user at once
+
+    The trend is a least-squares line over the whole matrix. Confidence is
+    the two-sided normal confidence of the slope's t-statistic for a rising
+    or falling label (one minus it for 'stable'), scaled down for users with
+    few messages.
+    """
+    window = matrix.shape[1]
+    slope, t_stat = rolling_slopes(matrix, window)
+    slope, t_stat = slope[:, -1], t_stat[:, -1]
+    total = matrix.sum(axis=1)
+    mean = total / max(window, 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        change = np.where(mean > 0, slope * (window - 1) / mean, 0.0)
+    direction = np.where(change > TREND_THRESHOLD, 1, np.where(change < -TREND_THRESHOLD, -1, 0))
+
+    significance = _erf(np.abs(t_stat) / math.sqrt(2)) if len(t_stat) else t_stat
+    confidence = np.where(direction != 0, significance, 1 - significance)
+    confidence = confidence * (1 - np.exp(-total / CONFIDENCE_VOLUME))
+
+    return {
+        'engagement_trend': TREND_LABELS[direction + 1],
+        'trend_confidence': confidence,
+        'trend_change': change,
+        'participation_drop': drop_ratios(matrix),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the trend engine on a synthetic users x days matrix")
+    parser.add_argument('--users', type=int, default=50_000, help="Users (matrix rows)")
+    parser.add_argument('--days', type=int, default=365, help="Days (matrix columns)")
+    parser.add_argument('--window', type=int, default=14, help="Rolling slope window")
+    args = parser.parse_args()
+
+    # Poisson daily counts around a per-user base rate that ramps linearly up or down
+    rng = np.random.default_rng(0)
+    base = rng.gamma(2.0, 2.0, size=(args.users, 1))
+    end = rng.uniform(0.2, 1.8, size=(args.users, 1))
+    matrix = rng.poisson(base * (1 + (end - 1) * np.linspace(0, 1, args.days))).astype(np.float64)
+
+    started = time.perf_counter()
+    slopes, _ = rolling_slopes(matrix, args.window)
+    rolling_elapsed = time.perf_counter() - started
+    started = time.perf_counter()
+    trends = estimate_trends(matrix)
+    trend_elapsed = time.perf_counter() - started
+
+    labels, counts = np.unique(trends['engagement_trend'], return_counts=True)
+    print(f"✓ Rolling {args.window}-day slopes for {args.users} users x {args.days} days: {rolling_elapsed:.2f}s ({slopes.shape[1]} windows each)")
+    print(f"✓ Trend labels and confidence: {trend_elapsed:.2f}s")
+    print("  " + ", ".join(f"{label}: {count}" for label, count in zip(labels, counts)))
@@ -0,0 +1,55 @@
+import os
+import time
+import pickle
+from typing import Dict, Any, Optional
+
+WARM_STATE_VERSION = 1
+
+
+class WarmState:
+    """Precomputed per-user state a cold agent invocation can start from
+
+    Written at the end of a pipeline run and loaded with a single pickle
+    read, so short-lived runtimes do not have to rebuild metrics from the
+    export or query the remote tables before doing useful work.
+    """
+
+    def __init__(self, metrics: Dict[str, Dict[str, Any]], insight_types: Optional[Dict[str, str]] = None,
+                 extra: Optional[Dict[str, Any]] = None, created_at: Optional[float] = None):
+        self.metrics = metrics
+        self.insight_types = insight_types or {}
+        self.extra = extra or {}
+        self.created_at = time.time() if created_at is None else created_at
+
+    def age(self) -> float:
+        """Seconds since the state was written"""
+        return time.time() - self.created_at
+
+    def save(self, path: str):
+        """Write the state atomically so readers never see a partial file"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({
+                'version': WARM_STATE_VERSION,
+                'created_at': self.created_at,
+                'metrics': self.metrics,
+                'insight_types': self.insight_types,
+                'extra': self.extra,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+
+def load_warm_state(path: str, max_age: Optional[float] = None) -> Optional[WarmState]:
+    """Load a warm-state snapshot, or None if it is missing, stale or from another version"""
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+    if data.get('version') != WARM_STATE_VERSION:
+        return None
+    state = WarmState(data['metrics'], data['insight_types'], data['extra'], data['created_at'])
+    if max_age is not None and state.age() > max_age:
+        return None
+    return state